@@ -0,0 +1,55 @@
+"""
+Microbenchmark of the JSON renderers on pagination responses.
+
+    python -m benchmarks.bench_renderers
+"""
+import datetime
+import decimal
+import time
+
+from flask_restframework import renderers
+from flask_restframework.renderers import JSONRenderer, OrjsonRenderer, UjsonRenderer
+
+def make_page(per_page):
+    created = datetime.datetime(2021, 9, 1, 12, 30)
+    results = [
+        {
+            "id": i,
+            "name": "item %d" % i,
+            "description": "a fairly long description of the item, as text columns usually are " * 2,
+            "price": decimal.Decimal("%d.99" % i),
+            "quantity": i * 3,
+            "ratio": i / 7,
+            "active": i % 2 == 0,
+            "created_at": created + datetime.timedelta(minutes=i),
+            "tags": ["tag%d" % (i % 5), "tag%d" % (i % 11)],
+            "owner": {"id": i % 13, "username": "user%d" % (i % 13)},
+        }
+        for i in range(per_page)
+    ]
+    return {"count": 12345, "count_exact": True, "next": "/items?page=3", "previous": "/items?page=1", "results": results}
+
+def measure(renderer, data, rounds):
+    for i in range(10):
+        renderer.render(data)
+    start = time.perf_counter()
+    for i in range(rounds):
+        renderer.render(data)
+    return (time.perf_counter() - start) / rounds
+
+def main(rounds=200):
+    backends = [("json", JSONRenderer)]
+    if renderers.ujson is not None:
+        backends.append(("ujson", UjsonRenderer))
+    if renderers.orjson is not None:
+        backends.append(("orjson", OrjsonRenderer))
+    for per_page in (20, 100, 1000):
+        data = make_page(per_page)
+        baseline = None
+        for name, renderer_class in backends:
+            per_call = measure(renderer_class(), data, rounds)
+            baseline = baseline or per_call
+            print("%4d items  %-7s %9.1f us/render  x%.1f" % (per_page, name, per_call * 1e6, baseline / per_call))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,304 @@
+"""
+Load test of a multi-process WSGI server, and of the accuracy of the
+throttles under concurrency.
+
+It starts `--workers` server processes accepting on the same socket, all
+sharing a stand-in cache served by a separate process, like memcached or
+redis would be. Then, for each phase, `--clients` processes of `--threads`
+threads each send requests for `--duration` seconds: first to a view
+without throttle, then to a view per throttle class of
+`flask_restframework.throttling`, every request from the same client so
+they all count against the same key.
+
+    python -m benchmarks.load
+    python -m benchmarks.load --workers 8 --clients 4 --threads 16 --rate 100/m --duration 10
+    python -m benchmarks.load --rate 1000000/s --rps 5000 UserGCRAThrottle
+
+Each phase reports its throughput, a histogram of the latencies and, for
+the throttles, the requests admitted against the most the configured rate
+allows over the phase.
+"""
+import argparse
+import http.client
+import inspect
+import math
+import multiprocessing
+import os
+import socket
+import sys
+import threading
+import time
+import warnings
+from collections import Counter
+from multiprocessing.connection import Client, Listener
+
+from flask import Flask
+from werkzeug.serving import WSGIRequestHandler, make_server
+
+from flask_restframework import RestFramework
+from flask_restframework import throttling
+from flask_restframework.caches import LocalCache
+from flask_restframework.throttling import BaseThrottle, FixedWindowThrottle, GCRAThrottle
+from flask_restframework.views import APIView
+
+# upper bounds of the latency histogram, in milliseconds
+LATENCY_BUCKETS = (0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, math.inf)
+
+THROTTLE_CLASSES = [
+    cls for _, cls in inspect.getmembers(throttling, inspect.isclass)
+    if issubclass(cls, BaseThrottle) and getattr(cls, "scope", None)
+]
+
+def serve_cache(listener):
+    """
+    Runs the cache process, a stand-in for a cache server like memcached or
+    redis holding a `LocalCache`, serving each connection from a thread.
+    """
+    cache = LocalCache()
+    def handle(connection):
+        with connection:
+            while True:
+                try:
+                    operation, args = connection.recv()
+                except EOFError:
+                    return
+                connection.send(getattr(cache, operation)(*args))
+    while True:
+        connection = listener.accept()
+        threading.Thread(target=handle, args=(connection,), daemon=True).start()
+
+class CacheClient:
+    """
+    Client of the cache process, with a pool of connections shared by the
+    threads of a server worker.
+    """
+    def __init__(self, address, authkey):
+        self.address = address
+        self.authkey = authkey
+        self.pool = []
+        self.lock = threading.Lock()
+
+    def call(self, operation, *args):
+        with self.lock:
+            connection = self.pool.pop() if self.pool else None
+        if connection is None:
+            connection = Client(self.address, authkey=self.authkey)
+        connection.send((operation, args))
+        result = connection.recv()
+        with self.lock:
+            self.pool.append(connection)
+        return result
+
+    def get(self, key):
+        return self.call("get", key)
+
+    def set(self, key, value, timeout=None):
+        return self.call("set", key, value, timeout)
+
+    def add(self, key, value, timeout=None):
+        return self.call("add", key, value, timeout)
+
+    def incr(self, key, delta=1):
+        return self.call("incr", key, delta)
+
+    def cas(self, key, expected, value, timeout=None):
+        return self.call("cas", key, expected, value, timeout)
+
+    def delete(self, key):
+        return self.call("delete", key)
+
+class QuietRequestHandler(WSGIRequestHandler):
+    def log(self, type, message, *args):
+        pass
+
+def make_view(name, throttle_class, rate):
+    def get(self):
+        return {"ok": True}
+    throttle_handlers = [{"class": throttle_class, "rate": rate}] if throttle_class else []
+    return type(name, (APIView,), {"throttle_handlers": throttle_handlers, "get": get})
+
+def make_app(cache, rate, lease_size):
+    app = Flask(__name__)
+    app.config["FLASK_RESTFRAMEWORK_USER_CLASS"] = "flask_restframework.user.BaseUser"
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        RestFramework(app, cache)
+    app.add_url_rule("/none", view_func=make_view("NoThrottleView", None, rate).as_view("none"))
+    for throttle_class in THROTTLE_CLASSES:
+        if lease_size and issubclass(throttle_class, (GCRAThrottle, FixedWindowThrottle)):
+            throttle_class = type(throttle_class.__name__, (throttle_class,), {"lease_size": lease_size})
+        name = throttle_class.__name__
+        app.add_url_rule("/" + name, view_func=make_view(name + "View", throttle_class, rate).as_view(name))
+    return app
+
+def serve(fd, host, port, cache_address, authkey, rate, lease_size):
+    """
+    Runs a server worker process, accepting on the listening socket `fd`.
+    """
+    app = make_app(CacheClient(cache_address, authkey), rate, lease_size)
+    server = make_server(host, port, app, threaded=True, request_handler=QuietRequestHandler, fd=fd)
+    server.serve_forever()
+
+def client(host, port, path, threads, start, duration, interval):
+    """
+    Sends requests to `path` from `threads` threads, each
+    waiting `interval` seconds between the starts of its requests.
+    Returns the status counts and the latencies in seconds.
+    """
+    statuses = Counter()
+    latencies = []
+    lock = threading.Lock()
+
+    def run(offset):
+        connection = http.client.HTTPConnection(host, port)
+        local_statuses, local_latencies = Counter(), []
+        deadline = start + duration
+        due = start + offset
+        while True:
+            now = time.time()
+            if now >= deadline:
+                break
+            if due > now:
+                time.sleep(due - now)
+            due += interval
+            before = time.perf_counter()
+            try:
+                connection.request("GET", path)
+                response = connection.getresponse()
+                response.read()
+                local_statuses[response.status] += 1
+            except (OSError, http.client.HTTPException):
+                local_statuses["error"] += 1
+                connection.close()
+                connection = http.client.HTTPConnection(host, port)
+                continue
+            local_latencies.append(time.perf_counter() - before)
+        connection.close()
+        with lock:
+            statuses.update(local_statuses)
+            latencies.extend(local_latencies)
+
+    workers = [threading.Thread(target=run, args=(interval * i / threads,)) for i in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return statuses, latencies
+
+def parse_rate(rate):
+    num, period = rate.split("/")
+    return int(num), {"s": 1, "m": 60, "h": 3600, "d": 86400}[period[0]]
+
+def configured_admissions(throttle_class, rate, start, end):
+    """
+    Returns the most requests of a single client that `rate` allows between
+    `start` and `end` with the algorithm of `throttle_class`, from an empty cache.
+    """
+    num_requests, duration = parse_rate(rate)
+    if issubclass(throttle_class, GCRAThrottle):
+        # the burst, then one request every emission interval
+        return num_requests + int((end - start) * num_requests / duration)
+    if issubclass(throttle_class, FixedWindowThrottle):
+        windows = int(end // duration) - int(start // duration) + 1
+        return num_requests * windows
+    # the sliding log admits `num_requests` per `duration` long window
+    return num_requests * (int((end - start) // duration) + 1)
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+def report(name, statuses, latencies, elapsed, admitted=None):
+    total = sum(statuses.values())
+    print("== %s" % name)
+    print("   %d requests in %.2fs, %.1f req/s, statuses %s" % (
+        total, elapsed, total / elapsed, ", ".join("%s: %d" % item for item in sorted(statuses.items(), key=str))))
+    if admitted is not None:
+        observed, configured = admitted
+        print("   admitted %d, configured at most %d (%.2fx)" % (observed, configured, observed / configured))
+    if not latencies:
+        return
+    latencies = sorted(latency * 1000 for latency in latencies)
+    print("   latency ms: p50 %.2f  p90 %.2f  p99 %.2f  max %.2f" % (
+        percentile(latencies, 0.5), percentile(latencies, 0.9), percentile(latencies, 0.99), latencies[-1]))
+    counts, i = [], 0
+    for bound in LATENCY_BUCKETS:
+        count = 0
+        while i < len(latencies) and latencies[i] <= bound:
+            count += 1
+            i += 1
+        counts.append(count)
+    widest = max(counts)
+    for bound, count in zip(LATENCY_BUCKETS, counts):
+        if count:
+            label = "<= %g" % bound if bound != math.inf else "> %g" % LATENCY_BUCKETS[-2]
+            print("   %10s %8d %s" % (label, count, "#" * max(1, round(40 * count / widest))))
+
+def run_phase(pool, args, path, rps):
+    threads = args.clients * args.threads
+    interval = threads / rps if rps else 0
+    # every client starts at the same time, once all of them are set up
+    start = time.time() + 0.5
+    results = pool.starmap(client, [
+        (args.host, args.port, path, args.threads, start, args.duration, interval)
+        for _ in range(args.clients)
+    ])
+    end = time.time()
+    statuses, latencies = Counter(), []
+    for client_statuses, client_latencies in results:
+        statuses.update(client_statuses)
+        latencies.extend(client_latencies)
+    return statuses, latencies, start, min(end, start + args.duration)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("throttles", nargs="*", help="throttle classes to test (all by default)")
+    parser.add_argument("--workers", type=int, default=4, help="server processes")
+    parser.add_argument("--clients", type=int, default=2, help="client processes")
+    parser.add_argument("--threads", type=int, default=8, help="connections per client process")
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds per phase")
+    parser.add_argument("--rps", type=float, default=0, help="total requests per second to aim at, 0 for as fast as possible")
+    parser.add_argument("--rate", default="100/m", help="rate of the throttles")
+    parser.add_argument("--lease-size", type=int, default=0, help="lease_size of the GCRA and fixed window throttles")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=0, help="port to listen on, a free one by default")
+    args = parser.parse_args(argv)
+
+    throttle_classes = [cls for cls in THROTTLE_CLASSES if not args.throttles or cls.__name__ in args.throttles]
+    context = multiprocessing.get_context("fork")
+
+    authkey = os.urandom(16)
+    cache_listener = Listener(("127.0.0.1", 0), backlog=1024, authkey=authkey)
+    cache_process = context.Process(target=serve_cache, args=(cache_listener,), daemon=True)
+    cache_process.start()
+    listener = socket.create_server((args.host, args.port), backlog=1024)
+    args.port = listener.getsockname()[1]
+    workers = [
+        context.Process(target=serve, daemon=True, args=(
+            listener.fileno(), args.host, args.port, cache_listener.address, authkey, args.rate, args.lease_size))
+        for _ in range(args.workers)
+    ]
+    for worker in workers:
+        worker.start()
+    print("%d workers on %s:%d, %d clients x %d connections, %.1fs per phase, throttle rate %s%s" % (
+        args.workers, args.host, args.port, args.clients, args.threads, args.duration, args.rate,
+        ", lease size %d" % args.lease_size if args.lease_size else ""))
+
+    try:
+        with context.Pool(args.clients) as pool:
+            statuses, latencies, start, end = run_phase(pool, args, "/none", args.rps)
+            report("no throttle", statuses, latencies, end - start)
+            for throttle_class in throttle_classes:
+                name = throttle_class.__name__
+                statuses, latencies, start, end = run_phase(pool, args, "/" + name, args.rps)
+                admitted = (statuses[200], configured_admissions(throttle_class, args.rate, start, end))
+                report(name, statuses, latencies, end - start, admitted)
+    finally:
+        for worker in workers:
+            worker.terminate()
+        cache_process.terminate()
+        listener.close()
+        cache_listener.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,293 @@
+"""
+Benchmark suite of the per request hot paths: dispatch, authentication,
+throttles, rendering and pagination. It runs offline, against
+`caches.LocalCache` and WSGI environs built by werkzeug.
+
+    python -m benchmarks.suite                       # run and report
+    python -m benchmarks.suite --save baseline.json  # also save the results
+    python -m benchmarks.suite --compare baseline.json --threshold 0.2
+
+With --compare it exits with status 1 when a tracked metric of a benchmark
+regressed by more than --threshold (20% by default) against the baseline:
+fewer operations per second, or more bytes allocated per operation.
+"""
+import argparse
+import base64
+import contextlib
+import gc
+import json
+import platform
+import sys
+import time
+import tracemalloc
+import warnings
+
+from flask import Flask
+from werkzeug.test import EnvironBuilder
+
+from flask_restframework import RestFramework
+from flask_restframework.caches import LocalCache
+from flask_restframework.authentication import BasicAuthentication, JWTAuthentication
+from flask_restframework.permissions import IsAuthenticated
+from flask_restframework.throttling import (
+    UserRateThrottle, UserFixedWindowThrottle, UserGCRAThrottle,
+)
+from flask_restframework.views import APIView
+
+# metrics compared against the baseline, and whether higher is better
+TRACKED = {"ops_per_sec": True, "bytes_per_op": False}
+
+BENCHMARKS = {}
+
+def benchmark(name):
+    """
+    Registers a benchmark: a context manager setting up and yielding the
+    zero argument callable to measure.
+    """
+    def register(func):
+        BENCHMARKS[name] = contextlib.contextmanager(func)
+        return func
+    return register
+
+class FixedHistoryCache:
+    """
+    Cache always answering the same throttle history, so that every request
+    of the sliding log throttle works on a history of the same length.
+    """
+    def __init__(self, history):
+        self.history = history
+
+    def get(self, key):
+        return self.history
+
+    def set(self, key, value, timeout=None):
+        pass
+
+def make_app(cache=None, **config):
+    app = Flask(__name__)
+    app.config["FLASK_RESTFRAMEWORK_USER_CLASS"] = "flask_restframework.user.BaseUser"
+    app.config["JWT_SECRET"] = "a_secret_key_long_enough_for_hs256!"
+    app.config.update(config)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        RestFramework(app, cache)
+    return app
+
+class PingView(APIView):
+    authentication_classes = [BasicAuthentication, JWTAuthentication]
+    permission_classes = [IsAuthenticated]
+    throttle_handlers = [
+        {"class": UserFixedWindowThrottle, "rate": "1000000000/day"},
+        {"class": UserGCRAThrottle, "rate": "1000000000/day"},
+    ]
+
+    def get(self):
+        return {"msg": "pong"}
+
+BASIC = "basic " + base64.b64encode(b"waro163:passwd123").decode("utf-8")
+
+def wsgi_call(app, path, headers):
+    """
+    Returns a callable running a whole request through the WSGI app.
+    """
+    environ = EnvironBuilder(path=path, headers=headers).get_environ()
+    def start_response(status, headers, exc_info=None):
+        pass
+    def call():
+        for _ in app.wsgi_app(dict(environ), start_response):
+            pass
+    return call
+
+@benchmark("dispatch.wsgi")
+def dispatch_wsgi():
+    app = make_app(LocalCache())
+    app.add_url_rule("/ping", view_func=PingView.as_view("ping"))
+    yield wsgi_call(app, "/ping", {"Authorization": BASIC})
+
+@benchmark("dispatch.view")
+def dispatch_view():
+    app = make_app(LocalCache())
+    view = PingView.as_view("ping")
+    with app.test_request_context("/ping", headers={"Authorization": BASIC}):
+        yield view
+
+@benchmark("auth.jwt_decode")
+def auth_jwt_decode():
+    yield from jwt_authentication(None)
+
+@benchmark("auth.jwt_cached")
+def auth_jwt_cached():
+    yield from jwt_authentication("local")
+
+def jwt_authentication(token_cache):
+    import jwt
+    app = make_app(FLASK_RESTFRAMEWORK_JWT_CACHE=token_cache)
+    secret = app.config["JWT_SECRET"]
+    token = jwt.encode({"id": 1, "exp": int(time.time()) + 3600}, secret, algorithm="HS256")
+    auth = [b"bearer", token.encode("utf-8")]
+    authenticator = JWTAuthentication()
+    with app.test_request_context("/ping"):
+        yield lambda: authenticator.authenticate_credentials(auth)
+
+def throttle_benchmark(throttle_class, cache):
+    app = make_app(cache)
+    with app.test_request_context("/ping"):
+        from flask import g
+        from flask_restframework.user import BaseUser
+        g.current_user = BaseUser(1)
+        throttle = throttle_class("1000000000/day")
+        yield lambda: throttle.clone().allow_request()
+
+for size in (10, 100, 1000):
+    def sliding_log(size=size):
+        # timestamps in the future never leave the window
+        yield from throttle_benchmark(UserRateThrottle, FixedHistoryCache([time.time() + 3600] * size))
+    benchmark("throttle.sliding_log.%d" % size)(sliding_log)
+
+@benchmark("throttle.fixed_window")
+def throttle_fixed_window():
+    yield from throttle_benchmark(UserFixedWindowThrottle, LocalCache())
+
+@benchmark("throttle.gcra")
+def throttle_gcra():
+    yield from throttle_benchmark(UserGCRAThrottle, LocalCache())
+
+@benchmark("render.page_100")
+def render_page():
+    from flask_restframework.renderers import get_renderer
+    from benchmarks.bench_renderers import make_page
+    app = make_app()
+    data = make_page(100)
+    with app.app_context():
+        renderer = get_renderer()
+        yield lambda: renderer.render(data)
+
+@benchmark("pagination.to_json")
+def pagination_to_json():
+    try:
+        from flask_sqlalchemy import SQLAlchemy
+    except ImportError:
+        # reported as skipped
+        yield None
+        return
+    from flask_restframework.paginations import BasePagination
+    app = make_app(LocalCache(), SQLALCHEMY_DATABASE_URI="sqlite://")
+    db = SQLAlchemy(app)
+
+    class Item(db.Model):
+        id = db.Column(db.Integer, primary_key=True)
+        name = db.Column(db.String(40))
+
+        def to_json(self):
+            return {"id": self.id, "name": self.name}
+
+    class Pagination(BasePagination):
+        page_size = 50
+        count_strategy = "cached"
+
+    with app.app_context():
+        db.create_all()
+        db.session.add_all([Item(id=i, name="item %d" % i) for i in range(1, 1001)])
+        db.session.commit()
+        with app.test_request_context("/items?page=3"):
+            yield lambda: Pagination(Item.query).to_json()
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+def measure(func, min_time, warmup=50):
+    """
+    Returns the ops/sec, latency percentiles (in microseconds) and peak
+    bytes allocated per call of `func`.
+    """
+    for _ in range(warmup):
+        func()
+    clock = time.perf_counter_ns
+    latencies = []
+    gc.collect()
+    gc.disable()
+    try:
+        deadline = clock() + int(min_time * 1e9)
+        start = clock()
+        while clock() < deadline or len(latencies) < 100:
+            before = clock()
+            func()
+            latencies.append(clock() - before)
+        elapsed = clock() - start
+    finally:
+        gc.enable()
+    latencies.sort()
+
+    tracemalloc.start()
+    func()
+    tracemalloc.reset_peak()
+    current, _ = tracemalloc.get_traced_memory()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "ops_per_sec": round(len(latencies) / elapsed * 1e9, 1),
+        "p50_us": round(percentile(latencies, 0.50) / 1000, 2),
+        "p95_us": round(percentile(latencies, 0.95) / 1000, 2),
+        "p99_us": round(percentile(latencies, 0.99) / 1000, 2),
+        "bytes_per_op": peak - current,
+    }
+
+def run(names, min_time):
+    results = {}
+    for name in names:
+        with BENCHMARKS[name]() as func:
+            if func is None:
+                print("%-28s skipped" % name)
+                continue
+            result = results[name] = measure(func, min_time)
+        print("%-28s %12.1f ops/s  p50 %9.2f us  p95 %9.2f us  p99 %9.2f us  %8d bytes/op" % (
+            name, result["ops_per_sec"], result["p50_us"], result["p95_us"], result["p99_us"], result["bytes_per_op"]))
+    return results
+
+def compare(results, baseline, threshold):
+    """
+    Returns the regressions of `results` against `baseline` beyond `threshold`.
+    """
+    regressions = []
+    for name, result in results.items():
+        previous = baseline.get("results", {}).get(name)
+        if previous is None:
+            continue
+        for metric, higher_is_better in TRACKED.items():
+            old, new = previous[metric], result[metric]
+            if higher_is_better:
+                regressed = new < old / (1 + threshold)
+            else:
+                # a few bytes of noise are not a regression of small allocations
+                regressed = new > old * (1 + threshold) + 64
+            if regressed:
+                regressions.append("%s %s: %s -> %s" % (name, metric, old, new))
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("names", nargs="*", help="benchmarks to run, or prefixes of them (all by default)")
+    parser.add_argument("--min-time", type=float, default=1.0, help="seconds each benchmark runs for")
+    parser.add_argument("--save", help="file to save the results to, as a JSON baseline")
+    parser.add_argument("--compare", help="JSON baseline to compare the results with")
+    parser.add_argument("--threshold", type=float, default=0.2, help="regression tolerated, 0.2 for 20%%")
+    args = parser.parse_args(argv)
+
+    names = [name for name in BENCHMARKS if not args.names or any(name.startswith(prefix) for prefix in args.names)]
+    results = run(names, args.min_time)
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump({"python": platform.python_version(), "machine": platform.machine(), "results": results},
+                      f, indent=2, sort_keys=True)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for regression in regressions:
+            print("REGRESSION " + regression)
+        if regressions:
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,8 +2,17 @@
 import importlib
 import json
 import warnings
+from flask import Response
+from .caches import LRUCache
+from .metrics import InstrumentedCache, MetricsRegistry
+from .renderers import get_renderer_class
 
 EXTENSION_NAME = "flask-restframework"
+# optional cache operations, throttles use them for race-free accounting when available:
+#   add(key, value, timeout=None) -> bool, store only if key is missing
+#   incr(key, delta=1) -> int, increment an existing integer key and return the new value
+#   cas(key, expected, value, timeout=None) -> bool, store only if current value == expected
+CACHE_ATOMIC_OPERATIONS = ("add", "incr", "cas")
 
 class RestFramework(object):
     def __init__(self,app=None,cache=None) -> None:
@@ -15,12 +24,21 @@ class RestFramework(object):
 
         app.extensions = getattr(app, "extensions", {})
 
-        if cache:
+        if cache is not None:
             if not hasattr(cache, "set") or not callable(cache.set):
                 raise Exception("cache must has .set(key, value) method")
             if not hasattr(cache, "get") or not callable(cache.get):
                 raise Exception("cache must has .get(key) method")
+            for operation in CACHE_ATOMIC_OPERATIONS:
+                if hasattr(cache, operation) and not callable(getattr(cache, operation)):
+                    raise Exception(f"cache .{operation} must be a method")
             app.CACHE = cache
+            app.CACHE_OPERATIONS = frozenset(op for op in CACHE_ATOMIC_OPERATIONS if hasattr(cache, op))
+
+        app.config.setdefault('FLASK_RESTFRAMEWORK_METRICS_DIR', None)
+        app.METRICS = perform_metrics(app.config)
+        if app.METRICS is not None and cache is not None:
+            app.CACHE = InstrumentedCache(cache, app.METRICS.cache_duration)
 
         if 'FLASK_RESTFRAMEWORK_USER_CLASS' not in app.config:
             warnings.warn(
@@ -35,18 +53,182 @@ class RestFramework(object):
         user_class_path = app.config.get("FLASK_RESTFRAMEWORK_USER_CLASS")
         user_cls = import_string(user_class_path)
         app.USER_CLASS = user_cls
+        app.config.setdefault('FLASK_RESTFRAMEWORK_LAZY_USER', False)
+        app.config.setdefault('FLASK_RESTFRAMEWORK_USER_CACHE_SIZE', 0)
+        app.config.setdefault('FLASK_RESTFRAMEWORK_USER_CACHE_TTL', 60)
+        app.LAZY_USER = bool(app.config.get("FLASK_RESTFRAMEWORK_LAZY_USER"))
+        user_cache_size = app.config.get("FLASK_RESTFRAMEWORK_USER_CACHE_SIZE")
+        app.USER_CACHE = LRUCache(user_cache_size) if app.LAZY_USER and user_cache_size else None
 
         app.AUTHENTICATION_CLASSES = perform_import(app.config.get("FLASK_RESTFRAMEWORK_AUTHENTICATION_CLASSES"))
         app.PERMISSION_CLASSES = perform_import(app.config.get("FLASK_RESTFRAMEWORK_PERMISSION_CLASSES"))
         app.EXCEPTION_HANDLER = import_string(app.config.get("FLASK_RESTFRAMEWORK_EXCEPTION_HANDLER"))
+        app.config.setdefault('FLASK_RESTFRAMEWORK_RENDERER', 'json')
+        app.RENDERER = get_renderer_class(app.config.get("FLASK_RESTFRAMEWORK_RENDERER"))()
+        # offered besides FLASK_RESTFRAMEWORK_RENDERER to the clients asking for them with `Accept`
+        app.config.setdefault('FLASK_RESTFRAMEWORK_EXTRA_RENDERER_CLASSES', '["flask_restframework.renderers.MessagePackRenderer"]')
+        app.config.setdefault('FLASK_RESTFRAMEWORK_PARSER_CLASSES', '["flask_restframework.parsers.JSONParser", "flask_restframework.parsers.MessagePackParser"]')
+        app.RENDERERS = [app.RENDERER] + [
+            renderer() for renderer in perform_import(app.config.get("FLASK_RESTFRAMEWORK_EXTRA_RENDERER_CLASSES"))
+        ]
+        app.config.setdefault('FLASK_RESTFRAMEWORK_TIMING', False)
+        app.config.setdefault('FLASK_RESTFRAMEWORK_TIMING_HEADER', True)
+        app.config.setdefault('FLASK_RESTFRAMEWORK_TIMING_SINK', None)
+        app.TIMING = bool(app.config.get("FLASK_RESTFRAMEWORK_TIMING"))
+        app.TIMING_HEADER = app.TIMING and bool(app.config.get("FLASK_RESTFRAMEWORK_TIMING_HEADER"))
+        timing_sink = app.config.get("FLASK_RESTFRAMEWORK_TIMING_SINK")
+        app.TIMING_SINK = import_string(timing_sink) if isinstance(timing_sink, str) else timing_sink
+        app.config.setdefault('FLASK_RESTFRAMEWORK_ETAG', False)
+        app.config.setdefault('FLASK_RESTFRAMEWORK_MAX_BODY_SIZE', 2621440)
+        app.config.setdefault('FLASK_RESTFRAMEWORK_MAX_BODY_DEPTH', 64)
+        app.PARSERS = [parser() for parser in perform_import(app.config.get("FLASK_RESTFRAMEWORK_PARSER_CLASSES"))]
         _throttle_handlers = app.config.get("FLASK_RESTFRAMEWORK_THROTTLE_HANDLERS")
         if _throttle_handlers:
             app.THROTTLE_HANDLERS = perform_throttle_import(_throttle_handlers)
-            if not cache:
+            if cache is None:
                 warnings.warn("throttle handlers will not work due to not configure cache")
 
+        app.config.setdefault('FLASK_RESTFRAMEWORK_PAGINATION_COUNT', 'exact')
+        app.config.setdefault('FLASK_RESTFRAMEWORK_PAGINATION_COUNT_TIMEOUT', 60)
+        app.config.setdefault('FLASK_RESTFRAMEWORK_JWT_CACHE', None)
+        app.config.setdefault('FLASK_RESTFRAMEWORK_JWT_CACHE_SIZE', 4096)
+        app.config.setdefault('FLASK_RESTFRAMEWORK_JWT_CACHE_BYTES', 4*1024*1024)
+        app.config.setdefault('FLASK_RESTFRAMEWORK_JWT_CACHE_MAX_AGE', 300)
+        app.JWT_CACHE = perform_jwt_cache(app.config, getattr(app, "CACHE", None))
+        app.config.setdefault('FLASK_RESTFRAMEWORK_BASIC_AUTH_CACHE', False)
+        app.config.setdefault('FLASK_RESTFRAMEWORK_BASIC_AUTH_CACHE_SIZE', 1024)
+        app.config.setdefault('FLASK_RESTFRAMEWORK_BASIC_AUTH_CACHE_TTL', 60)
+        app.config.setdefault('FLASK_RESTFRAMEWORK_BASIC_AUTH_CACHE_NEGATIVE_TTL', 5)
+        app.BASIC_AUTH_CACHE = perform_credential_cache(app.config, getattr(app, "CACHE", None),
+                                                         getattr(app, "CACHE_OPERATIONS", frozenset()))
+        app.config.setdefault('FLASK_RESTFRAMEWORK_JWT_KEYS', None)
+        app.config.setdefault('FLASK_RESTFRAMEWORK_JWKS_FILE', None)
+        app.config.setdefault('FLASK_RESTFRAMEWORK_JWKS_RELOAD_INTERVAL', 60)
+        previous_keyring = getattr(app, "JWT_KEYRING", None)
+        if previous_keyring is not None:
+            previous_keyring.stop()
+        app.JWT_KEYRING = perform_keyring(app.config, app.JWT_CACHE)
+        app.config.setdefault('FLASK_RESTFRAMEWORK_JWT_REVOCATION', False)
+        app.config.setdefault('FLASK_RESTFRAMEWORK_JWT_REVOCATION_CHECK', None)
+        app.config.setdefault('FLASK_RESTFRAMEWORK_JWT_REVOCATION_FILE', None)
+        app.config.setdefault('FLASK_RESTFRAMEWORK_JWT_REVOCATION_CAPACITY', 1000000)
+        app.config.setdefault('FLASK_RESTFRAMEWORK_JWT_REVOCATION_ERROR_RATE', 0.01)
+        app.config.setdefault('FLASK_RESTFRAMEWORK_JWT_REVOCATION_REFRESH_INTERVAL', 60)
+        previous_revocation = getattr(app, "JWT_REVOCATION", None)
+        if previous_revocation is not None:
+            previous_revocation.stop()
+        app.JWT_REVOCATION = perform_revocation(app.config, getattr(app, "CACHE", None),
+                                                getattr(app, "CACHE_OPERATIONS", frozenset()))
+
+        # compiled security pipelines of the view classes, see views.ViewPlan
+        app.VIEW_PLANS = {}
+
         app.extensions[EXTENSION_NAME] = self
 
+    def register_metrics_endpoint(self, app, rule="/metrics", endpoint="flask_restframework_metrics"):
+        """
+        Serves the metrics of all the processes of the app at `rule`, in the
+        Prometheus text format.
+        """
+        if getattr(app, "METRICS", None) is None:
+            raise Exception("FLASK_RESTFRAMEWORK_METRICS_DIR must be set to serve metrics")
+        def metrics():
+            return Response(app.METRICS.exposition(), content_type="text/plain; version=0.0.4; charset=utf-8")
+        app.add_url_rule(rule, endpoint, metrics)
+
+def perform_metrics(config):
+    """
+    Returns the metrics registry writing to FLASK_RESTFRAMEWORK_METRICS_DIR, or `None` if it is not set.
+    """
+    directory = config.get("FLASK_RESTFRAMEWORK_METRICS_DIR")
+    if not directory:
+        return None
+    return MetricsRegistry(directory)
+
+def perform_jwt_cache(config, cache=None):
+    """
+    Returns the verified JWT cache configured by FLASK_RESTFRAMEWORK_JWT_CACHE:
+    `None` (disabled), "local" (per process) or "shared" (also through app.CACHE).
+    """
+    from .authentication import VerifiedTokenCache
+    mode = config.get("FLASK_RESTFRAMEWORK_JWT_CACHE")
+    if not mode:
+        return None
+    if mode not in ("local", "shared"):
+        raise Exception("FLASK_RESTFRAMEWORK_JWT_CACHE must be 'local' or 'shared'")
+    if mode == "shared" and cache is None:
+        warnings.warn("shared jwt cache falls back to local due to not configure cache")
+    return VerifiedTokenCache(
+        max_entries=config.get("FLASK_RESTFRAMEWORK_JWT_CACHE_SIZE"),
+        max_bytes=config.get("FLASK_RESTFRAMEWORK_JWT_CACHE_BYTES"),
+        max_age=config.get("FLASK_RESTFRAMEWORK_JWT_CACHE_MAX_AGE"),
+        cache=cache if mode == "shared" else None,
+    )
+
+def perform_credential_cache(config, cache=None, cache_operations=frozenset()):
+    """
+    Returns the BasicAuthentication credential cache if FLASK_RESTFRAMEWORK_BASIC_AUTH_CACHE
+    is set, its invalidations go through app.CACHE when there is one.
+    """
+    from .authentication import CredentialCache
+    if not config.get("FLASK_RESTFRAMEWORK_BASIC_AUTH_CACHE"):
+        return None
+    return CredentialCache(
+        max_entries=config.get("FLASK_RESTFRAMEWORK_BASIC_AUTH_CACHE_SIZE"),
+        ttl=config.get("FLASK_RESTFRAMEWORK_BASIC_AUTH_CACHE_TTL"),
+        negative_ttl=config.get("FLASK_RESTFRAMEWORK_BASIC_AUTH_CACHE_NEGATIVE_TTL"),
+        cache=cache,
+        cache_operations=cache_operations,
+    )
+
+def perform_keyring(config, jwt_cache=None):
+    """
+    Returns the JWT keyring configured by FLASK_RESTFRAMEWORK_JWT_KEYS and
+    FLASK_RESTFRAMEWORK_JWKS_FILE, or `None` if neither is set.
+    """
+    from .keyring import Keyring
+    keys = config.get("FLASK_RESTFRAMEWORK_JWT_KEYS")
+    jwks_file = config.get("FLASK_RESTFRAMEWORK_JWKS_FILE")
+    if not keys and not jwks_file:
+        return None
+    if isinstance(keys, str):
+        try:
+            keys = json.loads(keys)
+        except Exception:
+            raise Exception(keys+r" string Must be list format: [{'kid':'xxx','key':'xxx','algorithms':['xxx']},...]")
+    return Keyring(
+        keys=keys,
+        jwks_file=jwks_file,
+        reload_interval=config.get("FLASK_RESTFRAMEWORK_JWKS_RELOAD_INTERVAL"),
+        # payloads verified with a removed key must not be served from the cache
+        on_reload=jwt_cache.clear if jwt_cache is not None else None,
+    )
+
+def perform_revocation(config, cache=None, cache_operations=frozenset()):
+    """
+    Returns the JWT revocation list if FLASK_RESTFRAMEWORK_JWT_REVOCATION is set.
+    """
+    from .revocation import RevocationList
+    if not config.get("FLASK_RESTFRAMEWORK_JWT_REVOCATION"):
+        return None
+    check = config.get("FLASK_RESTFRAMEWORK_JWT_REVOCATION_CHECK")
+    if isinstance(check, str):
+        check = import_string(check)
+    if check is None:
+        warnings.warn(
+            'FLASK_RESTFRAMEWORK_JWT_REVOCATION_CHECK not set in app.config, '
+            'tokens matching the revocation filter by false positive will be rejected'
+        )
+    return RevocationList(
+        capacity=config.get("FLASK_RESTFRAMEWORK_JWT_REVOCATION_CAPACITY"),
+        error_rate=config.get("FLASK_RESTFRAMEWORK_JWT_REVOCATION_ERROR_RATE"),
+        check=check,
+        file=config.get("FLASK_RESTFRAMEWORK_JWT_REVOCATION_FILE"),
+        cache=cache,
+        cache_operations=cache_operations,
+        refresh_interval=config.get("FLASK_RESTFRAMEWORK_JWT_REVOCATION_REFRESH_INTERVAL"),
+    )
+
 def perform_import(string_name):
     if isinstance(string_name, str):
         try:
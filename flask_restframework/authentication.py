@@ -1,9 +1,16 @@
 import base64
 import binascii
+import hashlib
+import hmac
+import json
+import os
+import time
 import jwt
 
 from flask import request, current_app, g
 from . import exceptions
+from .caches import LRUCache
+from .user import LazyUser
 
 def get_authorization_header(request):
     """
@@ -16,10 +23,192 @@ def get_authorization_header(request):
         return auth.encode("utf-8")
     return auth
 
+class VerifiedTokenCache:
+    """
+    Cache of verified JWT payloads, keyed by a digest of the token, so a
+    token coming back does not go through signature verification again.
+
+    An entry never outlives the `exp` claim of its token nor `max_age`
+    seconds. Entries live in a bounded in-process LRU, and also in the
+    shared `cache` when one is given, so other processes can reuse them.
+    """
+    key_format = 'jwt_verified_%s'
+    timer = time.time
+
+    def __init__(self, max_entries=4096, max_bytes=4*1024*1024, max_age=300, cache=None) -> None:
+        self.local = LRUCache(max_entries, max_bytes)
+        self.max_age = max_age
+        self.cache = cache
+
+    def get(self, token:str):
+        """
+        Returns a copy of the verified payload of `token`, or `None`.
+        """
+        digest = hashlib.sha256(token.encode("utf-8")).hexdigest()
+        payload = self.local.get(digest)
+        if payload is None and self.cache is not None:
+            entry = self.cache.get(self.key_format % digest)
+            if entry is not None and entry[1] > self.timer():
+                payload, expires = entry
+                self.local.set(digest, payload, expires=expires, size=self.sizeof(payload))
+        return dict(payload) if payload is not None else None
+
+    def set(self, token:str, payload:dict):
+        now = self.timer()
+        expires = now + self.max_age
+        exp = payload.get("exp")
+        if isinstance(exp, (int, float)):
+            expires = min(expires, exp)
+        if expires <= now:
+            return
+        digest = hashlib.sha256(token.encode("utf-8")).hexdigest()
+        payload = dict(payload)
+        self.local.set(digest, payload, expires=expires, size=self.sizeof(payload))
+        if self.cache is not None:
+            self.cache.set(self.key_format % digest, (payload, expires), max(int(expires - now), 1))
+
+    def sizeof(self, payload):
+        # approximate memory held by an entry: digest plus encoded payload
+        return 64 + len(json.dumps(payload, default=str))
+
+    def clear(self):
+        self.local.clear()
+
+    def stats(self):
+        """
+        Returns the hit and miss counters of the in-process LRU and its occupancy.
+        """
+        return self.local.stats()
+
+class CredentialCache:
+    """
+    Cache of the `check_auth_inf` results of `BasicAuthentication`, keyed by
+    a digest of the authenticator class, user id and password salted with a
+    random per process secret, so the passwords are never kept in memory.
+
+    Successful checks are kept for `ttl` seconds, failed ones separately for
+    `negative_ttl` seconds. `invalidate(userid)` drops every entry of a user,
+    to be called when its password changes. With a shared `cache` the
+    invalidation reaches all processes at the cost of one cache read per
+    request, else other processes keep their entries until they expire.
+    Generations are timestamps, so one lost by the shared cache is replaced
+    by a new one rather than falling back to an earlier one.
+    """
+    generation_format = 'basic_auth_generation_%s'
+    timer = time.time
+
+    def __init__(self, max_entries=1024, ttl=60, negative_ttl=5, cache=None, cache_operations=frozenset()) -> None:
+        self.salt = os.urandom(32)
+        self.passed = LRUCache(max_entries)
+        self.failed = LRUCache(max_entries)
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.cache = cache
+        self.cache_operations = cache_operations
+        self.generations = {}
+
+    def generation(self, userid):
+        if self.cache is None:
+            return self.generations.get(userid, 0)
+        key = self.generation_format % userid
+        generation = self.cache.get(key)
+        if generation is None:
+            # never seen or lost by the cache: the entries of any earlier generation must stay unreachable
+            generation = time.time_ns()
+            if "add" not in self.cache_operations:
+                self.cache.set(key, generation)
+            elif not self.cache.add(key, generation):
+                generation = self.cache.get(key) or generation
+        return generation
+
+    def key(self, authenticator, userid, password):
+        message = "\0".join((type(authenticator).__qualname__, str(self.generation(userid)), userid, password))
+        return hmac.new(self.salt, message.encode("utf-8"), hashlib.sha256).digest()
+
+    def get(self, key):
+        """
+        Returns the cached (passed, msg) result for `key`, or `None`.
+        """
+        result = self.passed.get(key)
+        if result is None:
+            result = self.failed.get(key)
+        return result
+
+    def set(self, key, result):
+        passed, msg = result
+        if passed:
+            self.passed.set(key, result, expires=self.timer() + self.ttl)
+        else:
+            self.failed.set(key, result, expires=self.timer() + self.negative_ttl)
+
+    def invalidate(self, userid):
+        """
+        Makes every cached result of `userid` unreachable, they age out of the LRU.
+        """
+        # any new value will do, so concurrent invalidations need no atomic operation
+        generation = time.time_ns()
+        if self.cache is not None:
+            self.cache.set(self.generation_format % userid, generation)
+        else:
+            self.generations[userid] = generation
+
+    def clear(self):
+        self.passed.clear()
+        self.failed.clear()
+
+    def stats(self):
+        """
+        Returns the hit and miss counters and the number of cached results.
+        """
+        passed, failed = self.passed.stats(), self.failed.stats()
+        return {
+            "hits": passed["hits"] + failed["hits"],
+            # a lookup only reaches the negative cache after missing the positive one
+            "misses": failed["misses"],
+            "entries": passed["entries"],
+            "negative_entries": failed["entries"],
+        }
+
+def make_user(auth_inf):
+    """
+    Returns the user of an authenticated request, a `LazyUser` standing for
+    it when FLASK_RESTFRAMEWORK_LAZY_USER is set.
+    """
+    if not getattr(current_app, "LAZY_USER", False):
+        return current_app.USER_CLASS(**auth_inf)
+    return LazyUser(
+        current_app.USER_CLASS,
+        auth_inf,
+        cache=getattr(current_app, "USER_CACHE", None),
+        ttl=current_app.config.get("FLASK_RESTFRAMEWORK_USER_CACHE_TTL"),
+    )
+
+def index_authenticators(authenticators):
+    """
+    Splits authenticators into a dict of the ones which declare a `scheme`,
+    keyed by the lower cased scheme, and the list of the others, which have
+    to be tried on every request.
+    """
+    schemes, fallback = {}, []
+    for authenticator in authenticators:
+        # an overridden .authenticate() may not follow the declared scheme
+        if authenticator.scheme and type(authenticator).authenticate is BaseAuthentication.authenticate:
+            schemes.setdefault(authenticator.scheme.lower(), []).append(authenticator)
+        else:
+            fallback.append(authenticator)
+    return schemes, fallback
+
 class BaseAuthentication:
     """
     All authentication classes should extend BaseAuthentication.
+
+    Classes working on the `Authorization` header should declare its `scheme`
+    and implement `.authenticate_credentials()`, the view then parses the
+    header once and only calls the classes matching its scheme.
+    Others should override `.authenticate()` and are tried on every request.
     """
+    scheme = None
+
     def check_auth_inf(self, *args, **kwargs):
         """
         in authenticate() method we should call this method to check authorization information
@@ -31,7 +220,19 @@ class BaseAuthentication:
         """
         Authenticate the request and return a two-tuple of (user, token).
         """
-        raise NotImplementedError(".authenticate() must be overridden.")
+        if not self.scheme:
+            raise NotImplementedError(".authenticate() must be overridden.")
+        auth = get_authorization_header(request).split()
+        if not auth or auth[0].lower() != self.scheme:
+            return None
+        return self.authenticate_credentials(auth)
+
+    def authenticate_credentials(self, auth):
+        """
+        Authenticate the split `Authorization` header, whose scheme matches
+        `.scheme`, and return a two-tuple of (user, token).
+        """
+        raise NotImplementedError(".authenticate_credentials() must be overridden.")
 
     def authenticate_header(self):
         """
@@ -46,18 +247,14 @@ class BasicAuthentication(BaseAuthentication):
     HTTP Basic authentication against username/password.
     """
 
+    scheme = b'basic'
     www_authenticate_realm = 'api'
 
-    def authenticate(self):
+    def authenticate_credentials(self, auth):
         """
         Returns User and {username, password} if correct
-        using HTTP Basic authentication.  Otherwise returns `None`.
+        using HTTP Basic authentication.
         """
-        auth = get_authorization_header(request).split()
-
-        if not auth or auth[0].lower() != b'basic':
-            return None
-
         if len(auth) == 1:
             msg = 'Invalid basic header. No credentials provided.'
             raise exceptions.AuthenticationFailed(msg)
@@ -79,36 +276,51 @@ class BasicAuthentication(BaseAuthentication):
         userid, password = auth_parts[0], auth_parts[2]
         auth_inf = {"id":userid,"password":password}
 
-        passed, msg = self.check_auth_inf(**auth_inf)
+        credential_cache = getattr(current_app, "BASIC_AUTH_CACHE", None)
+        if credential_cache is None:
+            passed, msg = self.check_auth_inf(**auth_inf)
+        else:
+            key = credential_cache.key(self, userid, password)
+            result = credential_cache.get(key)
+            if result is None:
+                result = self.check_auth_inf(**auth_inf)
+                credential_cache.set(key, result)
+            passed, msg = result
         if not passed:
             raise exceptions.AuthenticationFailed(msg)
 
-        g.current_user = current_app.USER_CLASS(**auth_inf)
+        g.current_user = make_user(auth_inf)
         g.auth_inf = auth_inf
         return g.current_user, auth_inf
 
     def authenticate_header(self):
         return 'Basic realm="%s"' % self.www_authenticate_realm
 
+    @staticmethod
+    def invalidate_credentials(userid):
+        """
+        Drops the cached credential checks of `userid`, call it when its password changes.
+        """
+        credential_cache = getattr(current_app, "BASIC_AUTH_CACHE", None)
+        if credential_cache is not None:
+            credential_cache.invalidate(userid)
+
 class JWTAuthentication(BaseAuthentication):
     """
     HTTP Bearer authentication .
     """
+    scheme = b'bearer'
+
     def check_auth_inf(self, *args, **kwargs):
         if "id" not in kwargs:
             return False, "'id' field not found in jwt payload"
         return True, ""
 
-    def authenticate(self):
+    def authenticate_credentials(self, auth):
         """
         Returns User and payload of jwt if correct
-        using HTTP Bearer authentication.  Otherwise returns `None`.
+        using HTTP Bearer authentication.
         """
-        auth = get_authorization_header(request).split()
-
-        if not auth or auth[0].lower() != b'bearer':
-            return None
-
         if len(auth) == 1:
             msg = 'Invalid bearer header. No credentials provided.'
             raise exceptions.AuthenticationFailed(msg)
@@ -116,22 +328,54 @@ class JWTAuthentication(BaseAuthentication):
             msg = 'Invalid bearer header. Credentials string should not contain spaces.'
             raise exceptions.AuthenticationFailed(msg)
 
-        secret = current_app.config.get("JWT_SECRET")
-        if not secret:
-            msg = 'lost JWT_SECRET configuration'
-            raise exceptions.ConfigureError(msg)
-        try:
-            payload = jwt.decode(auth[1].decode("utf8"), secret, algorithms=["HS256", "RS256"])
-        except Exception as e:
-            raise exceptions.AuthenticationFailed(e.__str__())
+        token = auth[1].decode("utf8")
+        token_cache = getattr(current_app, "JWT_CACHE", None)
+        payload = token_cache.get(token) if token_cache is not None else None
+        if payload is None:
+            payload = self.decode(token)
+            if token_cache is not None:
+                token_cache.set(token, payload)
+
+        if self.is_revoked(payload):
+            raise exceptions.AuthenticationFailed("Token has been revoked.")
 
         passed, msg = self.check_auth_inf(**payload)
         if not passed:
             raise exceptions.AuthenticationFailed(msg)
 
-        g.current_user = current_app.USER_CLASS(**payload)
+        g.current_user = make_user(payload)
         g.auth_inf = payload
         return g.current_user, payload
 
+    def is_revoked(self, payload):
+        """
+        Returns whether the `jti` claim of the payload was revoked, if revocation is configured.
+        """
+        revocation = getattr(current_app, "JWT_REVOCATION", None)
+        if revocation is None or "jti" not in payload:
+            return False
+        return revocation.is_revoked(str(payload["jti"]))
+
+    def decode(self, token:str):
+        """
+        Verifies the signature and claims of `token` and returns its payload.
+        Uses the app's keyring when one is configured, else `JWT_SECRET`.
+        """
+        keyring = getattr(current_app, "JWT_KEYRING", None)
+        if keyring is not None:
+            try:
+                return keyring.decode(token)
+            except Exception as e:
+                raise exceptions.AuthenticationFailed(e.__str__())
+
+        secret = current_app.config.get("JWT_SECRET")
+        if not secret:
+            msg = 'lost JWT_SECRET configuration'
+            raise exceptions.ConfigureError(msg)
+        try:
+            return jwt.decode(token, secret, algorithms=["HS256", "RS256"])
+        except Exception as e:
+            raise exceptions.AuthenticationFailed(e.__str__())
+
     def authenticate_header(self):
         return "Bearer"
\ No newline at end of file
@@ -0,0 +1,239 @@
+from collections import OrderedDict
+import sys
+import threading
+import time
+
+class LRUCache:
+    """
+    Thread safe in-process mapping with a per entry expiry time, evicting
+    the least recently used entries once it holds more than `max_entries`
+    entries or more than `max_bytes` of their declared sizes.
+
+    The expiry is an absolute timestamp, passed by keyword so that it can
+    not be mistaken for the relative `timeout` of the cache protocol.
+    `lookup`, `read`, `store` and `remove` are the same operations for
+    callers already holding `lock`, like `LocalCache` does for its stripes.
+    """
+    timer = time.time
+
+    def __init__(self, max_entries=1024, max_bytes=None) -> None:
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Returns the value stored under `key`, or `None` if it is missing or expired.
+        """
+        with self.lock:
+            return self.read(key, self.timer())
+
+    def set(self, key, value, *, expires=None, size=1):
+        """
+        Stores `value` under `key` until the `expires` timestamp, `size` counts
+        against `max_bytes`.
+        """
+        with self.lock:
+            self.store(key, value, expires, size)
+
+    def delete(self, key):
+        with self.lock:
+            self.remove(key)
+
+    def lookup(self, key, now):
+        """
+        Returns the (value, expires, size) entry of `key` unless it is missing
+        or expired at `now`.
+        """
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if entry[1] is not None and entry[1] <= now:
+            self.remove(key)
+            return None
+        return entry
+
+    def read(self, key, now):
+        """
+        Returns the value of `key` like `get`, counting the hit or miss.
+        """
+        entry = self.lookup(key, now)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def store(self, key, value, expires, size):
+        self.remove(key)
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+        self.entries[key] = (value, expires, size)
+        self.size += size
+        while len(self.entries) > self.max_entries or (self.max_bytes is not None and self.size > self.max_bytes):
+            _, (_, _, evicted_size) = self.entries.popitem(last=False)
+            self.size -= evicted_size
+
+    def remove(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry[2]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def stats(self):
+        """
+        Returns the hit and miss counters and the current occupancy.
+        """
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self.entries),
+                "bytes": self.size,
+            }
+
+    def __len__(self):
+        return len(self.entries)
+
+# bookkeeping of an entry besides its key and value: the tuple and the ordered dict node
+ENTRY_OVERHEAD = 160
+
+def sizeof(value):
+    """
+    Estimates the memory taken by `value`, with the items of its lists,
+    tuples, sets and dicts.
+    """
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        for key, item in value.items():
+            size += sizeof(key) + sizeof(item)
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        for item in value:
+            size += sizeof(item)
+    return size
+
+class LocalCache:
+    """
+    Thread safe in-process cache to give to `RestFramework.init_app` when
+    there is no cache server:
+
+        rf.init_app(app, LocalCache(max_bytes=64*1024*1024))
+
+    Keys are spread over `stripes` shards, each an `LRUCache` with its own
+    lock, so threads working on different keys seldom wait for each other.
+    Each shard evicts its least recently used entries once it holds more than
+    its part of `max_entries` entries or of `max_bytes`, as estimated by
+    `sizeof`. An entry expires `timeout` seconds after it is stored,
+    `default_timeout` when it is `None`, never when that is `None` or 0.
+
+    It offers the atomic `add`, `incr` and `cas` operations, each key being
+    updated under the lock of its shard. Being local, every worker process
+    has its own: the throttles then count the requests of each process
+    apart.
+    """
+    timer = time.time
+
+    def __init__(self, max_entries=100000, max_bytes=64*1024*1024, stripes=16, default_timeout=None) -> None:
+        self.default_timeout = default_timeout
+        self.shards = [
+            LRUCache(max(1, max_entries // stripes), max_bytes // stripes if max_bytes is not None else None)
+            for _ in range(stripes)
+        ]
+
+    def shard(self, key):
+        return self.shards[hash(key) % len(self.shards)]
+
+    def expires(self, timeout, now):
+        if timeout is None:
+            timeout = self.default_timeout
+        return now + timeout if timeout else None
+
+    def store(self, shard, key, value, timeout, now):
+        shard.store(key, value, self.expires(timeout, now), ENTRY_OVERHEAD + sizeof(key) + sizeof(value))
+
+    def get(self, key):
+        """
+        Returns the value stored under `key`, or `None` if it is missing or expired.
+        """
+        shard = self.shard(key)
+        with shard.lock:
+            return shard.read(key, self.timer())
+
+    def set(self, key, value, timeout=None):
+        shard = self.shard(key)
+        now = self.timer()
+        with shard.lock:
+            self.store(shard, key, value, timeout, now)
+        return True
+
+    def add(self, key, value, timeout=None):
+        """
+        Stores `value` only if `key` is missing, returns whether it was stored.
+        """
+        shard = self.shard(key)
+        now = self.timer()
+        with shard.lock:
+            if shard.lookup(key, now) is not None:
+                return False
+            self.store(shard, key, value, timeout, now)
+            return True
+
+    def incr(self, key, delta=1):
+        """
+        Increments the integer stored under `key` and returns its new value,
+        keeping its expiry. Returns `None` if it is missing.
+        """
+        shard = self.shard(key)
+        with shard.lock:
+            entry = shard.lookup(key, self.timer())
+            if entry is None:
+                return None
+            value, expires, size = entry
+            shard.entries[key] = (value + delta, expires, size)
+            shard.entries.move_to_end(key)
+            return value + delta
+
+    def cas(self, key, expected, value, timeout=None):
+        """
+        Stores `value` only if the current value equals `expected`, a missing
+        key counting as `None`. Returns whether it was stored.
+        """
+        shard = self.shard(key)
+        now = self.timer()
+        with shard.lock:
+            entry = shard.lookup(key, now)
+            current = entry[0] if entry is not None else None
+            # the value read back from a local cache is the very object stored
+            if current is not expected and current != expected:
+                return False
+            self.store(shard, key, value, timeout, now)
+            return True
+
+    def delete(self, key):
+        self.shard(key).delete(key)
+
+    def clear(self):
+        for shard in self.shards:
+            shard.clear()
+
+    def stats(self):
+        """
+        Returns the hit and miss counters and the current occupancy.
+        """
+        stats = {"hits": 0, "misses": 0, "entries": 0, "bytes": 0}
+        for shard in self.shards:
+            for name, value in shard.stats().items():
+                stats[name] += value
+        return stats
+
+    def __len__(self):
+        return sum(len(shard) for shard in self.shards)
@@ -1,7 +1,7 @@
 
-from flask import jsonify
 import math
 from . import status
+from .renderers import render_response
 
 
 class APIException(Exception):
@@ -64,6 +64,26 @@ class NotFound(APIException):
     default_detail = 'Not found.'
     default_code = 'not_found'
 
+class NotAcceptable(APIException):
+    status_code = status.HTTP_406_NOT_ACCEPTABLE
+    default_detail = 'Could not satisfy the request Accept header.'
+    default_code = 'not_acceptable'
+
+class PayloadTooLarge(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = 'Request body is too large.'
+    default_code = 'payload_too_large'
+
+class UnsupportedMediaType(APIException):
+    status_code = status.HTTP_415_UNSUPPORTED_MEDIA_TYPE
+    default_detail = 'Unsupported media type "{media_type}" in request.'
+    default_code = 'unsupported_media_type'
+
+    def __init__(self, media_type, detail=None, code=None):
+        if detail is None:
+            detail = self.default_detail.format(media_type=media_type)
+        super().__init__(detail, code)
+
 class Throttled(APIException):
     status_code = status.HTTP_429_TOO_MANY_REQUESTS
     default_detail = 'Request was throttled.'
@@ -83,15 +103,14 @@ def exception_handler(exc:Exception):
     Returns the response that should be used for any given exception.
     '''
     if not isinstance(exc, APIException):
-        return jsonify({
+        return render_response({
             "message":exc.__str__(),
             "code":'A server error occurred.'
-        }),status.HTTP_500_INTERNAL_SERVER_ERROR
+        }, status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-    response = jsonify({"message":exc.detail,
+    response = render_response({"message":exc.detail,
                         "code":exc.code,
-                    })
-    response.status_code = exc.status_code
+                    }, exc.status_code)
     if isinstance(exc, (NotAuthenticated, AuthenticationFailed)):
         # WWW-Authenticate header for 401 responses, else coerce to 403
         if getattr(exc, 'auth_header', None):
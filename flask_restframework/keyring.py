@@ -0,0 +1,111 @@
+import json
+import os
+import threading
+import weakref
+import jwt
+from jwt.algorithms import get_default_algorithms
+
+class Key:
+    """
+    A parsed verification key and the algorithms it may be used with.
+    """
+    __slots__ = ("kid", "key", "algorithms")
+
+    def __init__(self, kid, key, algorithms) -> None:
+        self.kid = kid
+        self.key = key
+        self.algorithms = frozenset(algorithms)
+
+class Keyring:
+    """
+    JWT verification keys, parsed once and indexed by their `kid`.
+
+    Keys come from a list of dicts `{"kid": ..., "key": ..., "algorithms": [...]}`,
+    `key` being a HMAC secret or a PEM encoded public key, and from a local
+    JWKS file. A key without `kid` is used for tokens without one.
+    The JWKS file is loaded again when it changes if `reload_interval` is set.
+    """
+
+    def __init__(self, keys=None, jwks_file=None, reload_interval=None, on_reload=None) -> None:
+        self.config_keys = keys or []
+        self.jwks_file = jwks_file
+        self.reload_interval = reload_interval
+        self.on_reload = on_reload
+        self.mtime = None
+        self.keys = self.load()
+        self.stopped = threading.Event()
+        self.reloader = None
+        if self.jwks_file and self.reload_interval:
+            self.start_reloader()
+            reference = weakref.ref(self)
+            def restart():
+                # threads do not survive fork, workers of a preloaded app need their own
+                keyring = reference()
+                if keyring is not None and not keyring.stopped.is_set():
+                    keyring.start_reloader()
+            os.register_at_fork(after_in_child=restart)
+
+    def load(self):
+        """
+        Parses all the configured keys and returns them indexed by `kid`.
+        """
+        algorithms = get_default_algorithms()
+        keys = {}
+        for item in self.config_keys:
+            allowed = item.get("algorithms")
+            if not allowed:
+                raise Exception(f"key {item.get('kid')} must have an 'algorithms' list")
+            # every algorithm of one key is of the same family, so any of them can parse it
+            key = algorithms[allowed[0]].prepare_key(item["key"])
+            keys[item.get("kid")] = Key(item.get("kid"), key, allowed)
+        if self.jwks_file:
+            self.mtime = os.stat(self.jwks_file).st_mtime
+            with open(self.jwks_file, encoding="utf-8") as f:
+                jwks = json.load(f)
+            for item in jwks.get("keys", []):
+                jwk = jwt.PyJWK(item)
+                keys[jwk.key_id] = Key(jwk.key_id, jwk.key, [item.get("alg") or jwk.algorithm_name])
+        return keys
+
+    def reload(self):
+        """
+        Loads the keys again if the JWKS file changed, returns whether it did.
+        """
+        if not self.jwks_file or os.stat(self.jwks_file).st_mtime == self.mtime:
+            return False
+        # readers keep using the old dict until the new one is complete
+        self.keys = self.load()
+        if self.on_reload:
+            self.on_reload()
+        return True
+
+    def start_reloader(self):
+        def watch():
+            while not self.stopped.wait(self.reload_interval):
+                try:
+                    self.reload()
+                except Exception:
+                    # keep the current keys until the file is valid again
+                    pass
+        self.reloader = threading.Thread(target=watch, name="jwks-reloader", daemon=True)
+        self.reloader.start()
+
+    def stop(self):
+        self.stopped.set()
+
+    def get(self, kid):
+        return self.keys.get(kid)
+
+    def decode(self, token:str):
+        """
+        Verifies `token` against the key named by its `kid` header, with the
+        algorithm of its header if that key allows it, and returns the payload.
+        """
+        header = jwt.get_unverified_header(token)
+        key = self.keys.get(header.get("kid"))
+        if key is None:
+            raise jwt.InvalidKeyError(f"unknown key id {header.get('kid')}")
+        algorithm = header.get("alg")
+        if algorithm not in key.algorithms:
+            raise jwt.InvalidAlgorithmError(f"algorithm {algorithm} not allowed for this key")
+        return jwt.decode(token, key.key, algorithms=[algorithm])
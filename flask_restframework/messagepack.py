@@ -0,0 +1,184 @@
+"""
+Pure Python MessagePack (https://msgpack.org) encoder and decoder, used when
+the `msgpack` package is not installed. Only the types of JSON documents
+plus bytes are supported, extension types are not.
+"""
+import struct
+
+def packb(obj, default=None) -> bytes:
+    """
+    Returns `obj` packed as MessagePack, `default(o)` is called for the
+    objects of other types and must return a supported one.
+    """
+    out = []
+    pack(obj, out.append, default)
+    return b"".join(out)
+
+def pack(obj, write, default):
+    if obj is None:
+        write(b"\xc0")
+    elif obj is True:
+        write(b"\xc3")
+    elif obj is False:
+        write(b"\xc2")
+    elif isinstance(obj, int):
+        pack_int(obj, write)
+    elif isinstance(obj, float):
+        write(struct.pack(">Bd", 0xcb, obj))
+    elif isinstance(obj, str):
+        data = obj.encode("utf-8")
+        size = len(data)
+        if size < 32:
+            write(bytes((0xa0 | size,)))
+        elif size < 0x100:
+            write(struct.pack(">BB", 0xd9, size))
+        elif size < 0x10000:
+            write(struct.pack(">BH", 0xda, size))
+        else:
+            write(struct.pack(">BI", 0xdb, size))
+        write(data)
+    elif isinstance(obj, (bytes, bytearray, memoryview)):
+        data = bytes(obj)
+        size = len(data)
+        if size < 0x100:
+            write(struct.pack(">BB", 0xc4, size))
+        elif size < 0x10000:
+            write(struct.pack(">BH", 0xc5, size))
+        else:
+            write(struct.pack(">BI", 0xc6, size))
+        write(data)
+    elif isinstance(obj, (list, tuple)):
+        pack_header(len(obj), 0x90, 0xdc, write)
+        for item in obj:
+            pack(item, write, default)
+    elif isinstance(obj, dict):
+        pack_header(len(obj), 0x80, 0xde, write)
+        for key, value in obj.items():
+            pack(key, write, default)
+            pack(value, write, default)
+    elif default is not None:
+        pack(default(obj), write, None)
+    else:
+        raise TypeError(f"Object of type {type(obj).__name__} is not MessagePack serializable")
+
+def pack_int(obj, write):
+    if 0 <= obj < 0x80:
+        write(bytes((obj,)))
+    elif -32 <= obj < 0:
+        write(bytes((obj & 0xff,)))
+    elif 0 <= obj < 0x100:
+        write(struct.pack(">BB", 0xcc, obj))
+    elif 0 <= obj < 0x10000:
+        write(struct.pack(">BH", 0xcd, obj))
+    elif 0 <= obj < 0x100000000:
+        write(struct.pack(">BI", 0xce, obj))
+    elif 0 <= obj < 0x10000000000000000:
+        write(struct.pack(">BQ", 0xcf, obj))
+    elif -0x80 <= obj < 0:
+        write(struct.pack(">Bb", 0xd0, obj))
+    elif -0x8000 <= obj < 0:
+        write(struct.pack(">Bh", 0xd1, obj))
+    elif -0x80000000 <= obj < 0:
+        write(struct.pack(">Bi", 0xd2, obj))
+    elif -0x8000000000000000 <= obj < 0:
+        write(struct.pack(">Bq", 0xd3, obj))
+    else:
+        raise OverflowError("integer out of the MessagePack range")
+
+def pack_header(size, fix, code16, write):
+    # the 32 bits code of arrays and maps follows their 16 bits one
+    if size < 16:
+        write(bytes((fix | size,)))
+    elif size < 0x10000:
+        write(struct.pack(">BH", code16, size))
+    else:
+        write(struct.pack(">BI", code16 + 1, size))
+
+# code -> (struct format of the value or length, kind)
+FORMATS = {
+    0xc4: (">B", "bin"), 0xc5: (">H", "bin"), 0xc6: (">I", "bin"),
+    0xca: (">f", "value"), 0xcb: (">d", "value"),
+    0xcc: (">B", "value"), 0xcd: (">H", "value"), 0xce: (">I", "value"), 0xcf: (">Q", "value"),
+    0xd0: (">b", "value"), 0xd1: (">h", "value"), 0xd2: (">i", "value"), 0xd3: (">q", "value"),
+    0xd9: (">B", "str"), 0xda: (">H", "str"), 0xdb: (">I", "str"),
+    0xdc: (">H", "array"), 0xdd: (">I", "array"),
+    0xde: (">H", "map"), 0xdf: (">I", "map"),
+}
+
+def unpackb(data, max_depth=None):
+    """
+    Returns the object packed in `data`, raises ValueError if it is not a
+    single valid MessagePack object or nests deeper than `max_depth`.
+    """
+    data = memoryview(data)
+    obj, offset = unpack(data, 0, max_depth)
+    if offset != len(data):
+        raise ValueError("extra data after the MessagePack object")
+    return obj
+
+def read(data, offset, size):
+    end = offset + size
+    if end > len(data):
+        raise ValueError("truncated MessagePack data")
+    return data[offset:end], end
+
+def unpack(data, offset, depth):
+    if offset >= len(data):
+        raise ValueError("truncated MessagePack data")
+    code = data[offset]
+    offset += 1
+    if code < 0x80:
+        return code, offset
+    if code >= 0xe0:
+        return code - 0x100, offset
+    if 0xa0 <= code < 0xc0:
+        value, offset = read(data, offset, code & 0x1f)
+        return str(value, "utf-8"), offset
+    if 0x90 <= code < 0xa0:
+        return unpack_array(data, offset, code & 0x0f, depth)
+    if 0x80 <= code < 0x90:
+        return unpack_map(data, offset, code & 0x0f, depth)
+    if code == 0xc0:
+        return None, offset
+    if code in (0xc2, 0xc3):
+        return code == 0xc3, offset
+    if code not in FORMATS:
+        raise ValueError("unsupported MessagePack type 0x%02x" % code)
+    fmt, kind = FORMATS[code]
+    raw, offset = read(data, offset, struct.calcsize(fmt))
+    value = struct.unpack(fmt, raw)[0]
+    if kind == "value":
+        return value, offset
+    if kind == "array":
+        return unpack_array(data, offset, value, depth)
+    if kind == "map":
+        return unpack_map(data, offset, value, depth)
+    raw, offset = read(data, offset, value)
+    return (str(raw, "utf-8") if kind == "str" else bytes(raw)), offset
+
+def nested(depth):
+    if depth is None:
+        return None
+    if depth <= 0:
+        raise ValueError("MessagePack data nested too deep")
+    return depth - 1
+
+def unpack_array(data, offset, size, depth):
+    depth = nested(depth)
+    items = []
+    for _ in range(size):
+        item, offset = unpack(data, offset, depth)
+        items.append(item)
+    return items, offset
+
+def unpack_map(data, offset, size, depth):
+    depth = nested(depth)
+    items = {}
+    for _ in range(size):
+        key, offset = unpack(data, offset, depth)
+        value, offset = unpack(data, offset, depth)
+        try:
+            items[key] = value
+        except TypeError:
+            raise ValueError("unhashable MessagePack map key")
+    return items, offset
@@ -0,0 +1,307 @@
+from bisect import bisect_left
+import glob
+import itertools
+import json
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+import weakref
+
+HEADER = struct.Struct("<I4x")
+KEY_LENGTH = struct.Struct("<I")
+VALUE = struct.Struct("<d")
+
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, math.inf)
+CACHE_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, math.inf)
+
+def read_entries(data, used):
+    """
+    Yields the (key, value, value offset) entries of the first `used` bytes of a metrics file.
+    """
+    offset = HEADER.size
+    while offset < used:
+        length = KEY_LENGTH.unpack_from(data, offset)[0]
+        key = bytes(data[offset + KEY_LENGTH.size:offset + KEY_LENGTH.size + length]).decode("utf-8")
+        offset += entry_size(length) - VALUE.size
+        yield key, VALUE.unpack_from(data, offset)[0], offset
+        offset += VALUE.size
+
+def entry_size(length):
+    # the key is padded so that the value is aligned on 8 bytes
+    return (KEY_LENGTH.size + length + 7) // 8 * 8 + VALUE.size
+
+class MmapFile:
+    """
+    Values of a single process in a memory mapped file: a header holding
+    the number of bytes used, then entries of a key length, the utf-8 key
+    and a float64 value.
+    Only one thread of that process writes it at a time, so it takes no
+    lock; an entry is written before the header counts it, so readers never
+    see half of one.
+    """
+    initial_size = 64 * 1024
+
+    def __init__(self, path) -> None:
+        self.path = path
+        self.file = open(path, "r+b" if os.path.exists(path) else "w+b")
+        size = os.fstat(self.file.fileno()).st_size
+        if size < self.initial_size:
+            self.file.truncate(self.initial_size)
+            size = self.initial_size
+        self.map = mmap.mmap(self.file.fileno(), size)
+        self.used = HEADER.unpack_from(self.map, 0)[0] or HEADER.size
+        self.offsets = {key: offset for key, _, offset in read_entries(self.map, self.used)}
+
+    def add(self, key, amount):
+        offset = self.offsets.get(key)
+        if offset is None:
+            offset = self.allocate(key)
+        VALUE.pack_into(self.map, offset, VALUE.unpack_from(self.map, offset)[0] + amount)
+
+    def allocate(self, key):
+        encoded = key.encode("utf-8")
+        size = entry_size(len(encoded))
+        if self.used + size > len(self.map):
+            self.grow(self.used + size)
+        KEY_LENGTH.pack_into(self.map, self.used, len(encoded))
+        self.map[self.used + KEY_LENGTH.size:self.used + KEY_LENGTH.size + len(encoded)] = encoded
+        offset = self.used + size - VALUE.size
+        VALUE.pack_into(self.map, offset, 0.0)
+        self.used += size
+        HEADER.pack_into(self.map, 0, self.used)
+        self.offsets[key] = offset
+        return offset
+
+    def grow(self, needed):
+        size = len(self.map)
+        while size < needed:
+            size *= 2
+        self.map.close()
+        self.file.truncate(size)
+        self.map = mmap.mmap(self.file.fileno(), size)
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+class FileLease:
+    """
+    File of a thread, given back to the pool when the thread exits and its
+    locals are released.
+    """
+
+    def __init__(self, file, pool) -> None:
+        self.file = file
+        weakref.finalize(self, pool.append, file)
+
+def aggregate(directory):
+    """
+    Returns the values of all the metrics files of `directory` summed by key.
+    """
+    values = {}
+    for path in glob.glob(os.path.join(directory, "metrics_*.db")):
+        with open(path, "rb") as f:
+            data = f.read()
+        if len(data) < HEADER.size:
+            continue
+        used = min(HEADER.unpack_from(data, 0)[0], len(data))
+        for key, value, _ in read_entries(data, used):
+            values[key] = values.get(key, 0.0) + value
+    return values
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def format_labels(pairs):
+    if not pairs:
+        return ""
+    return "{%s}" % ",".join('%s="%s"' % (name, escape(value)) for name, value in pairs)
+
+def format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value))
+
+class Counter:
+    type = "counter"
+
+    def __init__(self, registry, name, documentation, labelnames=()) -> None:
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.keys = {}
+
+    def sample_key(self, labels, suffix="", bucket=None):
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} takes the labels {self.labelnames}")
+        return json.dumps([self.name, suffix, [str(label) for label in labels], bucket])
+
+    def inc(self, labels=(), amount=1):
+        key = self.keys.get(labels)
+        if key is None:
+            key = self.keys[labels] = self.sample_key(labels)
+        self.registry.writer().add(key, amount)
+
+    def samples(self, values):
+        for labels, (suffix, bucket, value) in values:
+            yield self.name, tuple(zip(self.labelnames, labels)), value
+
+class Histogram(Counter):
+    """
+    Counts of the observed values by fixed `buckets`, the upper bounds, plus
+    their sum. Each bucket only counts its own values on the hot path, they
+    are accumulated when collected.
+    """
+    type = "histogram"
+
+    def __init__(self, registry, name, documentation, labelnames=(), buckets=REQUEST_BUCKETS) -> None:
+        super().__init__(registry, name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        if self.buckets[-1] != math.inf:
+            self.buckets += (math.inf,)
+
+    def observe(self, labels, value):
+        keys = self.keys.get(labels)
+        if keys is None:
+            keys = self.keys[labels] = [self.sample_key(labels, "bucket", i) for i in range(len(self.buckets))] + \
+                [self.sample_key(labels, "sum"), self.sample_key(labels, "count")]
+        writer = self.registry.writer()
+        writer.add(keys[bisect_left(self.buckets, value)], 1)
+        writer.add(keys[-2], value)
+        writer.add(keys[-1], 1)
+
+    def samples(self, values):
+        series = {}
+        for labels, (suffix, bucket, value) in values:
+            counts = series.setdefault(labels, {})
+            counts[bucket if suffix == "bucket" else suffix] = value
+        for labels, counts in series.items():
+            pairs = tuple(zip(self.labelnames, labels))
+            total = 0.0
+            for i, bound in enumerate(self.buckets):
+                total += counts.get(i, 0.0)
+                yield self.name + "_bucket", pairs + (("le", format_value(bound)),), total
+            yield self.name + "_sum", pairs, counts.get("sum", 0.0)
+            yield self.name + "_count", pairs, counts.get("count", 0.0)
+
+class MetricsRegistry:
+    """
+    Counters and histograms shared by all the processes writing to `directory`.
+
+    Every thread writes its own memory mapped file there, so updating a
+    metric takes neither a lock nor a system call. The file of a thread
+    that exited is reused by the next new thread of the process, there are
+    only as many files as threads ever ran at once. They are summed
+    when collected, from any of the processes. Files of stopped processes
+    are kept so counters never go backwards: empty the directory when the
+    whole server is restarted.
+    Metrics are collected only if they are defined in the collecting
+    process, as are the ones of the framework below.
+    """
+
+    def __init__(self, directory) -> None:
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.metrics = {}
+        self.local = threading.local()
+        self.pool = []
+        self.numbers = itertools.count()
+        reference = weakref.ref(self)
+        def reset():
+            # a forked child must not write to the files of its parent
+            registry = reference()
+            if registry is not None:
+                registry.local = threading.local()
+                registry.pool = []
+        os.register_at_fork(after_in_child=reset)
+
+        self.requests = self.counter(
+            "flask_restframework_requests_total", "Requests by view, method and status.", ("view", "method", "status"))
+        self.request_duration = self.histogram(
+            "flask_restframework_request_duration_seconds", "Duration of the requests by view.", ("view",))
+        self.throttle_decisions = self.counter(
+            "flask_restframework_throttle_decisions_total", "Throttle decisions by scope.", ("scope", "decision"))
+        self.authentication_failures = self.counter(
+            "flask_restframework_authentication_failures_total", "Failed authentications by authenticator.",
+            ("authenticator",))
+        self.cache_duration = self.histogram(
+            "flask_restframework_cache_operation_duration_seconds", "Duration of the cache operations.",
+            ("operation",), buckets=CACHE_BUCKETS)
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(self, name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=REQUEST_BUCKETS):
+        return self.register(Histogram(self, name, documentation, labelnames, buckets))
+
+    def register(self, metric):
+        if metric.name in self.metrics:
+            raise Exception(f"metric {metric.name} is already registered")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def writer(self):
+        """
+        Returns the file of the current thread.
+        """
+        lease = getattr(self.local, "lease", None)
+        if lease is None:
+            try:
+                file = self.pool.pop()
+            except IndexError:
+                # more threads than ever before run at once
+                path = os.path.join(self.directory, "metrics_%d_%d.db" % (os.getpid(), next(self.numbers)))
+                file = MmapFile(path)
+            lease = self.local.lease = FileLease(file, self.pool)
+        return lease.file
+
+    def collect(self):
+        """
+        Yields (metric, samples) for every metric, samples being (name, label pairs, value) tuples.
+        """
+        values = {}
+        for key, value in aggregate(self.directory).items():
+            name, suffix, labels, bucket = json.loads(key)
+            values.setdefault(name, []).append((tuple(labels), (suffix, bucket, value)))
+        for name, metric in self.metrics.items():
+            yield metric, list(metric.samples(values.get(name, ())))
+
+    def exposition(self):
+        """
+        Returns the metrics of all the processes in the Prometheus text format.
+        """
+        lines = []
+        for metric, samples in self.collect():
+            lines.append("# HELP %s %s" % (metric.name, metric.documentation))
+            lines.append("# TYPE %s %s" % (metric.name, metric.type))
+            for name, pairs, value in samples:
+                lines.append("%s%s %s" % (name, format_labels(pairs), format_value(value)))
+        return "\n".join(lines) + "\n"
+
+class InstrumentedCache:
+    """
+    Proxy of a cache recording the duration of its operations in `histogram`.
+    """
+
+    def __init__(self, cache, histogram) -> None:
+        self.cache = cache
+        self.histogram = histogram
+
+    def __getattr__(self, name):
+        attribute = getattr(self.cache, name)
+        if not callable(attribute):
+            return attribute
+        histogram, labels = self.histogram, (name,)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return attribute(*args, **kwargs)
+            finally:
+                histogram.observe(labels, time.perf_counter() - start)
+        # later lookups find it without going through __getattr__
+        self.__dict__[name] = timed
+        return timed
@@ -1,3 +1,16 @@
+from flask import request
+import zlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
 class BaseMiddleware(object):
 
     def __init__(self, app):
@@ -16,4 +29,138 @@ class BaseMiddleware(object):
     def after_request(self, response):
         """
         """
-        return response
\ No newline at end of file
+        return response
+
+class ETagMiddleware(BaseMiddleware):
+    """
+    Sets an ETag, hash of the body, on the successful GET responses of the
+    app which have none, and answers the requests whose `If-None-Match`
+    matches it with 304. The body is still computed, only not sent.
+    """
+
+    def after_request(self, response):
+        if request.method not in ("GET", "HEAD") or response.status_code != 200 or response.is_streamed:
+            return response
+        if "ETag" not in response.headers:
+            response.add_etag()
+        return response.make_conditional(request)
+
+
+class ZlibCompressor:
+    """
+    gzip or (zlib wrapped) deflate stream.
+    """
+    def __init__(self, level, wbits) -> None:
+        self.compressor = zlib.compressobj(level, zlib.DEFLATED, wbits)
+
+    def compress(self, data):
+        return self.compressor.compress(data)
+
+    def flush(self):
+        # ends the output at a byte boundary, so the client can decode all that was sent so far
+        return self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self.compressor.flush()
+
+class BrotliCompressor:
+    def __init__(self, level) -> None:
+        self.compressor = brotli.Compressor(quality=level)
+
+    def compress(self, data):
+        return self.compressor.process(data)
+
+    def flush(self):
+        return self.compressor.flush()
+
+    def finish(self):
+        return self.compressor.finish()
+
+class ZstdCompressor:
+    def __init__(self, level) -> None:
+        self.compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data):
+        return self.compressor.compress(data)
+
+    def flush(self):
+        return self.compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self):
+        return self.compressor.flush()
+
+# content codings by order of preference, with their default level
+ENCODINGS = {}
+if zstandard is not None:
+    ENCODINGS["zstd"] = (ZstdCompressor, 3)
+if brotli is not None:
+    ENCODINGS["br"] = (BrotliCompressor, 4)
+ENCODINGS["gzip"] = (lambda level: ZlibCompressor(level, 16 + zlib.MAX_WBITS), 6)
+ENCODINGS["deflate"] = (lambda level: ZlibCompressor(level, zlib.MAX_WBITS), 6)
+
+class CompressionMiddleware(BaseMiddleware):
+    """
+    Compresses the responses of a content type of `mimetypes` with the
+    coding preferred by the request's `Accept-Encoding`: zstd and br when
+    the `zstandard` and `brotli` packages are installed, gzip and deflate.
+    Bodies shorter than `minimum_size` bytes are sent as they are.
+    Streamed responses are compressed chunk by chunk as they are sent.
+
+    Register it before the other middlewares, so that it runs after them on
+    the response.
+    """
+    mimetypes = (
+        "application/json", "application/msgpack", "application/javascript", "application/xml",
+        "text/html", "text/css", "text/plain", "text/xml", "text/csv",
+    )
+
+    def __init__(self, app, minimum_size=500, mimetypes=None, levels=None, encodings=None):
+        self.minimum_size = minimum_size
+        self.mimetypes = frozenset(mimetypes or self.mimetypes)
+        self.levels = levels or {}
+        self.encodings = [encoding for encoding in encodings or ENCODINGS if encoding in ENCODINGS]
+        super().__init__(app)
+
+    def make_compressor(self, encoding):
+        factory, level = ENCODINGS[encoding]
+        return factory(self.levels.get(encoding, level))
+
+    def after_request(self, response):
+        if response.mimetype not in self.mimetypes or response.status_code < 200 or \
+                response.status_code in (204, 304) or "Content-Encoding" in response.headers or \
+                "no-transform" in response.headers.get("Cache-Control", "") or response.direct_passthrough:
+            return response
+        response.vary.add("Accept-Encoding")
+        if request.method == "HEAD":
+            return response
+        encoding = request.accept_encodings.best_match(self.encodings)
+        if encoding is None:
+            return response
+        if not response.is_streamed:
+            data = response.get_data()
+            if len(data) < self.minimum_size:
+                return response
+            compressor = self.make_compressor(encoding)
+            response.set_data(compressor.compress(data) + compressor.finish())
+        else:
+            response.response = self.compress_stream(response.response, self.make_compressor(encoding))
+            response.headers.pop("Content-Length", None)
+        response.headers["Content-Encoding"] = encoding
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            # the compressed body is another sequence of bytes of the same content
+            response.set_etag(etag, weak=True)
+        return response
+
+    def compress_stream(self, chunks, compressor):
+        try:
+            for chunk in chunks:
+                if isinstance(chunk, str):
+                    chunk = chunk.encode("utf-8")
+                data = compressor.compress(chunk) + compressor.flush()
+                if data:
+                    yield data
+            yield compressor.finish()
+        finally:
+            if hasattr(chunks, "close"):
+                chunks.close()
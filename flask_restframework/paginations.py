@@ -1,19 +1,206 @@
-from flask import request
+from flask import current_app, request, Response, stream_with_context
+from itsdangerous import BadSignature, URLSafeSerializer
+from urllib.parse import urlencode
+import datetime
+import decimal
+import hashlib
+import json
+import uuid
+from . import exceptions
+from .renderers import get_renderer, render_response
 
-class OldBasePagination:
+COUNT_STRATEGIES = ("exact", "cached", "estimated", "none")
+
+class Page:
+    '''
+    page of a query fetched without the count query of `queryset.paginate`,
+    it has the attributes of flask-sqlalchemy's Pagination used here.
+    '''
+    def __init__(self, page, per_page, items, has_next) -> None:
+        self.page = page
+        self.per_page = per_page
+        self.items = items
+        self.has_next = has_next
+        self.has_prev = page > 1
+        self.next_num = page + 1 if self.has_next else None
+        self.prev_num = page - 1 if self.has_prev else None
+        self.total = None
+
+def page_size_arg(default):
+    '''
+    Returns the `page_size` query arg, `default` if it is missing or below 1
+    like flask-sqlalchemy's `paginate` does without `error_out`.
+    '''
+    page_size = int(request.args.get("page_size", default))
+    return page_size if page_size >= 1 else default
+
+def page_query(queryset, page, per_page):
+    '''
+    Returns the query of the rows of the page, plus the first row of the next
+    page telling whether there is one.
+    '''
+    return queryset.limit(per_page + 1).offset((page - 1) * per_page)
+
+def check_count_strategy(count_strategy):
+    if count_strategy not in COUNT_STRATEGIES:
+        raise Exception(f"pagination count strategy must be one of {COUNT_STRATEGIES}")
+
+def paginate(queryset, page, per_page, count_strategy):
+    '''
+    Returns the page of the query and whether its `total` is exact, the total
+    being counted as `count_strategy` says:
+    "exact": a count query on every request,
+    "cached": a count query cached in app.CACHE for FLASK_RESTFRAMEWORK_PAGINATION_COUNT_TIMEOUT seconds,
+    "estimated": the row estimate of the database planner (PostgreSQL only, else "cached"),
+    "none": no total at all.
+    '''
+    check_count_strategy(count_strategy)
+    # pages start at 1, like flask-sqlalchemy's paginate without error_out
+    page = max(page, 1)
+    if count_strategy == "exact":
+        return queryset.paginate(page=page, per_page=per_page, error_out=False), True
+
+    rows = page_query(queryset, page, per_page).all()
+    pagination = Page(page, per_page, rows[:per_page], len(rows) > per_page)
+    return pagination, count_page(queryset, pagination, len(pagination.items), count_strategy)
+
+def count_page(queryset, pagination, page_items, count_strategy):
+    '''
+    Sets the `total` of a page holding `page_items` rows as `count_strategy`
+    says, returns whether it is exact.
+    '''
+    if not pagination.has_next and (page_items or pagination.page == 1):
+        # the last page tells the exact total for free
+        pagination.total = (pagination.page - 1) * pagination.per_page + page_items
+        return True
+    if count_strategy == "exact":
+        pagination.total = queryset.order_by(None).count()
+        return True
+    if count_strategy == "none":
+        return False
+    if count_strategy == "estimated":
+        pagination.total = estimate_count(queryset)
+        if pagination.total is not None:
+            return False
+    pagination.total, exact = cached_count(queryset)
+    return exact
+
+def query_version(queryset, column):
+    '''
+    Returns the count of the rows of the query and the greatest value of their
+    `column`, such as an update time, fetched by one aggregate query: a cheap
+    version key of its pages for `APIView.get_version_key`.
+    '''
+    from sqlalchemy import func
+    count, last = queryset.order_by(None).with_entities(func.count(), func.max(column)).one()
+    return "%s:%s" % (count, last)
+
+def query_fingerprint(queryset):
+    statement = queryset.order_by(None).statement.compile()
+    params = json.dumps(statement.params, sort_keys=True, default=str)
+    return hashlib.sha1((str(statement) + params).encode("utf-8")).hexdigest()
+
+def cached_count(queryset):
+    '''
+    Returns the total of the query counted at most FLASK_RESTFRAMEWORK_PAGINATION_COUNT_TIMEOUT
+    seconds ago and whether it is exact, which it only is without a cache.
+    '''
+    cache = getattr(current_app, "CACHE", None)
+    if cache is None:
+        return queryset.order_by(None).count(), True
+    key = "pagination_count_" + query_fingerprint(queryset)
+    total = cache.get(key)
+    if total is None:
+        total = queryset.order_by(None).count()
+        cache.set(key, total, current_app.config.get("FLASK_RESTFRAMEWORK_PAGINATION_COUNT_TIMEOUT", 60))
+    return total, False
+
+def estimate_count(queryset):
+    '''
+    Returns the number of rows the database planner expects the query to
+    return, or `None` if the database is not supported.
+    '''
+    connection = queryset.session.connection()
+    if connection.dialect.name != "postgresql":
+        return None
+    statement = queryset.order_by(None).statement.compile(dialect=connection.dialect)
+    plan = connection.exec_driver_sql("EXPLAIN (FORMAT JSON) " + str(statement), statement.params).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+class SerializerMixin:
+    '''
+    serializes the rows of a page, the whole page at once when `serializer`
+    is set, a callable `serializer(items, fields)` returning a list of dicts,
+    so it can batch-load relations instead of one query per row.
+    clients may ask for a subset of the fields with `?fields=a,b`, limited to
+    `allowed_fields` if set. the emitted keys are always narrowed to them,
+    and so are the columns selected from the query when a `serializer` is
+    set, a serializer being expected to only read the fields it is given.
+    '''
+    serializer = None
+    fields_query_param = "fields"
+    allowed_fields = None
+
+    def get_fields(self):
+        fields = request.args.get(self.fields_query_param)
+        if not fields:
+            return None
+        fields = [field.strip() for field in fields.split(",") if field.strip()]
+        if self.allowed_fields is not None:
+            not_allowed = [field for field in fields if field not in self.allowed_fields]
+            if not_allowed:
+                raise exceptions.ValidationError(f"fields not allowed: {', '.join(not_allowed)}")
+        return fields
+
+    def select_fields(self, queryset, required=()):
+        '''
+        Narrows the columns loaded by the query to the requested fields which
+        are columns, plus the `required` ones.
+        '''
+        self.fields = self.get_fields()
+        if self.fields is None or self.serializer is None:
+            return queryset
+        from sqlalchemy import inspect
+        from sqlalchemy.orm import load_only
+        model = queryset.column_descriptions[0]["entity"]
+        columns = inspect(model).column_attrs.keys()
+        names = [name for name in dict.fromkeys(list(self.fields) + list(required)) if name in columns]
+        if not names:
+            return queryset
+        return queryset.options(load_only(*[getattr(model, name) for name in names]))
+
+    def serialize(self, items):
+        fields = getattr(self, "fields", None)
+        if self.serializer is not None:
+            return self.serializer(items, fields)
+        if fields is None:
+            return [item.to_json() for item in items]
+        results = []
+        for item in items:
+            data = item.to_json()
+            results.append({field: data[field] for field in fields if field in data})
+        return results
+
+class OldBasePagination(SerializerMixin):
     '''
     queryset should be model.query object
     model should contain to_json() method.
     '''
     page = 1
     page_size = 5
+    count_strategy = None
 
     def __init__(self, queryset) -> None:
         self.root_url = request.root_url
         self.path = request.path.strip("/")
-        self.page_num = int(request.args.get("page",self.page))
-        self.page_size_num = int(request.args.get("page_size",self.page_size))
-        self.pagination = queryset.paginate(self.page_num, per_page= self.page_size_num, error_out=False)
+        # the links are built from page_num, it starts at 1 too
+        self.page_num = max(int(request.args.get("page",self.page)), 1)
+        self.page_size_num = page_size_arg(self.page_size)
+        count_strategy = self.count_strategy or current_app.config.get("FLASK_RESTFRAMEWORK_PAGINATION_COUNT", "exact")
+        queryset = self.select_fields(queryset)
+        self.pagination, self.count_exact = paginate(queryset, self.page_num, self.page_size_num, count_strategy)
 
     def previous_url(self):
         if self.page_num<=1:
@@ -42,27 +229,40 @@ class OldBasePagination:
     def to_json(self):
         return {
             "count":self.pagination.total,
+            "count_exact":self.count_exact,
             "previous": self.previous_url(),
             "next": self.next_url(),
-            "results": [item.to_json() for item in self.pagination.items]
+            "results": self.serialize(self.pagination.items)
         }
 
-class BasePagination:
+class BasePagination(SerializerMixin):
     '''
     queryset should be model.query object
     model should contain to_json() method.
     use example:
         pagination = BasePagination(yourModel.query)
         return jsonify(pagination.to_json())
+    or, to stream a large page without holding it in memory:
+        return BasePagination(yourModel.query, stream=True).stream()
     '''
     page = 1
     page_size = 5
+    count_strategy = None
+    stream_batch_size = 500
 
-    def __init__(self, queryset) -> None:
+    def __init__(self, queryset, stream=False) -> None:
         self.url = request.url
+        # left as requested, the links replace it in the url
         self.page_num = int(request.args.get("page",self.page))
-        self.page_size_num = int(request.args.get("page_size",self.page_size))
-        self.pagination = queryset.paginate(self.page_num, per_page= self.page_size_num, error_out=False)
+        self.page_size_num = page_size_arg(self.page_size)
+        self.count_strategy = self.count_strategy or current_app.config.get("FLASK_RESTFRAMEWORK_PAGINATION_COUNT", "exact")
+        self.queryset = queryset = self.select_fields(queryset)
+        if stream:
+            # rows are only fetched while streaming
+            check_count_strategy(self.count_strategy)
+            self.pagination = None
+            return
+        self.pagination, self.count_exact = paginate(queryset, self.page_num, self.page_size_num, self.count_strategy)
 
     def previous_url(self):
         if not self.pagination.has_prev:
@@ -82,7 +282,192 @@ class BasePagination:
     def to_json(self):
         return {
             "count":self.pagination.total,
+            "count_exact":self.count_exact,
             "previous": self.previous_url(),
             "next": self.next_url(),
-            "results": [item.to_json() for item in self.pagination.items]
-        }
\ No newline at end of file
+            "results": self.serialize(self.pagination.items)
+        }
+
+    def stream(self):
+        '''
+        Returns a response streaming the page as JSON, the rows are fetched
+        `stream_batch_size` at a time and written as soon as they are
+        serialized, so only one batch is held in memory.
+        Formats which need the length of `results` before them, such as
+        MessagePack, are rendered at once after all the batches are read.
+        '''
+        not_acceptable = getattr(request, "not_acceptable", None)
+        if not_acceptable is not None:
+            raise not_acceptable
+        renderer = get_renderer()
+        if not renderer.streamable:
+            results = [item for batch in self.iter_batches() for item in batch]
+            return render_response({
+                "count":self.pagination.total,
+                "count_exact":self.count_exact,
+                "previous": self.previous_url(),
+                "next": self.next_url(),
+                "results": results
+            }, renderer=renderer)
+        return Response(stream_with_context(self.iter_json(renderer)), mimetype=renderer.media_type)
+
+    def dump_batch(self, renderer, batch, written):
+        data = b",".join(renderer.render(item) for item in batch)
+        return b"," + data if written else data
+
+    def iter_batches(self):
+        '''
+        Yields the serialized rows of the page by batches of `stream_batch_size`,
+        then sets `pagination` and `count_exact`.
+        '''
+        page = max(self.page_num, 1)
+        rows = page_query(self.queryset, page, self.page_size_num).yield_per(self.stream_batch_size)
+        page_items, has_next, batch = 0, False, []
+        for item in rows:
+            if page_items + len(batch) == self.page_size_num:
+                has_next = True
+                break
+            batch.append(item)
+            if len(batch) == self.stream_batch_size:
+                yield self.serialize(batch)
+                page_items, batch = page_items + len(batch), []
+        if batch:
+            yield self.serialize(batch)
+            page_items += len(batch)
+        self.pagination = Page(page, self.page_size_num, [], has_next)
+        self.count_exact = count_page(self.queryset, self.pagination, page_items, self.count_strategy)
+
+    def iter_json(self, renderer):
+        '''
+        Yields the JSON of the page piece by piece, `results` first since
+        `next` and `count` are only known once all the rows are read.
+        '''
+        yield b'{"results":['
+        written = 0
+        for batch in self.iter_batches():
+            yield self.dump_batch(renderer, batch, written)
+            written += len(batch)
+        yield b'],"count":%s,"count_exact":%s,"previous":%s,"next":%s}' % (
+            renderer.render(self.pagination.total),
+            renderer.render(self.count_exact),
+            renderer.render(self.previous_url()),
+            renderer.render(self.next_url()),
+        )
+
+class CursorPagination(SerializerMixin):
+    '''
+    queryset should be model.query object, not ordered yet
+    model should contain to_json() method.
+    `ordering` names indexed column(s) which together are unique, prefixed
+    with "-" for descending order, all in the same direction.
+    pages are located by an opaque cursor signed with app.secret_key and the
+    ordering, so it is only valid for paginations of the same ordering, each
+    page costs one indexed range query of page_size+1 rows and no count,
+    whatever its depth.
+    use example:
+        pagination = CursorPagination(yourModel.query)
+        return jsonify(pagination.to_json())
+    '''
+    page_size = 5
+    ordering = ("id",)
+    cursor_query_param = "cursor"
+    salt = "flask-restframework.cursor"
+
+    def __init__(self, queryset) -> None:
+        from sqlalchemy import tuple_
+
+        descending = {name.startswith("-") for name in self.ordering}
+        if len(descending) != 1:
+            raise Exception("CursorPagination ordering must be all ascending or all descending")
+        self.descending = descending.pop()
+        self.ordering_fields = [name.lstrip("-") for name in self.ordering]
+        self.page_size_num = page_size_arg(self.page_size)
+        self.cursor = self.decode_cursor(request.args.get(self.cursor_query_param))
+
+        model = queryset.column_descriptions[0]["entity"]
+        columns = [getattr(model, field) for field in self.ordering_fields]
+        # the cursor is made of the ordering fields, they are always loaded
+        queryset = self.select_fields(queryset, required=self.ordering_fields)
+        reverse = bool(self.cursor and self.cursor["r"])
+        # walking backwards to the previous page reads the index the other way round
+        descending_scan = self.descending != reverse
+        queryset = queryset.order_by(*[column.desc() if descending_scan else column.asc() for column in columns])
+        if self.cursor:
+            key = tuple_(*columns) if len(columns) > 1 else columns[0]
+            values = [self.decode_value(value) for value in self.cursor["v"]]
+            position = tuple_(*values) if len(values) > 1 else values[0]
+            queryset = queryset.filter(key < position if descending_scan else key > position)
+
+        rows = queryset.limit(self.page_size_num + 1).all()
+        has_more = len(rows) > self.page_size_num
+        self.items = rows[:self.page_size_num]
+        if reverse:
+            self.items.reverse()
+            self.has_previous, self.has_next = has_more, True
+        else:
+            self.has_previous, self.has_next = self.cursor is not None, has_more
+
+    @property
+    def signer(self):
+        if not current_app.secret_key:
+            raise exceptions.ConfigureError("CursorPagination needs app.secret_key to sign cursors")
+        return URLSafeSerializer(current_app.secret_key, salt="%s:%s" % (self.salt, ",".join(self.ordering)))
+
+    def decode_cursor(self, cursor):
+        if not cursor:
+            return None
+        try:
+            cursor = self.signer.loads(cursor)
+        except BadSignature:
+            raise exceptions.NotFound("Invalid cursor.")
+        if len(cursor["v"]) != len(self.ordering_fields):
+            raise exceptions.NotFound("Invalid cursor.")
+        return cursor
+
+    def encode_cursor(self, item, reverse):
+        position = [self.encode_value(getattr(item, field)) for field in self.ordering_fields]
+        return self.signer.dumps({"v": position, "r": reverse})
+
+    def encode_value(self, value):
+        if isinstance(value, datetime.datetime):
+            return {"datetime": value.isoformat()}
+        if isinstance(value, datetime.date):
+            return {"date": value.isoformat()}
+        if isinstance(value, decimal.Decimal):
+            return {"decimal": str(value)}
+        if isinstance(value, uuid.UUID):
+            return {"uuid": str(value)}
+        return value
+
+    def decode_value(self, value):
+        if not isinstance(value, dict):
+            return value
+        if "datetime" in value:
+            return datetime.datetime.fromisoformat(value["datetime"])
+        if "date" in value:
+            return datetime.date.fromisoformat(value["date"])
+        if "decimal" in value:
+            return decimal.Decimal(value["decimal"])
+        return uuid.UUID(value["uuid"])
+
+    def page_url(self, cursor):
+        query_param = request.args.to_dict()
+        query_param[self.cursor_query_param] = cursor
+        return request.base_url+"?"+urlencode(query_param)
+
+    def previous_url(self):
+        if not self.has_previous or not self.items:
+            return None
+        return self.page_url(self.encode_cursor(self.items[0], reverse=True))
+
+    def next_url(self):
+        if not self.has_next or not self.items:
+            return None
+        return self.page_url(self.encode_cursor(self.items[-1], reverse=False))
+
+    def to_json(self):
+        return {
+            "previous": self.previous_url(),
+            "next": self.next_url(),
+            "results": self.serialize(self.items)
+        }
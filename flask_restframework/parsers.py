@@ -0,0 +1,203 @@
+from flask import current_app
+import codecs
+import json
+import re
+from . import exceptions
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+def check_depth(data, max_depth, depth=0):
+    """
+    Raises ParseError if `data`, found `depth` levels deep, nests lists and
+    dicts more than `max_depth` levels deep.
+    """
+    stack = [(data, depth)]
+    while stack:
+        obj, depth = stack.pop()
+        children = obj.values() if isinstance(obj, dict) else obj
+        depth += 1
+        if depth > max_depth:
+            raise exceptions.ParseError(f"Request data nested more than {max_depth} levels deep.")
+        stack.extend((child, depth) for child in children if isinstance(child, (dict, list)))
+
+def read_body(stream, max_size, chunk_size=64*1024):
+    """
+    Returns the body read from `stream`, raises PayloadTooLarge as soon as it
+    exceeds `max_size` bytes, before buffering the rest.
+    """
+    chunks, size = [], 0
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            return b"".join(chunks)
+        size += len(chunk)
+        if max_size is not None and size > max_size:
+            raise exceptions.PayloadTooLarge()
+        chunks.append(chunk)
+
+class BaseParser:
+    """
+    All parser classes should extend BaseParser.
+    """
+    media_type = None
+
+    def parse(self, data:bytes, max_depth=None):
+        """
+        Returns the data structure parsed from the request body `data`.
+        Raises ParseError if it is malformed or nested more than `max_depth` levels deep.
+        """
+        raise NotImplementedError(".parse() must be overridden.")
+
+class JSONParser(BaseParser):
+    """
+    Parses JSON request bodies.
+    """
+    media_type = "application/json"
+
+    def parse(self, data:bytes, max_depth=None):
+        try:
+            parsed = json.loads(data)
+        except ValueError as e:
+            raise exceptions.ParseError(f"JSON parse error - {e}")
+        except RecursionError:
+            raise exceptions.ParseError("JSON parse error - nested too deep")
+        # counting brackets is cheap and mostly spares walking the parsed data
+        if max_depth is not None and data.count(b"[") + data.count(b"{") > max_depth:
+            if isinstance(parsed, (dict, list)):
+                check_depth(parsed, max_depth)
+        return parsed
+
+    def iter_items(self, stream, max_item_size=None, max_depth=None, chunk_size=64*1024):
+        """
+        Yields the items of the JSON array read from `stream` one by one, so
+        only the item being parsed is held in memory, however long the array.
+        """
+        return iter(JSONArrayReader(stream, max_item_size, max_depth, chunk_size))
+
+class JSONArrayReader:
+    """
+    Reads a JSON array from a stream by chunks and parses its items one at a time.
+    Raises PayloadTooLarge if an item takes more than `max_item_size` characters.
+    """
+    def __init__(self, stream, max_item_size=None, max_depth=None, chunk_size=64*1024) -> None:
+        self.stream = stream
+        self.max_item_size = max_item_size
+        self.max_depth = max_depth
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.text = codecs.getincrementaldecoder("utf-8")()
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def fill(self):
+        """
+        Reads the next chunk, dropping what is already parsed from the
+        buffer, returns False at the end of the stream.
+        """
+        if self.eof:
+            return False
+        chunk = self.stream.read(self.chunk_size)
+        self.eof = not chunk
+        try:
+            text = self.text.decode(chunk, final=self.eof)
+        except ValueError as e:
+            raise exceptions.ParseError(f"JSON parse error - {e}")
+        self.buffer = self.buffer[self.pos:] + text
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """
+        Returns the next character which is not whitespace, "" at the end.
+        """
+        while True:
+            self.pos = WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer) or not self.fill():
+                return self.buffer[self.pos:self.pos+1]
+
+    def expect(self, chars):
+        char = self.peek()
+        if not char or char not in chars:
+            raise exceptions.ParseError("JSON parse error - expected %s" % " or ".join(repr(c) for c in chars))
+        self.pos += 1
+        return char
+
+    def item(self):
+        while True:
+            try:
+                item, end = self.decoder.raw_decode(self.buffer, self.pos)
+                # unless the stream is over, a number ending the buffer may go on in the next chunk
+                if end < len(self.buffer) or self.eof:
+                    if self.max_item_size is not None and end - self.pos > self.max_item_size:
+                        raise exceptions.PayloadTooLarge()
+                    self.pos = end
+                    return item
+            except ValueError as e:
+                # the item may only be cut by the end of the buffer
+                if self.eof:
+                    raise exceptions.ParseError(f"JSON parse error - {e}")
+            except RecursionError:
+                raise exceptions.ParseError("JSON parse error - nested too deep")
+            if self.max_item_size is not None and len(self.buffer) - self.pos > self.max_item_size:
+                raise exceptions.PayloadTooLarge()
+            self.fill()
+
+    def __iter__(self):
+        self.expect("[")
+        if self.peek() == "]":
+            self.pos += 1
+        else:
+            while True:
+                self.peek()
+                item = self.item()
+                if self.max_depth is not None and isinstance(item, (dict, list)):
+                    check_depth(item, self.max_depth, depth=1)
+                yield item
+                if self.expect(",]") == "]":
+                    break
+        if self.peek():
+            raise exceptions.ParseError("JSON parse error - extra data after the array")
+
+class MessagePackParser(BaseParser):
+    """
+    Parses MessagePack request bodies, with the `msgpack` package when it is
+    installed and with the pure Python `messagepack` module otherwise.
+    """
+    media_type = "application/msgpack"
+
+    def parse(self, data:bytes, max_depth=None):
+        try:
+            if msgpack is None:
+                from .messagepack import unpackb
+                return unpackb(data, max_depth=max_depth)
+            parsed = msgpack.unpackb(data, raw=False, strict_map_key=False)
+        except Exception as e:
+            raise exceptions.ParseError(f"MessagePack parse error - {e}")
+        if max_depth is not None and isinstance(parsed, (dict, list)):
+            check_depth(parsed, max_depth)
+        return parsed
+
+# media types some clients still send for the registered ones
+MEDIA_TYPE_ALIASES = {
+    "application/x-msgpack": "application/msgpack",
+}
+
+def select_parser(parsers, content_type):
+    """
+    Returns the parser of `parsers` for the request's `content_type`, its
+    mimetype without parameters. Raises UnsupportedMediaType if there is none.
+    """
+    media_type = MEDIA_TYPE_ALIASES.get(content_type, content_type)
+    for parser in parsers:
+        if parser.media_type == media_type:
+            return parser
+    raise exceptions.UnsupportedMediaType(content_type)
+
+def get_parsers():
+    return getattr(current_app, "PARSERS", None) or [JSONParser()]
@@ -0,0 +1,176 @@
+from flask import current_app, has_app_context, has_request_context, request, Response
+from flask import json as flask_json
+from werkzeug.http import http_date
+import dataclasses
+import datetime
+import decimal
+import uuid
+
+try:
+    from flask.json.provider import DefaultJSONProvider
+except ImportError:
+    DefaultJSONProvider = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+def default(o):
+    """
+    Serializes the types Flask's JSON encoder supports beyond the JSON ones,
+    the same way, so every backend renders the same document.
+    """
+    if isinstance(o, datetime.date):
+        return http_date(o)
+    if isinstance(o, (decimal.Decimal, uuid.UUID)):
+        return str(o)
+    if dataclasses.is_dataclass(o):
+        return dataclasses.asdict(o)
+    if hasattr(o, "__html__"):
+        return str(o.__html__())
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+class BaseRenderer:
+    """
+    All renderer classes should extend BaseRenderer.
+    """
+    media_type = None
+    # whether pagination can write the document piece by piece, see BasePagination.stream
+    streamable = False
+
+    def render(self, data) -> bytes:
+        """
+        Returns `data` rendered as bytes of `media_type`.
+        """
+        raise NotImplementedError(".render() must be overridden.")
+
+class JSONRenderer(BaseRenderer):
+    """
+    Renders JSON with the app's JSON provider, like `jsonify` does, so its
+    encoder, key sorting and ASCII escaping apply.
+    """
+    media_type = "application/json"
+    streamable = True
+
+    def render(self, data) -> bytes:
+        provider = getattr(current_app, "json", None) if has_app_context() else None
+        if provider is None or DefaultJSONProvider is None:
+            # no app, or Flask < 2.2 whose json module reads the app's encoder and settings itself
+            return flask_json.dumps(data, separators=(",", ":")).encode("utf-8")
+        if not isinstance(provider, DefaultJSONProvider):
+            return provider.dumps(data).encode("utf-8")
+        # pretty printed in debug mode like jsonify, unless compact is set
+        if provider.compact is False or (provider.compact is None and current_app.debug):
+            return provider.dumps(data, indent=2).encode("utf-8")
+        return provider.dumps(data, separators=(",", ":")).encode("utf-8")
+
+class OrjsonRenderer(JSONRenderer):
+    """
+    Renders JSON with orjson, requires `pip install orjson`.
+    """
+    def __init__(self) -> None:
+        if orjson is None:
+            raise Exception("OrjsonRenderer requires orjson: pip install orjson")
+        # dates go through `default` too, to be rendered like the other backends do
+        self.options = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+
+    def render(self, data) -> bytes:
+        try:
+            return orjson.dumps(data, default=default, option=self.options)
+        except TypeError:
+            # orjson rejects integers beyond 64 bits, which the app's JSON provider renders
+            return super().render(data)
+
+class UjsonRenderer(JSONRenderer):
+    """
+    Renders JSON with ujson, requires `pip install ujson`.
+    """
+    def __init__(self) -> None:
+        if ujson is None:
+            raise Exception("UjsonRenderer requires ujson: pip install ujson")
+
+    def render(self, data) -> bytes:
+        try:
+            return ujson.dumps(data, ensure_ascii=False, default=default).encode("utf-8")
+        except OverflowError:
+            # ujson rejects integers beyond 64 bits, which the app's JSON provider renders
+            return super().render(data)
+
+class MessagePackRenderer(BaseRenderer):
+    """
+    Renders MessagePack, with the `msgpack` package when it is installed and
+    with the pure Python `messagepack` module otherwise.
+    """
+    media_type = "application/msgpack"
+
+    def render(self, data) -> bytes:
+        if msgpack is not None:
+            return msgpack.packb(data, default=default, use_bin_type=True)
+        from .messagepack import packb
+        return packb(data, default=default)
+
+RENDERERS = {
+    "json": JSONRenderer,
+    "orjson": OrjsonRenderer,
+    "ujson": UjsonRenderer,
+    "msgpack": MessagePackRenderer,
+}
+
+def get_renderer_class(name):
+    """
+    Returns the renderer class named by FLASK_RESTFRAMEWORK_RENDERER: "json"
+    (the default), "orjson", "ujson", "auto" (the fastest installed one) or
+    an import path.
+    """
+    if name == "auto":
+        if orjson is not None:
+            return OrjsonRenderer
+        if ujson is not None:
+            return UjsonRenderer
+        return JSONRenderer
+    if name in RENDERERS:
+        return RENDERERS[name]
+    from . import import_string
+    return import_string(name)
+
+def get_renderer():
+    """
+    Returns the renderer negotiated for the current request, else the app's.
+    """
+    renderer = getattr(request, "accepted_renderer", None) if has_request_context() else None
+    if renderer is None:
+        renderer = getattr(current_app, "RENDERER", None)
+    return renderer if renderer is not None else JSONRenderer()
+
+def negotiate_renderer(renderers):
+    """
+    Returns the renderer of `renderers` whose media type the request's
+    `Accept` header prefers, the first one if it accepts any.
+    Raises NotAcceptable if it accepts none of them.
+    """
+    accept = request.accept_mimetypes
+    if not accept:
+        return renderers[0]
+    best = accept.best_match([renderer.media_type for renderer in renderers])
+    if best is None:
+        from .exceptions import NotAcceptable
+        raise NotAcceptable()
+    return next(renderer for renderer in renderers if renderer.media_type == best)
+
+def render_response(data, status=200, headers=None, renderer=None):
+    """
+    Returns a response of `data` rendered by `renderer`, the app's by default.
+    """
+    renderer = renderer or get_renderer()
+    return Response(renderer.render(data), status=status, headers=headers, mimetype=renderer.media_type)
@@ -0,0 +1,156 @@
+from flask import current_app, g, request, make_response
+from urllib.parse import urlencode
+import hashlib
+import time
+from .renderers import get_renderer
+
+VARY_KEYS = ("path", "query", "user", "accept")
+PUBLIC_VARY_KEYS = ("path", "query", "accept")
+
+class ResponseCache:
+    """
+    Cache of the responses of the GET and HEAD requests of a view, kept in
+    the cache given to `RestFramework.init_app`:
+
+        class ItemView(APIView):
+            response_cache = ResponseCache(timeout=60, vary=("path", "query", "user"))
+
+    A response is cached per value of the `vary` parts of the request: its
+    "path", its "query" args, the "user" id and the negotiated media type
+    ("accept"), or callables returning a string. By default all four, or
+    all but "user" for a `public` cache. Without "user", all the users
+    allowed to request the view get the same response.
+
+    An entry is fresh for `timeout` seconds, then served stale for
+    `stale_timeout` more seconds while a single request recomputes it. When
+    there is no entry at all, the other requests wait up to `wait_timeout`
+    seconds for the one computing it. Electing that request takes the
+    cache's `add` operation, without it every request recomputes.
+
+    The entries of a `group`, the view class by default, are invalidated all
+    at once by `invalidate_responses(group)`.
+    A `public` cache is looked up before the authentication, permissions and
+    throttles of the view, which then only run for the requests computing
+    a response.
+    """
+    timer = time.time
+    poll_interval = 0.05
+
+    def __init__(self, timeout=60, vary=None, stale_timeout=30, lock_timeout=10,
+                 wait_timeout=5, group=None, public=False) -> None:
+        if vary is None:
+            vary = PUBLIC_VARY_KEYS if public else VARY_KEYS
+        for part in vary:
+            if not callable(part) and part not in VARY_KEYS:
+                raise Exception(f"response cache can only vary by {VARY_KEYS} or callables")
+        if public and "user" in vary:
+            raise Exception("a public response cache can not vary by user")
+        self.timeout = timeout
+        self.vary = vary
+        self.stale_timeout = stale_timeout
+        self.lock_timeout = lock_timeout
+        self.wait_timeout = wait_timeout
+        self.group = group
+        self.public = public
+
+    def get_group(self, view_class):
+        return self.group or "%s.%s" % (view_class.__module__, view_class.__qualname__)
+
+    def get_vary_part(self, part):
+        if callable(part):
+            return str(part())
+        if part == "path":
+            return request.path
+        if part == "query":
+            return urlencode(sorted(request.args.items(multi=True)))
+        if part == "user":
+            user = g.get("current_user")
+            return str(user.id) if user and user.is_authenticated else ""
+        return get_renderer().media_type
+
+    def get_key(self, cache, group):
+        generation = get_generation(cache, group)
+        parts = "\n".join(self.get_vary_part(part) for part in self.vary)
+        return "response:%s:%s:%s" % (group, generation, hashlib.sha1(parts.encode("utf-8")).hexdigest())
+
+    def lock(self, cache, key):
+        """
+        Returns whether this request acquired the lock of the entry `key`,
+        `None` if the cache can not lock and every request computes it.
+        """
+        if "add" not in getattr(current_app, "CACHE_OPERATIONS", ()):
+            return None
+        return cache.add(key + ":lock", 1, timeout=self.lock_timeout)
+
+    def fetch(self, view_class, compute):
+        """
+        Returns the cached response of the request if it is fresh, else the
+        response of `compute()`, cached if it is a complete 200 response.
+        """
+        cache = getattr(current_app, "CACHE", None)
+        if cache is None:
+            return compute()
+        key = self.get_key(cache, self.get_group(view_class))
+        entry = cache.get(key)
+        if entry is not None:
+            # the lock of a stale entry is named after it, so it needs no release
+            if entry[0] > self.timer() or self.lock(cache, "%s:%r" % (key, entry[0])) is False:
+                return self.load(entry)
+            return self.store(cache, key, compute)
+        locked = self.lock(cache, key)
+        if locked is False:
+            deadline = self.timer() + self.wait_timeout
+            while self.timer() < deadline:
+                time.sleep(self.poll_interval)
+                entry = cache.get(key)
+                if entry is not None:
+                    return self.load(entry)
+        try:
+            return self.store(cache, key, compute)
+        finally:
+            # also when computing failed, the waiting requests then compute it themselves;
+            # a request that timed out waiting does not hold the lock
+            if locked and hasattr(cache, "delete"):
+                cache.delete(key + ":lock")
+
+    def store(self, cache, key, compute):
+        response = make_response(compute())
+        if response.status_code != 200 or response.is_streamed or "Set-Cookie" in response.headers:
+            return response
+        entry = (self.timer() + self.timeout, response.status_code, list(response.headers.items()), response.get_data())
+        cache.set(key, entry, timeout=self.timeout + self.stale_timeout)
+        return response
+
+    def load(self, entry):
+        _, status, headers, body = entry
+        return current_app.response_class(body, status=status, headers=headers)
+
+def generation_key(group):
+    return "response_generation:%s" % group
+
+def get_generation(cache, group):
+    """
+    Returns the generation of the cached responses of `group`.
+    """
+    key = generation_key(group)
+    generation = cache.get(key)
+    if generation is None:
+        # never invalidated or lost by the cache: the entries of any earlier generation must stay unreachable
+        generation = time.time_ns()
+        if "add" not in getattr(current_app, "CACHE_OPERATIONS", ()):
+            cache.set(key, generation)
+        elif not cache.add(key, generation):
+            generation = cache.get(key) or generation
+    return generation
+
+def invalidate_responses(group):
+    """
+    Invalidates the cached responses of `group`, a group name or a view class.
+    """
+    cache = getattr(current_app, "CACHE", None)
+    if cache is None:
+        return
+    if isinstance(group, type):
+        group = group.response_cache.get_group(group)
+    # any new value will do, so concurrent invalidations need no atomic operation
+    cache.set(generation_key(group), time.time_ns())
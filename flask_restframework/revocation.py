@@ -0,0 +1,176 @@
+import hashlib
+import math
+import os
+import struct
+import threading
+import warnings
+import weakref
+
+class BloomFilter:
+    """
+    Set of strings answering membership with no false negatives and a false
+    positive rate of `error_rate` while it holds at most `capacity` items.
+
+    It takes -capacity*ln(error_rate)/ln(2)**2 bits: for a million items at
+    a 1% error rate, 9,585,059 bits (about 1.2 MB) and 7 hash functions,
+    over the 1 MB item size limit of a default memcached.
+    """
+    header = struct.Struct(">QB")
+
+    def __init__(self, capacity=1000000, error_rate=0.01, size=None, hashes=None) -> None:
+        self.size = size or math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.hashes = hashes or max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def positions(self, item:str):
+        # double hashing: the k positions are h1 + i*h2
+        digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest()
+        h1, h2 = int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, item:str):
+        for position in self.positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item:str):
+        bits = self.bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self.positions(item))
+
+    def compatible(self, other):
+        return self.size == other.size and self.hashes == other.hashes
+
+    def merge(self, other):
+        """
+        Adds every item of `other`, which must have the same size and hashes.
+        """
+        if not self.compatible(other):
+            raise ValueError("can only merge bloom filters of the same size and hashes")
+        merged = int.from_bytes(self.bits, "little") | int.from_bytes(other.bits, "little")
+        self.bits = bytearray(merged.to_bytes(len(self.bits), "little"))
+
+    def to_bytes(self):
+        return self.header.pack(self.size, self.hashes) + bytes(self.bits)
+
+    @classmethod
+    def from_bytes(cls, data):
+        size, hashes = cls.header.unpack_from(data)
+        bloom = cls(size=size, hashes=hashes)
+        bloom.bits = bytearray(data[cls.header.size:])
+        return bloom
+
+class RevocationList:
+    """
+    Revoked JWT ids (`jti` claims) kept as a Bloom filter in process memory.
+
+    Only ids found in the filter are looked up with `check(jti)`, the
+    authoritative store; without `check` a filter hit counts as revoked, so
+    about `error_rate` of the valid tokens would be rejected.
+    The filter is rebuilt every `refresh_interval` seconds from `file` (one
+    id per line) merged with the snapshot other processes published in the
+    shared `cache`.
+    """
+    snapshot_key = 'jwt_revocation_filter'
+
+    def __init__(self, capacity=1000000, error_rate=0.01, check=None, file=None, cache=None,
+                 cache_operations=frozenset(), refresh_interval=60) -> None:
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.check = check
+        self.file = file
+        self.cache = cache
+        self.cache_operations = cache_operations
+        self.refresh_interval = refresh_interval
+        self.filter = BloomFilter(capacity, error_rate)
+        self.refresh()
+        self.stopped = threading.Event()
+        self.refresher = None
+        if refresh_interval and (file or cache is not None):
+            self.start_refresher()
+            reference = weakref.ref(self)
+            def restart():
+                # threads do not survive fork, workers of a preloaded app need their own
+                revocation = reference()
+                if revocation is not None and not revocation.stopped.is_set():
+                    revocation.start_refresher()
+            os.register_at_fork(after_in_child=restart)
+
+    def start_refresher(self):
+        self.refresher = threading.Thread(target=self.watch, name="jwt-revocation-refresher", daemon=True)
+        self.refresher.start()
+
+    def watch(self):
+        while not self.stopped.wait(self.refresh_interval):
+            try:
+                self.refresh()
+            except Exception as e:
+                # keep the current filter until the sources are readable again
+                warnings.warn(f"jwt revocation list refresh failed: {e}")
+
+    def stop(self):
+        self.stopped.set()
+
+    def load_snapshot(self):
+        if self.cache is None:
+            return None, None
+        data = self.cache.get(self.snapshot_key)
+        if not data:
+            return None, data
+        snapshot = BloomFilter.from_bytes(data)
+        if not snapshot.compatible(self.filter):
+            warnings.warn("jwt revocation snapshot ignored, it was built with an other capacity or error rate")
+            return None, data
+        return snapshot, data
+
+    def refresh(self):
+        """
+        Rebuilds the filter from the file and the shared snapshot.
+        """
+        bloom = BloomFilter(capacity=self.capacity, error_rate=self.error_rate)
+        if self.file:
+            with open(self.file, encoding="utf-8") as f:
+                for line in f:
+                    jti = line.strip()
+                    if jti:
+                        bloom.add(jti)
+        snapshot, _ = self.load_snapshot()
+        if snapshot is not None:
+            bloom.merge(snapshot)
+        # readers keep using the old filter until the new one is complete
+        self.filter = bloom
+
+    def revoke(self, jti:str):
+        """
+        Adds `jti` to the filter of this process and to the shared snapshot.
+        Recording it in the authoritative store is up to the caller.
+        """
+        self.filter.add(jti)
+        if self.cache is None:
+            return
+        for _ in range(10):
+            snapshot, data = self.load_snapshot()
+            if snapshot is not None:
+                self.filter.merge(snapshot)
+            value = self.filter.to_bytes()
+            if data is None and "add" in self.cache_operations:
+                if self.cache.add(self.snapshot_key, value):
+                    return
+            elif data is not None and "cas" in self.cache_operations:
+                if self.cache.cas(self.snapshot_key, data, value):
+                    return
+            else:
+                # not atomic: a concurrent revoke may be lost until the next refresh from the file
+                self.cache.set(self.snapshot_key, value)
+                return
+            if self.cache.get(self.snapshot_key) == data:
+                # nobody else wrote it, the cache refused the value itself
+                raise Exception(
+                    "jwt revocation snapshot of %d bytes could not be stored in the cache, check its item size "
+                    "limit (1 MB by default for memcached) or lower the revocation capacity" % len(value))
+        raise Exception("jwt revocation snapshot kept changing, could not publish %s" % jti)
+
+    def is_revoked(self, jti:str):
+        if jti not in self.filter:
+            return False
+        if self.check is None:
+            return True
+        return bool(self.check(jti))
@@ -1,12 +1,29 @@
 from .base_test import BaseTest,BaseFuncTest
 from unittest import mock
-from .authentication import BasicAuthentication, JWTAuthentication
+from .authentication import BaseAuthentication, BasicAuthentication, JWTAuthentication, index_authenticators, \
+    VerifiedTokenCache
+from .caches import LRUCache
 from .exceptions import AuthenticationFailed, ConfigureError
 from . import RestFramework
 import base64
+import json
 import jwt
+import multiprocessing
+import os
+import tempfile
+import time
+import unittest
 from flask import g
 
+class CountingUser:
+    built = 0
+
+    def __init__(self, id, **kwargs) -> None:
+        CountingUser.built += 1
+        self.id = id
+        self.name = "user " + id
+        self.is_authenticated = True
+
 class TestBasicAuthentication(BaseFuncTest):
 
     @mock.patch("flask_restframework.authentication.request",headers={"Authorization":""})
@@ -104,4 +121,250 @@ class TestJWTAuthentication(BaseFuncTest):
         rf.init_app(self.app)
         jwt_auth = JWTAuthentication()
         jwt_auth.authenticate()
-        self.assertTrue(hasattr(g,"current_user"))
\ No newline at end of file
+        self.assertTrue(hasattr(g,"current_user"))
+
+class TestCredentialCache(BaseFuncTest):
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.app.config['FLASK_RESTFRAMEWORK_BASIC_AUTH_CACHE'] = True
+        RestFramework(self.app)
+        self.passwords = {"waro163":"passwd123"}
+        self.checks = 0
+        test = self
+        class PasswordAuthentication(BasicAuthentication):
+            def check_auth_inf(self, *args, **kwargs):
+                test.checks += 1
+                if test.passwords.get(kwargs["id"]) != kwargs["password"]:
+                    return False, "wrong password"
+                return True, ""
+        self.authentication_class = PasswordAuthentication
+
+    def authenticate(self, credentials):
+        with mock.patch("flask_restframework.authentication.request") as mock_header:
+            mock_header.headers = {"Authorization":"basic "+base64.b64encode(credentials).decode('utf-8')}
+            return self.authentication_class().authenticate()
+
+    def test_checked_once(self):
+        for i in range(3):
+            usr, inf = self.authenticate(b"waro163:passwd123")
+            self.assertEqual(usr.id, "waro163")
+        self.assertEqual(self.checks, 1)
+        self.assertEqual(self.app.BASIC_AUTH_CACHE.stats()["hits"], 2)
+
+    def test_negative_cache(self):
+        for i in range(3):
+            with self.assertRaises(AuthenticationFailed):
+                self.authenticate(b"waro163:guess")
+        self.assertEqual(self.checks, 1)
+        with mock.patch.object(LRUCache, "timer", return_value=time.time()+5):
+            with self.assertRaises(AuthenticationFailed):
+                self.authenticate(b"waro163:guess")
+        self.assertEqual(self.checks, 2)
+
+    def test_invalidate_on_password_change(self):
+        self.authenticate(b"waro163:passwd123")
+        self.passwords["waro163"] = "rotated"
+        self.authenticate(b"waro163:passwd123")
+        BasicAuthentication.invalidate_credentials("waro163")
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(b"waro163:passwd123")
+        usr, inf = self.authenticate(b"waro163:rotated")
+        self.assertEqual(usr.id, "waro163")
+
+    def test_shared_invalidation(self):
+        from .test_throttling import MockCache
+        from .authentication import CredentialCache
+        cache = MockCache()
+        worker_a, worker_b = CredentialCache(cache=cache), CredentialCache(cache=cache)
+        key = worker_b.key(self, "waro163", "passwd123")
+        worker_b.set(key, (True, ""))
+        worker_a.invalidate("waro163")
+        self.assertIsNone(worker_b.get(worker_b.key(self, "waro163", "passwd123")))
+
+    def test_lost_generation_does_not_revive_entries(self):
+        from .test_throttling import MockCache, SharedCache
+        from .authentication import CredentialCache
+        for cache, operations in ((MockCache(), frozenset()), (SharedCache(), frozenset(["add"]))):
+            worker_a = CredentialCache(cache=cache, cache_operations=operations)
+            worker_b = CredentialCache(cache=cache, cache_operations=operations)
+            worker_b.set(worker_b.key(self, "waro163", "passwd123"), (True, ""))
+            worker_a.invalidate("waro163")
+            # evicted by the cache
+            cache.data.clear()
+            self.assertIsNone(worker_b.get(worker_b.key(self, "waro163", "passwd123")))
+            worker_b.set(worker_b.key(self, "waro163", "rotated"), (True, ""))
+            self.assertIsNotNone(worker_b.get(worker_b.key(self, "waro163", "rotated")))
+
+class TestLazyUser(BaseFuncTest):
+
+    def setUp(self) -> None:
+        super().setUp()
+        CountingUser.built = 0
+        self.app.config['FLASK_RESTFRAMEWORK_USER_CLASS'] = "flask_restframework.test_authentication.CountingUser"
+        self.app.config['FLASK_RESTFRAMEWORK_LAZY_USER'] = True
+
+    def authenticate(self):
+        with mock.patch("flask_restframework.authentication.request") as mock_header:
+            mock_header.headers = {"Authorization":"basic "+base64.b64encode(b"waro163:passwd123").decode('utf-8')}
+            return BasicAuthentication().authenticate()
+
+    def test_built_on_first_access(self):
+        RestFramework(self.app)
+        usr, inf = self.authenticate()
+        self.assertEqual(usr.id, "waro163")
+        self.assertTrue(usr.is_authenticated)
+        self.assertEqual(CountingUser.built, 0)
+        self.assertEqual(usr.name, "user waro163")
+        self.assertEqual(usr.name, "user waro163")
+        self.assertEqual(CountingUser.built, 1)
+        with self.assertRaises(AttributeError):
+            usr.missing
+
+    def test_memoized_per_id(self):
+        self.app.config['FLASK_RESTFRAMEWORK_USER_CACHE_SIZE'] = 16
+        RestFramework(self.app)
+        for i in range(3):
+            usr, inf = self.authenticate()
+            self.assertEqual(usr.name, "user waro163")
+        self.assertEqual(CountingUser.built, 1)
+
+class TestVerifiedTokenCache(BaseFuncTest):
+    jwt_secret = "hard_to_guess_secret"
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.app.config['JWT_SECRET'] = self.jwt_secret
+        self.app.config['FLASK_RESTFRAMEWORK_JWT_CACHE'] = "local"
+        rf = RestFramework()
+        rf.init_app(self.app)
+
+    def authenticate(self, token):
+        with mock.patch("flask_restframework.authentication.request") as mock_header:
+            mock_header.headers = {"Authorization":"bearer "+token}
+            return JWTAuthentication().authenticate()
+
+    def test_verified_once(self):
+        token = jwt.encode({"id": "1234abcd","exp":int(time.time())+60}, self.jwt_secret, algorithm="HS256")
+        with mock.patch("flask_restframework.authentication.jwt.decode", wraps=jwt.decode) as decode:
+            for i in range(3):
+                usr, payload = self.authenticate(token)
+                self.assertEqual(usr.id, "1234abcd")
+            self.assertEqual(decode.call_count, 1)
+        self.assertEqual(self.app.JWT_CACHE.stats()["hits"], 2)
+        self.assertEqual(self.app.JWT_CACHE.stats()["misses"], 1)
+
+    def test_never_outlives_exp(self):
+        exp = int(time.time())+60
+        token = jwt.encode({"id": "1234abcd","exp":exp}, self.jwt_secret, algorithm="HS256")
+        self.authenticate(token)
+        self.assertIsNotNone(self.app.JWT_CACHE.get(token))
+        with mock.patch.object(self.app.JWT_CACHE.local, "timer", return_value=exp):
+            self.assertIsNone(self.app.JWT_CACHE.get(token))
+
+    def test_shared(self):
+        from .test_throttling import MockCache
+        cache = MockCache()
+        token = jwt.encode({"id": "1234abcd"}, self.jwt_secret, algorithm="HS256")
+        VerifiedTokenCache(cache=cache).set(token, {"id": "1234abcd"})
+        # an other process only finds it in the shared cache
+        self.assertEqual(VerifiedTokenCache(cache=cache).get(token), {"id": "1234abcd"})
+        self.assertIsNone(VerifiedTokenCache().get(token))
+
+def reloader_alive(keyring, results):
+    results.put(keyring.reloader.is_alive())
+
+class TestKeyring(BaseFuncTest):
+    old_secret = "hard_to_guess_secret_of_32_bytes"
+    new_secret = "rotated_hard_to_guess_secret_!!!"
+
+    def authenticate(self, token):
+        with mock.patch("flask_restframework.authentication.request") as mock_header:
+            mock_header.headers = {"Authorization":"bearer "+token}
+            return JWTAuthentication().authenticate()
+
+    def jwk(self, kid, secret):
+        return {"kty":"oct","kid":kid,"alg":"HS256",
+                "k":base64.urlsafe_b64encode(secret.encode()).decode().rstrip("=")}
+
+    def test_kid_lookup(self):
+        self.app.config['FLASK_RESTFRAMEWORK_JWT_KEYS'] = [
+            {"kid":"old","key":self.old_secret,"algorithms":["HS256"]},
+            {"kid":"new","key":self.new_secret,"algorithms":["HS512"]},
+        ]
+        RestFramework(self.app)
+        token = jwt.encode({"id":"1234abcd"}, self.old_secret, algorithm="HS256", headers={"kid":"old"})
+        usr, payload = self.authenticate(token)
+        self.assertEqual(usr.id, "1234abcd")
+        # signed with the right key but an algorithm the key does not allow
+        token = jwt.encode({"id":"1234abcd"}, self.new_secret, algorithm="HS256", headers={"kid":"new"})
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(token)
+        token = jwt.encode({"id":"1234abcd"}, self.new_secret, algorithm="HS512", headers={"kid":"unknown"})
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(token)
+
+    def test_jwks_reload(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "jwks.json")
+            with open(path, "w") as f:
+                json.dump({"keys":[self.jwk("old", self.old_secret)]}, f)
+            self.app.config['FLASK_RESTFRAMEWORK_JWKS_FILE'] = path
+            self.app.config['FLASK_RESTFRAMEWORK_JWKS_RELOAD_INTERVAL'] = None
+            RestFramework(self.app)
+            new_token = jwt.encode({"id":"1234abcd"}, self.new_secret, algorithm="HS256", headers={"kid":"new"})
+            with self.assertRaises(AuthenticationFailed):
+                self.authenticate(new_token)
+
+            with open(path, "w") as f:
+                json.dump({"keys":[self.jwk("new", self.new_secret)]}, f)
+            os.utime(path, (time.time()+1, time.time()+1))
+            self.assertTrue(self.app.JWT_KEYRING.reload())
+            usr, payload = self.authenticate(new_token)
+            self.assertEqual(usr.id, "1234abcd")
+            self.assertFalse(self.app.JWT_KEYRING.reload())
+
+    def test_reloader_restarted_in_forked_child(self):
+        from .keyring import Keyring
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "jwks.json")
+            with open(path, "w") as f:
+                json.dump({"keys":[self.jwk("old", self.old_secret)]}, f)
+            keyring = Keyring(jwks_file=path, reload_interval=60)
+            self.addCleanup(keyring.stop)
+            context = multiprocessing.get_context("fork")
+            results = context.Queue()
+            child = context.Process(target=reloader_alive, args=(keyring, results))
+            child.start()
+            self.assertTrue(results.get(timeout=10))
+            child.join()
+
+    def test_rs256_key_parsed_once(self):
+        try:
+            from cryptography.hazmat.primitives import serialization
+            from cryptography.hazmat.primitives.asymmetric import rsa
+        except ImportError:
+            raise unittest.SkipTest("cryptography is not installed")
+        private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        public_pem = private_key.public_key().public_bytes(
+            serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo).decode()
+        self.app.config['FLASK_RESTFRAMEWORK_JWT_KEYS'] = [{"kid":"rsa","key":public_pem,"algorithms":["RS256"]}]
+        RestFramework(self.app)
+        self.assertIsInstance(self.app.JWT_KEYRING.get("rsa").key, rsa.RSAPublicKey)
+        token = jwt.encode({"id":"1234abcd"}, private_key, algorithm="RS256", headers={"kid":"rsa"})
+        usr, payload = self.authenticate(token)
+        self.assertEqual(usr.id, "1234abcd")
+
+class TestIndexAuthenticators(BaseFuncTest):
+
+    def test_index(self):
+        class APIKeyAuthentication(BaseAuthentication):
+            def authenticate(self):
+                return None
+        class CustomBasicAuthentication(BasicAuthentication):
+            def authenticate(self):
+                return None
+        basic, jwt_auth, api_key, custom = BasicAuthentication(), JWTAuthentication(), APIKeyAuthentication(), CustomBasicAuthentication()
+        schemes, fallback = index_authenticators([api_key, basic, jwt_auth, custom])
+        self.assertEqual(schemes, {b"basic":[basic], b"bearer":[jwt_auth]})
+        self.assertEqual(fallback, [api_key, custom])
@@ -0,0 +1,98 @@
+import unittest
+from unittest import mock
+import threading
+from .caches import LRUCache, LocalCache
+
+class TestLRUCache(unittest.TestCase):
+
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(max_entries=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        self.assertEqual(cache.get("a"), 1)
+        cache.set("c", 3)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), 1)
+        self.assertEqual(cache.get("c"), 3)
+
+    def test_evicts_by_size(self):
+        cache = LRUCache(max_entries=10, max_bytes=100)
+        cache.set("a", 1, size=60)
+        cache.set("b", 2, size=60)
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.stats()["bytes"], 60)
+        cache.set("c", 3, size=200)
+        self.assertIsNone(cache.get("c"))
+
+    def test_expires(self):
+        cache = LRUCache()
+        with mock.patch.object(LRUCache, "timer", return_value=1000.0):
+            cache.set("a", 1, expires=1010.0)
+            self.assertEqual(cache.get("a"), 1)
+        with mock.patch.object(LRUCache, "timer", return_value=1010.0):
+            self.assertIsNone(cache.get("a"))
+        self.assertEqual(len(cache), 0)
+        # an absolute expiry is never taken for a relative timeout
+        with self.assertRaises(TypeError):
+            cache.set("a", 1, 60)
+
+class TestLocalCache(unittest.TestCase):
+
+    def test_timeout(self):
+        cache = LocalCache(default_timeout=60)
+        with mock.patch.object(LocalCache, "timer", return_value=1000.0):
+            cache.set("a", 1, timeout=10)
+            cache.set("b", 2)
+            cache.set("c", 3, timeout=0)
+        with mock.patch.object(LocalCache, "timer", return_value=1010.0):
+            self.assertIsNone(cache.get("a"))
+            self.assertEqual(cache.get("b"), 2)
+        with mock.patch.object(LocalCache, "timer", return_value=1060.0):
+            self.assertIsNone(cache.get("b"))
+            self.assertEqual(cache.get("c"), 3)
+
+    def test_atomic_operations(self):
+        cache = LocalCache()
+        self.assertIsNone(cache.incr("n"))
+        self.assertTrue(cache.add("n", 1, timeout=10))
+        self.assertFalse(cache.add("n", 5))
+        self.assertEqual(cache.incr("n", 2), 3)
+        self.assertFalse(cache.cas("n", 1, 10))
+        self.assertTrue(cache.cas("n", 3, 10, timeout=10))
+        self.assertEqual(cache.get("n"), 10)
+        self.assertTrue(cache.cas("missing", None, [1.0]))
+        with mock.patch.object(LocalCache, "timer", return_value=LocalCache.timer() + 11):
+            self.assertIsNone(cache.incr("n"))
+            self.assertTrue(cache.add("n", 1))
+
+    def test_evicts_least_recently_used(self):
+        cache = LocalCache(max_entries=2, stripes=1)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        self.assertEqual(cache.get("a"), 1)
+        cache.set("c", 3)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), 1)
+
+    def test_memory_bound(self):
+        cache = LocalCache(max_bytes=64*1024, stripes=4)
+        for i in range(1000):
+            cache.set("key%d" % i, [float(i)] * 10)
+        self.assertLessEqual(cache.stats()["bytes"], 64*1024)
+        self.assertLess(len(cache), 1000)
+        self.assertEqual(cache.get("key999"), [999.0] * 10)
+        cache.set("huge", [0.0] * 10000)
+        self.assertIsNone(cache.get("huge"))
+
+    def test_concurrent_incr(self):
+        cache = LocalCache()
+        cache.add("n", 0)
+        def run():
+            for _ in range(1000):
+                cache.incr("n")
+        threads = [threading.Thread(target=run) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(cache.get("n"), 8000)
@@ -1,6 +1,7 @@
 from .base_test import BaseTest, BaseFuncTest
 from . import RestFramework
 from .throttling import BaseThrottle
+from .test_throttling import MockCache, SharedCache
 
 class TestInitApp(BaseFuncTest):
     
@@ -23,4 +24,18 @@ class TestInitApp(BaseFuncTest):
         rf = RestFramework()
         rf.init_app(self.app)
         self.assertTrue(hasattr(self.app,"THROTTLE_HANDLERS"))
-        self.assertEqual(self.app.THROTTLE_HANDLERS, [{"class":BaseThrottle,"rate":"2/minute"}])
\ No newline at end of file
+        self.assertEqual(self.app.THROTTLE_HANDLERS, [{"class":BaseThrottle,"rate":"2/minute"}])
+
+    def test_init_cache_operations(self):
+        rf = RestFramework()
+        rf.init_app(self.app, MockCache())
+        self.assertEqual(self.app.CACHE_OPERATIONS, frozenset())
+        rf.init_app(self.app, SharedCache())
+        self.assertEqual(self.app.CACHE_OPERATIONS, frozenset(["add", "incr", "cas"]))
+
+    def test_init_cache_operation_not_callable(self):
+        cache = MockCache()
+        cache.incr = 1
+        rf = RestFramework()
+        with self.assertRaises(Exception):
+            rf.init_app(self.app, cache)
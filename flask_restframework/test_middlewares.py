@@ -0,0 +1,57 @@
+import gzip
+import json
+import zlib
+from flask import Response, stream_with_context
+from .base_test import BaseFuncTest
+from .middlewares import CompressionMiddleware
+
+class TestCompressionMiddleware(BaseFuncTest):
+
+    def setUp(self) -> None:
+        super().setUp()
+        CompressionMiddleware(self.app, minimum_size=100)
+        self.items = [{"id": i, "name": "item %d" % i} for i in range(200)]
+        self.chunks = []
+        def stream():
+            def generate():
+                for i in range(0, len(self.items), 50):
+                    chunk = json.dumps(self.items[i:i+50]).encode("utf-8")
+                    self.chunks.append(chunk)
+                    yield chunk
+            return Response(stream_with_context(generate()), mimetype="application/json")
+        self.app.add_url_rule("/items", "items", lambda: {"results": self.items})
+        self.app.add_url_rule("/small", "small", lambda: {"id": 1})
+        self.app.add_url_rule("/text", "text", lambda: Response("x" * 1000, mimetype="application/octet-stream"))
+        self.app.add_url_rule("/stream", "stream", stream)
+
+    def test_negotiation(self):
+        response = self.client.get("/items", headers={"Accept-Encoding": "gzip, deflate"})
+        self.assertEqual(response.headers["Content-Encoding"], "gzip")
+        self.assertEqual(response.headers["Vary"], "Accept-Encoding")
+        self.assertEqual(json.loads(gzip.decompress(response.data)), {"results": self.items})
+        self.assertEqual(int(response.headers["Content-Length"]), len(response.data))
+        response = self.client.get("/items", headers={"Accept-Encoding": "gzip;q=0.5, deflate"})
+        self.assertEqual(response.headers["Content-Encoding"], "deflate")
+        self.assertEqual(json.loads(zlib.decompress(response.data)), {"results": self.items})
+        response = self.client.get("/items", headers={"Accept-Encoding": "identity"})
+        self.assertNotIn("Content-Encoding", response.headers)
+        response = self.client.get("/items")
+        self.assertNotIn("Content-Encoding", response.headers)
+
+    def test_threshold_and_mimetypes(self):
+        for url in ("/small", "/text"):
+            response = self.client.get(url, headers={"Accept-Encoding": "gzip"})
+            self.assertNotIn("Content-Encoding", response.headers)
+
+    def test_stream_compressed_by_chunk(self):
+        response = self.client.get("/stream", headers={"Accept-Encoding": "gzip"}, buffered=False)
+        self.assertEqual(response.headers["Content-Encoding"], "gzip")
+        self.assertNotIn("Content-Length", response.headers)
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        iterator = iter(response.response)
+        first = decompressor.decompress(next(iterator))
+        # the first chunk can be decoded before the next one is even produced
+        self.assertEqual((first, len(self.chunks)), (self.chunks[0], 1))
+        rest = b"".join(decompressor.decompress(data) for data in iterator)
+        self.assertEqual(first + rest, b"".join(self.chunks))
+        response.close()
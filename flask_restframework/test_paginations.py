@@ -0,0 +1,235 @@
+from flask import Flask
+import unittest
+from . import RestFramework
+from .paginations import BasePagination, CursorPagination, query_version
+from .test_throttling import MockCache
+
+try:
+    from flask_sqlalchemy import SQLAlchemy
+    from sqlalchemy import event
+except ImportError:
+    SQLAlchemy = None
+
+@unittest.skipIf(SQLAlchemy is None, "flask_sqlalchemy is not installed")
+class PaginationTest(unittest.TestCase):
+    rows = 23
+
+    def setUp(self) -> None:
+        self.app = Flask(__name__)
+        self.app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+        self.app.secret_key = "hard_to_guess_secret"
+        db = self.db = SQLAlchemy(self.app)
+
+        class Item(db.Model):
+            id = db.Column(db.Integer, primary_key=True)
+            name = db.Column(db.String(20))
+            group = db.Column(db.Integer, index=True)
+
+            def to_json(self):
+                return {"id":self.id, "name":self.name, "group":self.group}
+
+        self.Item = Item
+        self.context = self.app.app_context()
+        self.context.push()
+        db.create_all()
+        db.session.add_all([Item(id=i, name="item %d" % i, group=i % 3) for i in range(1, self.rows+1)])
+        db.session.commit()
+
+        self.count_queries = 0
+        self.statements = []
+        def count_queries(conn, cursor, statement, *args):
+            self.statements.append(statement)
+            if "count(" in statement.lower():
+                self.count_queries += 1
+        event.listen(db.engine, "before_cursor_execute", count_queries)
+        return super().setUp()
+
+    def tearDown(self) -> None:
+        self.db.session.remove()
+        self.context.pop()
+        return super().tearDown()
+
+    def paginate(self, pagination_class, url):
+        with self.app.test_request_context(url):
+            return pagination_class(self.Item.query).to_json()
+
+class TestCountStrategy(PaginationTest):
+
+    def pagination_class(self, strategy):
+        class Pagination(BasePagination):
+            count_strategy = strategy
+        return Pagination
+
+    def test_exact(self):
+        page = self.paginate(self.pagination_class("exact"), "/items?page=2")
+        self.assertEqual((page["count"], page["count_exact"]), (self.rows, True))
+        self.assertEqual(self.count_queries, 1)
+
+    def test_none(self):
+        page = self.paginate(self.pagination_class("none"), "/items?page=2")
+        self.assertEqual((page["count"], page["count_exact"]), (None, False))
+        self.assertEqual([item["id"] for item in page["results"]], [6, 7, 8, 9, 10])
+        self.assertTrue(page["next"].endswith("page=3"))
+        # the last page knows its total without counting
+        page = self.paginate(self.pagination_class("none"), "/items?page=5")
+        self.assertEqual((page["count"], page["count_exact"]), (self.rows, True))
+        self.assertIsNone(page["next"])
+        self.assertEqual(self.count_queries, 0)
+
+    def test_cached(self):
+        RestFramework(self.app, MockCache())
+        for strategy in ("cached", "estimated"):
+            for url in ("/items?page=1", "/items?page=2&page_size=5"):
+                page = self.paginate(self.pagination_class(strategy), url)
+                self.assertEqual((page["count"], page["count_exact"]), (self.rows, False))
+        # sqlite has no planner estimate, estimated falls back to the cached count
+        self.assertEqual(self.count_queries, 1)
+
+    def test_out_of_range_args(self):
+        class Pagination(BasePagination):
+            count_strategy = "none"
+        self.app.add_url_rule("/items", "items", lambda: Pagination(self.Item.query, stream=True).stream())
+        client = self.app.test_client()
+        for strategy in ("exact", "none"):
+            for url in ("/items?page=0", "/items?page=-1", "/items?page_size=0&page=1"):
+                page = self.paginate(self.pagination_class(strategy), url)
+                self.assertEqual([item["id"] for item in page["results"]], [1, 2, 3, 4, 5], url)
+                self.assertIsNone(page["previous"], url)
+                self.assertTrue(page["next"].endswith("page=2"), url)
+                if strategy == "none":
+                    self.assertEqual(client.get(url).get_json(), page)
+
+class TestQueryVersion(PaginationTest):
+
+    def test_changes_with_rows(self):
+        query = self.Item.query.filter(self.Item.group == 1).order_by(self.Item.id)
+        version = query_version(query, self.Item.id)
+        self.assertEqual(version, "8:22")
+        self.db.session.delete(self.db.session.get(self.Item, 1))
+        self.db.session.commit()
+        self.assertEqual(query_version(query, self.Item.id), "7:22")
+
+class TestStreamingPagination(PaginationTest):
+
+    def test_stream_matches_to_json(self):
+        class Pagination(BasePagination):
+            count_strategy = "none"
+            stream_batch_size = 2
+
+        self.app.add_url_rule("/items", "items", lambda: Pagination(self.Item.query, stream=True).stream())
+        client = self.app.test_client()
+        for url in ("/items?page_size=7", "/items?page_size=7&page=2", "/items?page_size=7&page=4", "/items?page=9"):
+            response = client.get(url)
+            self.assertTrue(response.is_streamed)
+            self.assertEqual(response.mimetype, "application/json")
+            self.assertEqual(response.get_json(), self.paginate(Pagination, url))
+
+    def test_stream_negotiated_format(self):
+        from .messagepack import unpackb
+        from .views import APIView
+        class Pagination(BasePagination):
+            count_strategy = "none"
+            stream_batch_size = 2
+        Item = self.Item
+        class ItemView(APIView):
+            def get(self):
+                return Pagination(Item.query, stream=True).stream()
+        RestFramework(self.app)
+        self.app.add_url_rule("/items", view_func=ItemView.as_view("items"))
+        response = self.app.test_client().get("/items?page_size=7&page=2", headers={"Accept": "application/msgpack"})
+        self.assertEqual(response.mimetype, "application/msgpack")
+        self.assertEqual(unpackb(response.data), self.paginate(Pagination, "/items?page_size=7&page=2"))
+
+class TestSparseFields(PaginationTest):
+
+    def test_emitted_keys(self):
+        page = self.paginate(BasePagination, "/items?fields=id,name")
+        self.assertEqual(page["results"][0], {"id":1, "name":"item 1"})
+
+    def test_allowed_fields(self):
+        from .exceptions import ValidationError
+        class Pagination(BasePagination):
+            allowed_fields = ("id", "name")
+        with self.assertRaises(ValidationError):
+            self.paginate(Pagination, "/items?fields=id,group")
+
+    def test_bulk_serializer(self):
+        calls = []
+        def serializer(items, fields):
+            calls.append((len(items), fields))
+            return [{field: getattr(item, field) for field in fields or ("id",)} for item in items]
+        class Pagination(BasePagination):
+            count_strategy = "none"
+        Pagination.serializer = staticmethod(serializer)
+        page = self.paginate(Pagination, "/items?fields=name")
+        self.assertEqual(page["results"][0], {"name":"item 1"})
+        self.assertEqual(calls, [(5, ["name"])])
+        # only the requested columns (and the primary key) are selected
+        self.assertNotIn("group", self.statements[-1])
+
+        class Cursor(CursorPagination):
+            ordering = ("-group", "-id")
+        Cursor.serializer = staticmethod(serializer)
+        page = self.paginate(Cursor, "/items?fields=name")
+        page = self.paginate(Cursor, page["next"][len("http://localhost"):])
+        self.assertEqual(page["results"][0], {"name":"item 8"})
+
+    def test_streamed_in_batches(self):
+        calls = []
+        def serializer(items, fields):
+            calls.append(len(items))
+            return [item.to_json() for item in items]
+        class Pagination(BasePagination):
+            count_strategy = "none"
+            stream_batch_size = 3
+        Pagination.serializer = staticmethod(serializer)
+        self.app.add_url_rule("/items", "items", lambda: Pagination(self.Item.query, stream=True).stream())
+        response = self.app.test_client().get("/items?page_size=7")
+        self.assertEqual(len(response.get_json()["results"]), 7)
+        self.assertEqual(calls, [3, 3, 1])
+
+class TestCursorPagination(PaginationTest):
+
+    def walk(self, pagination_class, url, link):
+        pages = []
+        while url:
+            page = self.paginate(pagination_class, url)
+            pages.append([item["id"] for item in page["results"]])
+            url = page[link]
+        return pages
+
+    def test_forward_and_backward(self):
+        pages = self.walk(CursorPagination, "/items?page_size=5", "next")
+        self.assertEqual([len(page) for page in pages], [5, 5, 5, 5, 3])
+        self.assertEqual(sum(pages, []), list(range(1, self.rows+1)))
+
+        last = self.paginate(CursorPagination, "/items?page_size=5")
+        for i in range(4):
+            last = self.paginate(CursorPagination, last["next"])
+        self.assertIsNone(last["next"])
+        backward = self.walk(CursorPagination, last["previous"], "previous")
+        self.assertEqual(backward, pages[-2::-1])
+
+    def test_descending_tuple_ordering(self):
+        class GroupPagination(CursorPagination):
+            ordering = ("-group", "-id")
+        pages = self.walk(GroupPagination, "/items?page_size=4", "next")
+        expected = sorted(range(1, self.rows+1), key=lambda i: (i % 3, i), reverse=True)
+        self.assertEqual(sum(pages, []), expected)
+
+    def test_tampered_cursor(self):
+        from .exceptions import NotFound
+        page = self.paginate(CursorPagination, "/items")
+        with self.assertRaises(NotFound):
+            self.paginate(CursorPagination, page["next"][:-2] + "xx")
+
+    def test_cursor_of_other_ordering(self):
+        from .exceptions import NotFound
+        class GroupPagination(CursorPagination):
+            ordering = ("group", "id")
+        page = self.paginate(CursorPagination, "/items")
+        with self.assertRaises(NotFound):
+            self.paginate(GroupPagination, page["next"])
+        page = self.paginate(GroupPagination, "/items")
+        with self.assertRaises(NotFound):
+            self.paginate(CursorPagination, page["next"])
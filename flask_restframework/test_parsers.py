@@ -0,0 +1,66 @@
+import unittest
+from . import messagepack
+from .exceptions import ParseError, UnsupportedMediaType
+from .parsers import JSONParser, MessagePackParser, select_parser
+
+class TestMessagePack(unittest.TestCase):
+
+    def test_round_trip(self):
+        for value in (None, True, False, 0, 127, 128, -1, -32, -33, 255, 65536, 2**40, -2**40, 1.5,
+                      "", "é" * 40, "x" * 70000, b"\x00\xff", [], list(range(20)), {"a": [1, {"b": None}]},
+                      {str(i): i for i in range(20)}):
+            self.assertEqual(messagepack.unpackb(messagepack.packb(value)), value)
+
+    def test_known_encoding(self):
+        # examples of the MessagePack specification
+        self.assertEqual(messagepack.packb({"compact": True, "schema": 0}),
+                         b"\x82\xa7compact\xc3\xa6schema\x00")
+
+    def test_malformed(self):
+        for data in (b"\x92\x01", b"\xc1", b"\x01\x02", b"\xa3ab"):
+            with self.assertRaises(ValueError):
+                messagepack.unpackb(data)
+        with self.assertRaises(ValueError):
+            messagepack.unpackb(b"\x91" * 10 + b"\x00", max_depth=5)
+
+class TestParsers(unittest.TestCase):
+
+    def test_select_parser(self):
+        parsers = [JSONParser(), MessagePackParser()]
+        self.assertIs(select_parser(parsers, "application/json"), parsers[0])
+        self.assertIs(select_parser(parsers, "application/x-msgpack"), parsers[1])
+        with self.assertRaises(UnsupportedMediaType):
+            select_parser(parsers, "text/plain")
+
+    def test_parse_error(self):
+        with self.assertRaises(ParseError):
+            JSONParser().parse(b'{"a":')
+        with self.assertRaises(ParseError):
+            MessagePackParser().parse(b"\x92\x01")
+
+class TestJSONArrayReader(unittest.TestCase):
+
+    def iter_items(self, data, **kwargs):
+        import io
+        return list(JSONParser().iter_items(io.BytesIO(data), **kwargs))
+
+    def test_items_across_chunks(self):
+        import json
+        items = [{"id": i, "name": "é" * (i % 7), "values": [1.5, None, True]} for i in range(300)] + [1234567, "end"]
+        data = json.dumps(items).encode("utf-8")
+        for chunk_size in (1, 5, 4096):
+            self.assertEqual(self.iter_items(data, chunk_size=chunk_size), items)
+        self.assertEqual(self.iter_items(b" [ ] "), [])
+
+    def test_malformed(self):
+        for data in (b"", b"{}", b"[1,]", b"[1 2]", b"[1", b"[1]x", b'[{"a":}]'):
+            with self.assertRaises(ParseError):
+                self.iter_items(data, chunk_size=2)
+
+    def test_limits(self):
+        from .exceptions import PayloadTooLarge
+        with self.assertRaises(PayloadTooLarge):
+            self.iter_items(b'[1,"' + b"x" * 1000 + b'"]', max_item_size=100, chunk_size=10)
+        self.assertEqual(self.iter_items(b"[[[1]]]", max_depth=3), [[[1]]])
+        with self.assertRaises(ParseError):
+            self.iter_items(b"[[[[1]]]]", max_depth=3)
@@ -0,0 +1,102 @@
+import datetime
+import decimal
+import json
+import uuid
+import unittest
+from .base_test import BaseFuncTest
+from . import RestFramework
+from . import renderers
+from .renderers import JSONRenderer, OrjsonRenderer, UjsonRenderer, get_renderer_class
+
+class TestRenderers(unittest.TestCase):
+    data = {
+        "count": 2,
+        "next": None,
+        "results": [
+            {"id": 1, "name": "café", "price": decimal.Decimal("9.90"), "ratio": 0.5, "active": True,
+             "created": datetime.datetime(2021, 9, 1, 12, 30), "uuid": uuid.UUID(int=1), "tags": ["a", "b"]},
+            {"id": 2, "name": "tea", "price": decimal.Decimal("3"), "ratio": 1.0, "active": False,
+             "created": datetime.date(2021, 9, 2), "uuid": uuid.UUID(int=2), "tags": []},
+        ],
+    }
+
+    def test_backends_render_the_same_document(self):
+        expected = json.loads(JSONRenderer().render(self.data))
+        self.assertEqual(expected["results"][0]["created"], "Wed, 01 Sep 2021 12:30:00 GMT")
+        self.assertEqual(expected["results"][0]["price"], "9.90")
+        for renderer_class in (OrjsonRenderer, UjsonRenderer):
+            module = renderers.orjson if renderer_class is OrjsonRenderer else renderers.ujson
+            if module is None:
+                continue
+            self.assertEqual(json.loads(renderer_class().render(self.data)), expected)
+
+    def test_get_renderer_class(self):
+        self.assertIs(get_renderer_class("json"), JSONRenderer)
+        self.assertIs(get_renderer_class("flask_restframework.renderers.JSONRenderer"), JSONRenderer)
+        if renderers.orjson is not None:
+            self.assertIs(get_renderer_class("auto"), OrjsonRenderer)
+
+    def test_big_integers(self):
+        data = {"id": 2**64}
+        for renderer_class in (JSONRenderer, OrjsonRenderer, UjsonRenderer):
+            module = {OrjsonRenderer: renderers.orjson, UjsonRenderer: renderers.ujson}.get(renderer_class, json)
+            if module is None:
+                continue
+            self.assertEqual(json.loads(renderer_class().render(data)), data)
+
+class UpperRenderer(JSONRenderer):
+    def render(self, data):
+        return super().render(data).upper()
+
+class TestRenderedResponses(BaseFuncTest):
+
+    def test_view_and_error_responses(self):
+        self.app.config["FLASK_RESTFRAMEWORK_RENDERER"] = "flask_restframework.test_renderers.UpperRenderer"
+        RestFramework(self.app)
+        from .views import APIView
+        from .exceptions import NotFound
+        class PingView(APIView):
+            def get(self, *args, **kwargs):
+                return {"msg":"pong"}
+            def post(self, *args, **kwargs):
+                return [{"msg":"created"}], 201
+            def delete(self, *args, **kwargs):
+                raise NotFound()
+        self.app.add_url_rule("/api/ping",view_func=PingView.as_view('ping'))
+        PingView.initial = lambda self: None
+        response = self.client.get('/api/ping')
+        self.assertEqual(response.get_json(), {"MSG":"PONG"})
+        response = self.client.post('/api/ping')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.get_json(), [{"MSG":"CREATED"}])
+        self.assertEqual(response.mimetype, "application/json")
+        # rendered by exception_handler
+        response = self.client.delete('/api/ping')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.mimetype, "application/json")
+        self.assertEqual(response.get_json(), {"MESSAGE": "NOT FOUND.", "CODE": "NOT_FOUND"})
+
+    def test_app_json_provider(self):
+        from flask.json.provider import DefaultJSONProvider
+        from .views import APIView
+        class Money:
+            def __init__(self, cents):
+                self.cents = cents
+        class MoneyJSONProvider(DefaultJSONProvider):
+            @staticmethod
+            def default(o):
+                if isinstance(o, Money):
+                    return "%d.%02d" % divmod(o.cents, 100)
+                return DefaultJSONProvider.default(o)
+        self.app.json = MoneyJSONProvider(self.app)
+        self.app.json.sort_keys = False
+        self.app.json.ensure_ascii = True
+        RestFramework(self.app)
+        class PriceView(APIView):
+            def get(self, *args, **kwargs):
+                return {"z": "café", "a": Money(300)}
+        self.app.add_url_rule("/api/price", view_func=PriceView.as_view('price'))
+        PriceView.initial = lambda self: None
+        response = self.client.get('/api/price')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, b'{"z":"caf\\u00e9","a":"3.00"}')
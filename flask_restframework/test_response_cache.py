@@ -0,0 +1,133 @@
+import base64
+import threading
+import time
+from unittest import mock
+from .base_test import BaseFuncTest
+from . import RestFramework
+from .response_cache import ResponseCache, invalidate_responses
+from .test_throttling import SharedCache
+
+class TestResponseCache(BaseFuncTest):
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.cache = SharedCache()
+        RestFramework(self.app, self.cache)
+        from .views import APIView
+        from .permissions import AllowAny
+        self.calls = 0
+        self.checks = 0
+        test = self
+        class CountingPermission(AllowAny):
+            def has_permission(self):
+                test.checks += 1
+                return True
+        class ItemView(APIView):
+            permission_classes = [CountingPermission]
+            response_cache = ResponseCache(timeout=60, stale_timeout=30, wait_timeout=2)
+            def get(self):
+                test.calls += 1
+                time.sleep(test.latency)
+                if test.error:
+                    raise test.error
+                return {"calls": test.calls}
+            def post(self):
+                test.calls += 1
+                return {"calls": test.calls}
+        self.latency = 0
+        self.error = None
+        self.ItemView = ItemView
+        self.app.add_url_rule("/items", view_func=ItemView.as_view("items"))
+
+    def get(self, url="/items", **kwargs):
+        return self.client.get(url, **kwargs).get_json()
+
+    def test_hits_and_vary(self):
+        self.assertEqual(self.get(), {"calls": 1})
+        self.assertEqual(self.get(), {"calls": 1})
+        self.assertEqual(self.get("/items?b=2&a=1"), {"calls": 2})
+        self.assertEqual(self.get("/items?a=1&b=2"), {"calls": 2})
+        response = self.client.get("/items", headers={"Accept": "application/msgpack"})
+        self.assertEqual(response.mimetype, "application/msgpack")
+        self.assertEqual(self.calls, 3)
+        self.assertEqual(self.client.post("/items").get_json(), {"calls": 4})
+        # authentication and permissions still run on hits of a private cache
+        self.assertEqual(self.checks, 6)
+
+    def test_invalidation(self):
+        self.get()
+        self.ItemView.invalidate_response_cache()
+        self.assertEqual(self.get(), {"calls": 2})
+        invalidate_responses(self.ItemView)
+        self.assertEqual(self.get(), {"calls": 3})
+
+    def test_lost_generation_does_not_revive_entries(self):
+        self.get()
+        self.ItemView.invalidate_response_cache()
+        self.assertEqual(self.get(), {"calls": 2})
+        # evicted or lost by the cache
+        self.cache.data.pop(next(key for key in self.cache.data if key.startswith("response_generation:")))
+        self.assertEqual(self.get(), {"calls": 3})
+        self.assertEqual(self.get(), {"calls": 3})
+
+    def test_stale_while_revalidate(self):
+        now = time.time()
+        with mock.patch.object(ResponseCache, "timer", lambda self: now):
+            self.get()
+        key = next(key for key, entry in self.cache.data.items() if isinstance(entry, tuple))
+        with mock.patch.object(ResponseCache, "timer", lambda self: now + 61):
+            # an other request is recomputing the expired entry
+            self.cache.add("%s:%r:lock" % (key, now + 60), 1)
+            self.assertEqual(self.get(), {"calls": 1})
+        with mock.patch.object(ResponseCache, "timer", lambda self: now + 62):
+            self.cache.data.clear()
+            self.cache.data[key] = (now + 60, 200, [("Content-Type", "application/json")], b'{"calls":1}')
+            self.assertEqual(self.get(), {"calls": 2})
+
+    def test_single_computation_of_missing_entry(self):
+        self.latency = 0.2
+        results = []
+        def request():
+            with self.app.test_client() as client:
+                results.append(client.get("/items").get_json())
+        threads = [threading.Thread(target=request) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(results, [{"calls": 1}] * 8)
+
+    def test_failed_computation_releases_lock(self):
+        self.error = RuntimeError("database is down")
+        self.assertEqual(self.client.get("/items").status_code, 500)
+        self.assertFalse([key for key in self.cache.data if key.endswith(":lock")])
+        self.error = None
+        start = time.monotonic()
+        self.assertEqual(self.get(), {"calls": 2})
+        self.assertLess(time.monotonic() - start, 1)
+
+    def test_waiter_keeps_lock_of_computing_request(self):
+        self.ItemView.response_cache = ResponseCache(timeout=60, wait_timeout=0.1)
+        self.get()
+        key = next(key for key, entry in self.cache.data.items() if isinstance(entry, tuple))
+        # an other request is computing the missing entry for longer than the wait
+        del self.cache.data[key]
+        self.cache.add(key + ":lock", 1)
+        self.assertEqual(self.get(), {"calls": 2})
+        self.assertIn(key + ":lock", self.cache.data)
+
+    def test_public(self):
+        self.ItemView.response_cache = ResponseCache(timeout=60, public=True)
+        self.get()
+        self.get()
+        self.assertEqual((self.calls, self.checks), (1, 1))
+        with self.assertRaises(Exception):
+            ResponseCache(vary=("user",), public=True)
+
+    def test_private_default_varies_by_user(self):
+        self.assertNotIn("user", ResponseCache(public=True).vary)
+        for user in ("alice", "bob", "alice"):
+            token = base64.b64encode(("%s:passwd" % user).encode("utf-8")).decode("utf-8")
+            self.get(headers={"Authorization": "basic " + token})
+        self.assertEqual(self.calls, 2)
@@ -0,0 +1,110 @@
+from unittest import mock
+import multiprocessing
+import os
+import tempfile
+import unittest
+import jwt
+from .base_test import BaseFuncTest
+from . import RestFramework
+from .authentication import JWTAuthentication
+from .exceptions import AuthenticationFailed
+from .revocation import BloomFilter, RevocationList
+from .test_throttling import SharedCache
+
+class TestBloomFilter(unittest.TestCase):
+
+    def test_membership(self):
+        bloom = BloomFilter(capacity=1000, error_rate=0.01)
+        for i in range(1000):
+            bloom.add("jti-%d" % i)
+        self.assertTrue(all("jti-%d" % i in bloom for i in range(1000)))
+        false_positives = sum("other-%d" % i in bloom for i in range(10000))
+        self.assertLess(false_positives, 200)
+
+    def test_size(self):
+        bloom = BloomFilter(capacity=1000000, error_rate=0.01)
+        self.assertEqual(bloom.hashes, 7)
+        self.assertLess(len(bloom.bits), 1200000)
+
+    def test_merge_and_serialize(self):
+        first, second = BloomFilter(capacity=100), BloomFilter(capacity=100)
+        first.add("a")
+        second.add("b")
+        first.merge(BloomFilter.from_bytes(second.to_bytes()))
+        self.assertIn("a", first)
+        self.assertIn("b", first)
+        with self.assertRaises(ValueError):
+            first.merge(BloomFilter(capacity=1000))
+
+class TestRevocationList(BaseFuncTest):
+    jwt_secret = "hard_to_guess_secret_of_32_bytes"
+
+    def authenticate(self, jti):
+        token = jwt.encode({"id":"1234abcd","jti":jti}, self.jwt_secret, algorithm="HS256")
+        with mock.patch("flask_restframework.authentication.request") as mock_header:
+            mock_header.headers = {"Authorization":"bearer "+token}
+            return JWTAuthentication().authenticate()
+
+    def test_revoked_from_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "revoked.txt")
+            with open(path, "w") as f:
+                f.write("revoked-1\nrevoked-2\n")
+            check = mock.Mock(return_value=True)
+            self.app.config['JWT_SECRET'] = self.jwt_secret
+            self.app.config['FLASK_RESTFRAMEWORK_JWT_REVOCATION'] = True
+            self.app.config['FLASK_RESTFRAMEWORK_JWT_REVOCATION_FILE'] = path
+            self.app.config['FLASK_RESTFRAMEWORK_JWT_REVOCATION_CHECK'] = check
+            self.app.config['FLASK_RESTFRAMEWORK_JWT_REVOCATION_REFRESH_INTERVAL'] = None
+            RestFramework(self.app)
+            usr, payload = self.authenticate("valid")
+            self.assertEqual(usr.id, "1234abcd")
+            # the authoritative store is only asked about filter hits
+            check.assert_not_called()
+            with self.assertRaises(AuthenticationFailed):
+                self.authenticate("revoked-2")
+            check.assert_called_once_with("revoked-2")
+
+    def test_revoke_through_cache(self):
+        cache = SharedCache()
+        first = RevocationList(capacity=1000, cache=cache, cache_operations=frozenset(["add", "cas"]),
+                               refresh_interval=None)
+        second = RevocationList(capacity=1000, cache=cache, cache_operations=frozenset(["add", "cas"]),
+                                refresh_interval=None)
+        first.revoke("a")
+        second.revoke("b")
+        self.assertFalse(first.is_revoked("b"))
+        first.refresh()
+        self.assertTrue(first.is_revoked("a"))
+        self.assertTrue(first.is_revoked("b"))
+        self.assertFalse(first.is_revoked("c"))
+
+    def test_snapshot_over_cache_item_limit(self):
+        revocation = RevocationList(capacity=10000, cache=LimitedCache(), cache_operations=frozenset(["add", "cas"]),
+                                    refresh_interval=None)
+        with self.assertRaisesRegex(Exception, "item size limit"):
+            revocation.revoke("a")
+
+class LimitedCache(SharedCache):
+    """
+    Refuses values over `limit` bytes, as memcached does.
+    """
+    limit = 1000
+
+    def add(self, key, value, timeout=None):
+        return len(value) <= self.limit and super().add(key, value, timeout)
+
+def refresher_alive(revocation, results):
+    results.put(revocation.refresher.is_alive())
+
+class TestRevocationRefresher(unittest.TestCase):
+
+    def test_restarted_in_forked_child(self):
+        revocation = RevocationList(capacity=1000, cache=SharedCache(), refresh_interval=60)
+        self.addCleanup(revocation.stop)
+        context = multiprocessing.get_context("fork")
+        results = context.Queue()
+        child = context.Process(target=refresher_alive, args=(revocation, results))
+        child.start()
+        self.assertTrue(results.get(timeout=10))
+        child.join()
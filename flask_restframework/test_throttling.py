@@ -1,8 +1,15 @@
-from flask import g
+from flask import Flask, g
+from multiprocessing.managers import BaseManager
 from unittest import mock
+import multiprocessing
+import threading
+import time
+import unittest
 from . import RestFramework
 from .base_test import BaseTest
-from .throttling import AnonRateThrottle, UserRateThrottle
+from .caches import LocalCache
+from .throttling import AnonRateThrottle, UserRateThrottle, AnonGCRAThrottle, UserGCRAThrottle, \
+    AnonFixedWindowThrottle, local_leases
 
 class MockCache:
     def __init__(self) -> None:
@@ -14,6 +21,99 @@ class MockCache:
     def get(self, key):
         return self.data.get(key)
 
+class SharedCache:
+    """
+    Stand-in for a networked cache shared by several processes, every read
+    takes `latency` seconds to come back.
+    """
+    def __init__(self, latency=0.0) -> None:
+        self.data = {}
+        self.lock = threading.Lock()
+        self.latency = latency
+
+    def get(self, key):
+        with self.lock:
+            value = self.data.get(key)
+        time.sleep(self.latency)
+        return value
+
+    def set(self, key, value, timeout=None):
+        with self.lock:
+            self.data[key] = value
+
+    def add(self, key, value, timeout=None):
+        with self.lock:
+            if key in self.data:
+                return False
+            self.data[key] = value
+            return True
+
+    def incr(self, key, delta=1):
+        with self.lock:
+            if key not in self.data:
+                return None
+            self.data[key] += delta
+            return self.data[key]
+
+    def cas(self, key, expected, value, timeout=None):
+        with self.lock:
+            if self.data.get(key) != expected:
+                return False
+            self.data[key] = value
+            return True
+
+    def delete(self, key):
+        with self.lock:
+            self.data.pop(key, None)
+
+class CountingCache(SharedCache):
+    def __init__(self, latency=0.0) -> None:
+        super().__init__(latency)
+        self.round_trips = 0
+
+    def get(self, key):
+        self.round_trips += 1
+        return super().get(key)
+
+    def incr(self, key, delta=1):
+        self.round_trips += 1
+        return super().incr(key, delta)
+
+class VanishingCache(SharedCache):
+    """
+    Cache whose counters expire or are evicted as soon as they are added.
+    """
+    def add(self, key, value, timeout=None):
+        self.adds = getattr(self, "adds", 0) + 1
+        return False
+
+    def incr(self, key, delta=1):
+        return None
+
+class ContendedCache(SharedCache):
+    """
+    Cache whose every compare-and-set loses to a concurrent request.
+    """
+    def cas(self, key, expected, value, timeout=None):
+        return False
+
+class CacheManager(BaseManager):
+    pass
+
+CacheManager.register("AtomicCache", SharedCache)
+CacheManager.register("PlainCache", SharedCache, exposed=("get", "set"))
+
+def hit_throttle(cache, throttle_class, rate, requests, barrier, results):
+    app = Flask(__name__)
+    RestFramework(app, cache)
+    allowed = 0
+    with app.test_request_context():
+        g.current_user = None
+        barrier.wait()
+        for i in range(requests):
+            allowed += throttle_class(rate).allow_request()
+    results.put(allowed)
+
 class MockUser:
     def __init__(self,id) -> None:
         self.id = id
@@ -75,4 +175,210 @@ class TestUserRateThrottle(BaseTest):
         throttle_result = anon_throttle.allow_request()
         self.assertTrue(throttle_result)
         throttle_result = anon_throttle.allow_request()
-        self.assertFalse(throttle_result)
\ No newline at end of file
+        self.assertFalse(throttle_result)
+
+class TestGCRAThrottle(BaseTest):
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+        cls.cache = MockCache()
+        rf = RestFramework()
+        rf.init_app(cls.app, cls.cache)
+
+    def setUp(self) -> None:
+        self.cache.data.clear()
+        return super().setUp()
+
+    @mock.patch('flask_restframework.throttling.g',current_user=None)
+    def test_forbiden(self, *args):
+        throttle = AnonGCRAThrottle("0/s")
+        self.assertFalse(throttle.allow_request())
+        self.assertEqual(throttle.wait(), 1)
+
+    @mock.patch('flask_restframework.throttling.g',current_user=None)
+    def test_burst_then_forbiden(self, *args):
+        with mock.patch.object(AnonGCRAThrottle, "timer", return_value=1000.0):
+            for i in range(3):
+                self.assertTrue(AnonGCRAThrottle("3/m").allow_request())
+            throttle = AnonGCRAThrottle("3/m")
+            self.assertFalse(throttle.allow_request())
+            self.assertEqual(throttle.wait(), 20)
+        # one request is released every duration/num_requests seconds
+        with mock.patch.object(AnonGCRAThrottle, "timer", return_value=1020.0):
+            self.assertTrue(AnonGCRAThrottle("3/m").allow_request())
+            self.assertFalse(AnonGCRAThrottle("3/m").allow_request())
+
+    @mock.patch('flask_restframework.throttling.g',current_user=MockUser("1234abcd"))
+    def test_constant_storage(self, *args):
+        for i in range(50):
+            UserGCRAThrottle("10000/h").allow_request()
+        self.assertEqual(list(self.cache.data), ["throttle_gcra_user_1234abcd"])
+        self.assertIsInstance(self.cache.data["throttle_gcra_user_1234abcd"], float)
+
+    @mock.patch('flask_restframework.throttling.g',current_user=MockUser("1234abcd"))
+    def test_allow_for_user(self, *args):
+        self.assertTrue(AnonGCRAThrottle("0/s").allow_request())
+
+class TestContendedThrottle(BaseTest):
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+        cls.cache = ContendedCache()
+        rf = RestFramework()
+        rf.init_app(cls.app, cls.cache)
+
+    @mock.patch('flask_restframework.throttling.g',current_user=None)
+    def test_lost_races_decided_on_last_history(self, *args):
+        now = time.time()
+        key = AnonRateThrottle("3/d").get_cache_key()
+        self.cache.data[key] = [now - 2, now - 1]
+        self.assertTrue(AnonRateThrottle("3/d").allow_request())
+        self.assertEqual(len(self.cache.data[key]), 3)
+        throttle = AnonRateThrottle("3/d")
+        self.assertFalse(throttle.allow_request())
+        self.assertEqual(len(throttle.history), 3)
+        self.assertIsNotNone(throttle.wait())
+
+class TestFixedWindowThrottle(BaseTest):
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+        cls.cache = VanishingCache()
+        rf = RestFramework()
+        rf.init_app(cls.app, cls.cache)
+
+    @mock.patch('flask_restframework.throttling.g',current_user=None)
+    def test_vanishing_counter(self, *args):
+        throttle = AnonFixedWindowThrottle("5/d")
+        self.assertEqual(throttle.increment("throttle_key"), 1)
+        self.assertEqual(self.cache.adds, 2)
+        self.assertTrue(AnonFixedWindowThrottle("5/d").allow_request())
+
+class LeasedGCRAThrottle(AnonGCRAThrottle):
+    lease_size = 4
+
+class LeasedFixedWindowThrottle(AnonFixedWindowThrottle):
+    lease_size = 4
+
+class TestLocalLease(BaseTest):
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+        cls.cache = CountingCache()
+        rf = RestFramework()
+        rf.init_app(cls.app, cls.cache)
+
+    def setUp(self) -> None:
+        self.cache.data.clear()
+        self.cache.round_trips = 0
+        local_leases.clear()
+        return super().setUp()
+
+    @mock.patch('flask_restframework.throttling.g',current_user=None)
+    def test_requests_served_from_lease(self, *args):
+        for throttle_class in (LeasedGCRAThrottle, LeasedFixedWindowThrottle):
+            self.cache.round_trips = 0
+            for i in range(10):
+                self.assertTrue(throttle_class("100/m").allow_request())
+            self.assertEqual(self.cache.round_trips, 2, throttle_class.__name__)
+
+    @mock.patch('flask_restframework.throttling.g',current_user=None)
+    def test_lease_bounded_by_rate(self, *args):
+        for throttle_class in (LeasedGCRAThrottle, LeasedFixedWindowThrottle):
+            self.cache.data.clear()
+            admitted = 0
+            # every worker but the first one starts with no local lease
+            for worker in range(3):
+                local_leases.clear()
+                admitted += sum(throttle_class("7/d").allow_request() for i in range(10))
+            self.assertEqual(admitted, 7, throttle_class.__name__)
+
+    @mock.patch('flask_restframework.throttling.g',current_user=None)
+    def test_sparse_client(self, *args):
+        class SparseThrottle(AnonFixedWindowThrottle):
+            lease_size = 10
+        day = 86400 * 19000
+        admitted = 0
+        # one request every half hour, each lease expires unused
+        for i in range(50):
+            with mock.patch.object(SparseThrottle, "timer", return_value=day + i * 1700.0):
+                admitted += SparseThrottle("100/d").allow_request()
+        self.assertEqual(admitted, 50)
+        # the admitted requests and the last lease
+        self.assertEqual(self.cache.data["throttle_window_anon_None_%d" % day], 60)
+
+    @mock.patch('flask_restframework.throttling.g',current_user=None)
+    def test_lease_expires(self, *args):
+        with mock.patch.object(LeasedGCRAThrottle, "timer", return_value=1000.0):
+            self.assertTrue(LeasedGCRAThrottle("100/m").allow_request())
+            self.assertTrue(LeasedGCRAThrottle("100/m").allow_request())
+        self.assertEqual(self.cache.round_trips, 1)
+        with mock.patch.object(LeasedGCRAThrottle, "timer", return_value=1001.0):
+            self.assertTrue(LeasedGCRAThrottle("100/m").allow_request())
+        self.assertEqual(self.cache.round_trips, 2)
+
+class TestConcurrentThrottle(unittest.TestCase):
+    processes = 4
+    requests = 5
+    rate = "5/d"
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.context = multiprocessing.get_context("fork")
+        cls.manager = CacheManager(ctx=cls.context)
+        cls.manager.start()
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        cls.manager.shutdown()
+
+    def admitted(self, cache, throttle_class):
+        barrier = self.context.Barrier(self.processes)
+        results = self.context.Queue()
+        workers = [
+            self.context.Process(
+                target=hit_throttle,
+                args=(cache, throttle_class, self.rate, self.requests, barrier, results))
+            for i in range(self.processes)
+        ]
+        for worker in workers:
+            worker.start()
+        admitted = sum(results.get(timeout=30) for worker in workers)
+        for worker in workers:
+            worker.join()
+        return admitted
+
+    def test_get_set_cache_overshoots(self):
+        admitted = self.admitted(self.manager.PlainCache(0.02), AnonRateThrottle)
+        self.assertGreater(admitted, 5)
+
+    def test_atomic_cache_is_exact(self):
+        for throttle_class in (AnonRateThrottle, AnonGCRAThrottle, AnonFixedWindowThrottle):
+            admitted = self.admitted(self.manager.AtomicCache(0.02), throttle_class)
+            self.assertEqual(admitted, 5, throttle_class.__name__)
+
+class TestLocalCacheThrottle(unittest.TestCase):
+    threads = 8
+    requests = 5
+    rate = "5/d"
+
+    def test_threads_are_exact(self):
+        for throttle_class in (AnonRateThrottle, AnonGCRAThrottle, AnonFixedWindowThrottle):
+            app = Flask(__name__)
+            RestFramework(app, LocalCache())
+            barrier = threading.Barrier(self.threads)
+            results = []
+            def run():
+                allowed = 0
+                with app.test_request_context():
+                    g.current_user = None
+                    barrier.wait()
+                    for i in range(self.requests):
+                        allowed += throttle_class(self.rate).allow_request()
+                results.append(allowed)
+            workers = [threading.Thread(target=run) for i in range(self.threads)]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+            self.assertEqual(sum(results), 5, throttle_class.__name__)
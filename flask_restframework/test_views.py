@@ -148,3 +148,267 @@ class TestViews(BaseFuncTest):
         self.assertEqual(response.status_code,200)
         response = self.client.get('/api/ping',headers={"Authorization":"basic "+token})
         self.assertEqual(response.status_code,429)
+
+
+    def test_plan_compiled_once(self):
+        ''' test security pipeline is compiled once per view class'''
+        cache = MockCache()
+        rf = RestFramework()
+        rf.init_app(self.app,cache)
+        from .views import APIView
+        from .authentication import BasicAuthentication
+        from .permissions import AllowAny
+        from .throttling import AnonRateThrottle
+        class PingView(APIView):
+            authentication_classes = [BasicAuthentication]
+            permission_classes = [AllowAny]
+            throttle_handlers = [{"class":AnonRateThrottle,"rate":"2/minute"}]
+            def get(self,*args, **kwargs):
+                return {"msg":"pong"}
+        self.app.add_url_rule("/api/ping",view_func=PingView.as_view('ping'))
+
+        response = self.client.get('/api/ping')
+        self.assertEqual(response.status_code,200)
+        plan = self.app.VIEW_PLANS[PingView]
+        authenticator = plan.authenticators[0]
+        self.assertEqual(plan.throttles[0].num_requests, 2)
+        response = self.client.get('/api/ping')
+        self.assertEqual(response.status_code,200)
+        self.assertIs(self.app.VIEW_PLANS[PingView].authenticators[0], authenticator)
+        response = self.client.get('/api/ping')
+        self.assertEqual(response.status_code,429)
+
+
+    def test_authentication_scheme_dispatch(self):
+        ''' test header is handed to the authenticator of its scheme only'''
+        rf = RestFramework()
+        rf.init_app(self.app)
+        from flask import g, request
+        from unittest import mock
+        from .views import APIView
+        from .authentication import BaseAuthentication, BasicAuthentication, JWTAuthentication
+        from .permissions import IsAuthenticated
+        class APIKeyAuthentication(BaseAuthentication):
+            def authenticate(self):
+                if request.headers.get("X-API-Key") != "key":
+                    return None
+                g.current_user = mock.Mock(id="service", is_authenticated=True)
+                return g.current_user, None
+        class PingView(APIView):
+            authentication_classes = [APIKeyAuthentication, BasicAuthentication, JWTAuthentication]
+            permission_classes = [IsAuthenticated]
+            def get(self,*args, **kwargs):
+                return {"msg":"pong"}
+        self.app.add_url_rule("/api/ping",view_func=PingView.as_view('ping'))
+
+        token = base64.b64encode(b"waro163:passwd123").decode('utf-8')
+        with mock.patch.object(JWTAuthentication, "authenticate_credentials") as jwt_credentials:
+            response = self.client.get('/api/ping',headers={"Authorization":"basic "+token})
+            self.assertEqual(response.status_code,200)
+            jwt_credentials.assert_not_called()
+        # authenticators without a scheme are still tried
+        response = self.client.get('/api/ping',headers={"X-API-Key":"key"})
+        self.assertEqual(response.status_code,200)
+        response = self.client.get('/api/ping',headers={"Authorization":"digest abc"})
+        self.assertEqual(response.status_code,401)
+
+class TestContentNegotiation(BaseFuncTest):
+
+    def setUp(self) -> None:
+        super().setUp()
+        RestFramework(self.app)
+        from .views import APIView
+        from .exceptions import NotFound
+        class EchoView(APIView):
+            def get(self, *args, **kwargs):
+                raise NotFound()
+            def post(self, *args, **kwargs):
+                return {"echo": self.data}
+        class TextView(APIView):
+            def get(self, *args, **kwargs):
+                return "pong"
+        self.app.add_url_rule("/api/echo", view_func=EchoView.as_view('echo'))
+        self.app.add_url_rule("/api/text", view_func=TextView.as_view('text'))
+
+    def test_renderer_from_accept(self):
+        from . import messagepack
+        response = self.client.post('/api/echo', json={"a": [1, 2]})
+        self.assertEqual(response.get_json(), {"echo": {"a": [1, 2]}})
+        self.assertEqual(response.headers["Vary"], "Accept")
+        response = self.client.post('/api/echo', json={"a": [1, 2]}, headers={"Accept": "application/msgpack"})
+        self.assertEqual(response.mimetype, "application/msgpack")
+        self.assertEqual(messagepack.unpackb(response.data), {"echo": {"a": [1, 2]}})
+        response = self.client.get('/api/echo', headers={"Accept": "application/msgpack"})
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(messagepack.unpackb(response.data)["code"], "not_found")
+        self.assertEqual(response.headers["Vary"], "Accept")
+        response = self.client.post('/api/echo', json={"a": [1, 2]}, headers={"Accept": "text/html"})
+        self.assertEqual(response.status_code, 406)
+        self.assertEqual(response.get_json()["code"], "not_acceptable")
+        # errors are rendered by the first renderer
+        response = self.client.get('/api/echo', headers={"Accept": "text/html"})
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.get_json()["code"], "not_found")
+
+    def test_unrendered_response_not_negotiated(self):
+        response = self.client.get('/api/text', headers={"Accept": "text/plain"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, b"pong")
+
+    def test_parser_from_content_type(self):
+        from . import messagepack
+        body = messagepack.packb({"a": b"\x00", "b": None})
+        response = self.client.post('/api/echo', data=body, content_type="application/msgpack",
+                                    headers={"Accept": "application/msgpack"})
+        self.assertEqual(messagepack.unpackb(response.data), {"echo": {"a": b"\x00", "b": None}})
+        response = self.client.post('/api/echo', data=body, content_type="text/plain")
+        self.assertEqual(response.status_code, 415)
+        response = self.client.post('/api/echo', data=b"\x92\x01", content_type="application/msgpack")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.get_json()["code"], "parse_error")
+
+class TestBodyParsing(BaseFuncTest):
+
+    def setUp(self) -> None:
+        super().setUp()
+        RestFramework(self.app)
+        from .views import APIView
+        from .parsers import JSONParser
+        self.parsed = 0
+        test = self
+        class CountingParser(JSONParser):
+            def parse(self, data, max_depth=None):
+                test.parsed += 1
+                return super().parse(data, max_depth)
+        class BulkView(APIView):
+            parser_classes = [CountingParser]
+            max_body_size = 100
+            max_body_depth = 3
+            def post(self, *args, **kwargs):
+                return {"size": len(self.data), "again": self.data is self.data}
+            def put(self, *args, **kwargs):
+                return {"ids": [item["id"] for item in self.iter_data()]}
+        self.app.add_url_rule("/api/bulk", view_func=BulkView.as_view('bulk'))
+
+    def test_parsed_once(self):
+        response = self.client.post('/api/bulk', json=[1, 2, 3])
+        self.assertEqual(response.get_json(), {"size": 3, "again": True})
+        self.assertEqual(self.parsed, 1)
+
+    def test_limits(self):
+        response = self.client.post('/api/bulk', json=list(range(100)))
+        self.assertEqual(response.status_code, 413)
+        self.assertEqual(self.parsed, 0)
+        response = self.client.post('/api/bulk', json=[[[[1]]]])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.get_json()["code"], "parse_error")
+
+    def test_lifted_limits(self):
+        from .views import APIView
+        class UploadView(APIView):
+            max_body_size = None
+            max_body_depth = None
+            def post(self, *args, **kwargs):
+                return {"size": len(self.data)}
+        self.app.config["FLASK_RESTFRAMEWORK_MAX_BODY_SIZE"] = 100
+        self.app.config["FLASK_RESTFRAMEWORK_MAX_BODY_DEPTH"] = 3
+        self.app.add_url_rule("/api/upload", view_func=UploadView.as_view('upload'))
+        response = self.client.post('/api/upload', json=list(range(100)))
+        self.assertEqual(response.get_json(), {"size": 100})
+        response = self.client.post('/api/upload', json=[[[[1]]]])
+        self.assertEqual(response.get_json(), {"size": 1})
+
+    def test_iter_data(self):
+        import json
+        body = json.dumps([{"id": i, "padding": "x" * 50} for i in range(1000)])
+        response = self.client.put('/api/bulk', data=body, content_type="application/json")
+        self.assertEqual(response.get_json(), {"ids": list(range(1000))})
+        response = self.client.put('/api/bulk', data='[{"id": 1}, {"id": "%s"}]' % ("x" * 200), content_type="application/json")
+        self.assertEqual(response.status_code, 413)
+
+class TestConditionalGet(BaseFuncTest):
+
+    def setUp(self) -> None:
+        super().setUp()
+        RestFramework(self.app)
+        from .views import APIView
+        self.version = 1
+        self.calls = 0
+        test = self
+        class ItemView(APIView):
+            use_etag = True
+            def get(self):
+                test.calls += 1
+                return {"version": test.version}
+        class VersionedView(ItemView):
+            def get_version_key(self):
+                return test.version
+        self.app.add_url_rule("/items", view_func=ItemView.as_view("items"))
+        self.app.add_url_rule("/versioned", view_func=VersionedView.as_view("versioned"))
+
+    def test_etag_of_body(self):
+        response = self.client.get("/items")
+        etag = response.headers["ETag"]
+        response = self.client.get("/items", headers={"If-None-Match": etag})
+        self.assertEqual((response.status_code, response.data), (304, b""))
+        self.version = 2
+        response = self.client.get("/items", headers={"If-None-Match": etag})
+        self.assertEqual(response.get_json(), {"version": 2})
+        self.assertNotEqual(response.headers["ETag"], etag)
+
+    def test_version_key_skips_handler(self):
+        response = self.client.get("/versioned")
+        etag = response.headers["ETag"]
+        self.assertTrue(etag.startswith("W/"))
+        response = self.client.get("/versioned", headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.headers["ETag"], etag)
+        self.assertEqual(self.calls, 1)
+        response = self.client.get("/versioned", headers={"If-None-Match": etag, "Accept": "application/msgpack"})
+        self.assertEqual(response.status_code, 200)
+        self.version = 2
+        response = self.client.get("/versioned", headers={"If-None-Match": etag})
+        self.assertEqual(response.get_json(), {"version": 2})
+        self.assertEqual(self.calls, 3)
+
+    def test_middleware(self):
+        from .middlewares import ETagMiddleware
+        ETagMiddleware(self.app)
+        self.app.add_url_rule("/plain", "plain", lambda: "plain text")
+        etag = self.client.get("/plain").headers["ETag"]
+        self.assertEqual(self.client.get("/plain", headers={"If-None-Match": etag}).status_code, 304)
+
+class TestTimings(BaseFuncTest):
+
+    def setUp(self) -> None:
+        super().setUp()
+        from .views import APIView
+        from .authentication import BasicAuthentication
+        from .permissions import AllowAny
+        from .throttling import AnonRateThrottle
+        class PingView(APIView):
+            authentication_classes = [BasicAuthentication]
+            permission_classes = [AllowAny]
+            throttle_handlers = [{"class": AnonRateThrottle, "rate": "100/min"}]
+            def get(self):
+                return {"msg": "pong"}
+        self.app.add_url_rule("/api/ping", view_func=PingView.as_view("ping"))
+
+    def test_server_timing(self):
+        self.sunk = []
+        self.app.config["FLASK_RESTFRAMEWORK_TIMING"] = True
+        self.app.config["FLASK_RESTFRAMEWORK_TIMING_SINK"] = lambda view_class, timings: self.sunk.append(timings)
+        RestFramework(self.app, MockCache())
+        token = base64.b64encode(b"waro163:passwd123").decode("utf-8")
+        response = self.client.get("/api/ping", headers={"Authorization": "basic " + token})
+        self.assertEqual(response.get_json(), {"msg": "pong"})
+        names = [entry.split(";")[0] for entry in response.headers["Server-Timing"].split(", ")]
+        self.assertEqual(names, ["auth.BasicAuthentication", "authentication", "perm.AllowAny", "permissions",
+                                 "throttle.AnonRateThrottle", "throttles", "handler", "render", "total"])
+        self.assertEqual([name for name, _ in self.sunk[0].entries], names)
+        self.assertTrue(all(duration >= 0 for _, duration in self.sunk[0].entries))
+
+    def test_disabled(self):
+        RestFramework(self.app, MockCache())
+        response = self.client.get("/api/ping")
+        self.assertNotIn("Server-Timing", response.headers)
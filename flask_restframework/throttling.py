@@ -1,17 +1,89 @@
 from flask import current_app, request, g
+import math
+import threading
 import time
 
+class LocalLeases:
+    """
+    Quota leased by this process from the shared cache, keyed by throttle.
+
+    Each lease is a number of requests already accounted for in the shared
+    cache that this process may admit on its own until the lease expires.
+    """
+    max_keys = 10000
+
+    def __init__(self) -> None:
+        self.leases = {}
+        self.lock = threading.Lock()
+
+    def take(self, key, now):
+        """
+        Consumes one request from the lease of `key`, returns whether there was one.
+        """
+        with self.lock:
+            lease = self.leases.get(key)
+            if lease is None or lease[0] <= 0 or lease[1] <= now:
+                return False
+            lease[0] -= 1
+            return True
+
+    def grant(self, key, count, expires, now, counter=None):
+        """
+        Leases `count` requests of `key` until `expires`, `counter` being the
+        shared counter they were counted in, if they can be given back to it.
+        """
+        with self.lock:
+            if len(self.leases) >= self.max_keys:
+                self.leases = {k: v for k, v in self.leases.items() if v[0] > 0 and v[1] > now}
+            self.leases[key] = [count, expires, counter]
+
+    def release(self, key, counter):
+        """
+        Ends the lease of `key`, returns how many of its requests were left
+        unused if they were counted in `counter`.
+        """
+        with self.lock:
+            lease = self.leases.pop(key, None)
+        if lease is None or lease[2] != counter:
+            return 0
+        return lease[0]
+
+    def clear(self):
+        with self.lock:
+            self.leases.clear()
+
+local_leases = LocalLeases()
+
 class BaseThrottle:
     """
     Rate throttling of requests.
+
+    When the cache offers `add` and `cas` the history is written back with
+    compare-and-set and re-read on conflict, so concurrent requests from the
+    same client can not overwrite each other's accounting. After losing
+    `cas_retries` races the request is decided on the history read last,
+    and written back with a plain set. With a cache that
+    only has get/set the read-modify-write is not atomic and concurrent
+    workers may let a burst go past the configured rate.
     """
     cache_format = 'throttle_%(scope)s_%(ident)s'
-    now = time.time()
+    timer = time.time
+    cas_retries = 5
 
     def __init__(self, rate:str):
         self.rate = rate
         self.num_requests, self.duration = self.parse_rate(self.rate)
         self.cache = getattr(current_app, "CACHE", None)
+        self.cache_operations = getattr(current_app, "CACHE_OPERATIONS", frozenset())
+
+    def clone(self):
+        """
+        Returns a shallow copy to hold the state of one request, the parsed
+        rate and the cache are reused as they are.
+        """
+        throttle = self.__class__.__new__(self.__class__)
+        throttle.__dict__.update(self.__dict__)
+        return throttle
 
     def allow_request(self):
         """
@@ -26,13 +98,30 @@ class BaseThrottle:
         if self.key is None:
             return True
 
-        self.history = self.cache.get(self.key) or []
+        self.now = self.timer()
+        for _ in range(self.cas_retries):
+            if self.read_history() >= self.num_requests:
+                return self.throttle_failure()
+            if self.throttle_success():
+                return True
+        # lost every race against concurrent requests of the same client, the
+        # request is still decided on the latest history, written back as is
+        if self.read_history() >= self.num_requests:
+            return self.throttle_failure()
+        self.history.insert(0, self.now)
+        self.cache.set(self.key, self.history, self.duration)
+        return True
+
+    def read_history(self):
+        """
+        Reads the history of the current key into `self.history`, returns its length.
+        """
+        self.cached = self.cache.get(self.key)
+        self.history = list(self.cached or [])
         #  Drop any requests from the history which have now passed the throttle duration
         while self.history and self.history[-1] <= self.now - self.duration:
             self.history.pop()
-        if len(self.history) >= self.num_requests:
-            return self.throttle_failure()
-        return self.throttle_success()
+        return len(self.history)
 
     def get_cache_key(self):
         """
@@ -61,10 +150,23 @@ class BaseThrottle:
     def throttle_success(self):
         """
         Inserts the current request's timestamp along with the key
-        into the cache. key's expire time(ttl) is duration
+        into the cache. key's expire time(ttl) is duration.
+        Returns `False` if a concurrent request changed the key meanwhile.
         """
         self.history.insert(0, self.now)
-        self.cache.set(self.key, self.history, self.duration)
+        return self.store(self.history, self.duration)
+
+    def store(self, value, timeout):
+        """
+        Writes `value` under the current key if the cached value is still
+        `self.cached`, using the atomic operations the cache offers.
+        Returns whether the value was written.
+        """
+        if self.cached is None and "add" in self.cache_operations:
+            return bool(self.cache.add(self.key, value, timeout))
+        if self.cached is not None and "cas" in self.cache_operations:
+            return bool(self.cache.cas(self.key, self.cached, value, timeout))
+        self.cache.set(self.key, value, timeout)
         return True
 
     def throttle_failure(self):
@@ -124,4 +226,216 @@ class UserRateThrottle(BaseThrottle):
         return self.cache_format % {
             'scope': self.scope,
             'ident': ident
-        }
\ No newline at end of file
+        }
+
+class GCRAThrottle(BaseThrottle):
+    """
+    Rate throttling using the Generic Cell Rate Algorithm.
+
+    Only the theoretical arrival time (TAT) of the next request is kept per
+    key instead of the whole request history, so the cached value and the
+    work done per request stay constant whatever the configured rate is.
+    It admits the same bursts as a token bucket of `num_requests` tokens
+    refilled evenly over `duration`.
+
+    Setting `lease_size` turns on a local tier: each round trip to the shared
+    cache reserves up to `lease_size` extra requests that this process then
+    admits from memory for at most `lease_ttl` seconds. Leased requests are
+    accounted for when they are reserved, so a client can exceed the rate in
+    any `duration` by at most `lease_size` requests per worker process, and
+    leases left unused at expiry are lost rather than returned.
+    """
+    cache_format = 'throttle_gcra_%(scope)s_%(ident)s'
+    lease_size = 0
+    lease_ttl = 1.0
+
+    def __init__(self, rate:str):
+        super().__init__(rate)
+        if self.num_requests:
+            self.emission_interval = self.duration / self.num_requests
+
+    def allow_request(self):
+        """
+        Return `True` if the request should be allowed, `False` otherwise.
+        """
+        if self.cache is None:
+            return True
+        if self.rate is None:
+            return True
+
+        self.key = self.get_cache_key()
+        if self.key is None:
+            return True
+
+        self.now = self.timer()
+        if not self.num_requests:
+            self.allow_at = self.now + self.duration
+            return self.throttle_failure()
+
+        if self.lease_size and local_leases.take((self.key, self.rate), self.now):
+            return True
+
+        for _ in range(self.cas_retries):
+            self.cached = self.cache.get(self.key)
+            tat = max(self.cached or self.now, self.now)
+            # a request conforms if it does not arrive earlier than the burst allows
+            self.allow_at = tat + self.emission_interval - self.duration
+            if self.allow_at > self.now:
+                return self.throttle_failure()
+            conforming = int((self.now + self.duration - tat) / self.emission_interval + 1e-9)
+            self.granted = min(1 + self.lease_size, conforming)
+            self.tat = tat + self.granted * self.emission_interval
+            if self.throttle_success():
+                return True
+        return self.throttle_failure()
+
+    def throttle_success(self):
+        """
+        Stores the new theoretical arrival time, the key expires once it is
+        reached because a missing key then means the same thing.
+        """
+        if not self.store(self.tat, max(math.ceil(self.tat - self.now), 1)):
+            return False
+        if self.granted > 1:
+            local_leases.grant((self.key, self.rate), self.granted - 1, self.now + self.lease_ttl, self.now)
+        return True
+
+    def wait(self):
+        """
+        Returns the recommended next request time in seconds.
+        """
+        return max(self.allow_at - self.now, 0)
+
+class AnonGCRAThrottle(GCRAThrottle, AnonRateThrottle):
+    """
+    `AnonRateThrottle` backed by the constant memory GCRA engine.
+    """
+    pass
+
+class UserGCRAThrottle(GCRAThrottle, UserRateThrottle):
+    """
+    `UserRateThrottle` backed by the constant memory GCRA engine.
+    """
+    pass
+
+class FixedWindowThrottle(BaseThrottle):
+    """
+    Rate throttling with one counter per fixed window of `duration` seconds.
+
+    With a cache offering `incr` the counter is bumped and read back in a
+    single round trip, so counting and deciding is atomic across processes.
+    A client may get up to twice the rate around the boundary of two windows.
+
+    Setting `lease_size` turns on a local tier like `GCRAThrottle` does, the
+    leases never outlive the window they were counted in so they can not
+    push a window past the rate. The requests a lease left unused are given
+    back to the counter by the next round trip of the process in the same
+    window, and those a full window could not grant are given back at once,
+    so only the requests actually admitted stay counted.
+    """
+    cache_format = 'throttle_window_%(scope)s_%(ident)s'
+    lease_size = 0
+    lease_ttl = 1.0
+
+    def allow_request(self):
+        """
+        Return `True` if the request should be allowed, `False` otherwise.
+        """
+        if self.cache is None:
+            return True
+        if self.rate is None:
+            return True
+
+        self.key = self.get_cache_key()
+        if self.key is None:
+            return True
+
+        self.now = self.timer()
+        self.window = self.now - self.now % self.duration
+        if not self.num_requests:
+            return self.throttle_failure()
+
+        self.counter_key = '%s_%d' % (self.key, self.window)
+        requested = 1 + self.lease_size
+        unused = 0
+        if self.lease_size:
+            if local_leases.take((self.key, self.rate), self.now):
+                return True
+            # the previous lease ran out or expired, what it left unused goes back
+            unused = local_leases.release((self.key, self.rate), self.counter_key)
+        self.count = self.increment(self.counter_key, requested - unused)
+        self.granted = min(requested, self.num_requests - (self.count - requested))
+        if self.lease_size and self.granted < requested:
+            self.give_back(self.counter_key, requested - max(self.granted, 0))
+        if self.granted < 1:
+            return self.throttle_failure()
+        return self.throttle_success()
+
+    def increment(self, key, delta=1):
+        """
+        Increments the counter of the current window and returns its new value.
+        """
+        if "incr" not in self.cache_operations:
+            count = (self.cache.get(key) or 0) + delta
+            self.cache.set(key, count, self.duration)
+            return count
+
+        count = self.incr(key, delta)
+        if count is None:
+            # first request of the window
+            if "add" not in self.cache_operations:
+                self.cache.set(key, delta, self.duration)
+                return delta
+            # another request added the counter first, unless it already
+            # expired or was evicted: then add it once more
+            for _ in range(2):
+                if self.cache.add(key, delta, self.duration):
+                    return delta
+                count = self.incr(key, delta)
+                if count is not None:
+                    return count
+            # the counter keeps vanishing, count this request alone
+            return delta
+        return count
+
+    def give_back(self, key, count):
+        """
+        Removes `count` requests counted but not admitted from the counter.
+        """
+        if "incr" in self.cache_operations:
+            self.incr(key, -count)
+            return
+        current = self.cache.get(key)
+        if current:
+            self.cache.set(key, max(current - count, 0), self.duration)
+
+    def incr(self, key, delta=1):
+        try:
+            return self.cache.incr(key, delta)
+        except ValueError:
+            # some backends raise instead of returning None for missing keys
+            return None
+
+    def throttle_success(self):
+        if self.granted > 1:
+            expires = min(self.now + self.lease_ttl, self.window + self.duration)
+            local_leases.grant((self.key, self.rate), self.granted - 1, expires, self.now, self.counter_key)
+        return True
+
+    def wait(self):
+        """
+        Returns the recommended next request time in seconds.
+        """
+        return self.window + self.duration - self.now
+
+class AnonFixedWindowThrottle(FixedWindowThrottle, AnonRateThrottle):
+    """
+    `AnonRateThrottle` backed by a fixed window counter.
+    """
+    pass
+
+class UserFixedWindowThrottle(FixedWindowThrottle, UserRateThrottle):
+    """
+    `UserRateThrottle` backed by a fixed window counter.
+    """
+    pass
@@ -0,0 +1,40 @@
+import time
+
+class Timings:
+    """
+    Durations of the phases of a request, measured with a monotonic clock,
+    in the order they ended. Entries are (name, seconds) pairs.
+    """
+    clock = time.perf_counter
+
+    def __init__(self) -> None:
+        self.entries = []
+
+    def record(self, name, start):
+        """
+        Records the phase `name` which began at `start`, a value of `clock()`.
+        """
+        self.entries.append((name, self.clock() - start))
+
+    def measure(self, name, func, *args, **kwargs):
+        """
+        Returns `func(*args, **kwargs)`, recording its duration even if it raises.
+        """
+        start = self.clock()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self.record(name, start)
+
+    def server_timing(self):
+        """
+        Returns the value of the `Server-Timing` header, durations in milliseconds.
+        """
+        return ", ".join("%s;dur=%.3f" % (name, duration * 1000) for name, duration in self.entries)
+
+def log_sink(view_class, timings):
+    """
+    Sink writing the timings of every request to the app's logger, at debug level.
+    """
+    from flask import current_app, request
+    current_app.logger.debug("%s %s %s: %s", request.method, request.path, view_class.__name__, timings.server_timing())
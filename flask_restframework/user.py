@@ -8,4 +8,55 @@ class BaseUser:
 
     @property
     def is_authenticated(self):
-        return True
\ No newline at end of file
+        return True
+
+class LazyUser:
+    """
+    Stands for the user of an authenticated request without building it.
+
+    `id` and `is_authenticated` are answered from the authentication payload,
+    which is all permissions and throttles need. The first access to any other
+    attribute builds `user_class(**auth_inf)` and forwards to it. With a
+    `cache` (e.g. `caches.LRUCache`) built users are reused by id, so they
+    must be safe to share between requests.
+    """
+    _own_attributes = ("_user_class", "_auth_inf", "_cache", "_ttl", "_user")
+
+    def __init__(self, user_class, auth_inf, cache=None, ttl=None) -> None:
+        self._user_class = user_class
+        self._auth_inf = auth_inf
+        self._cache = cache
+        self._ttl = ttl
+        self._user = None
+
+    @property
+    def id(self):
+        return self._auth_inf["id"]
+
+    @property
+    def is_authenticated(self):
+        return True
+
+    def _get_user(self):
+        if self._user is None:
+            user = self._cache.get(self.id) if self._cache is not None else None
+            if user is None:
+                user = self._user_class(**self._auth_inf)
+                if self._cache is not None:
+                    self._cache.set(self.id, user, expires=self._expires())
+            self._user = user
+        return self._user
+
+    def _expires(self):
+        if self._ttl is None:
+            return None
+        return self._cache.timer() + self._ttl
+
+    def __getattr__(self, name):
+        # only called for attributes not found on the proxy itself
+        if name.startswith("__") or name in self._own_attributes:
+            raise AttributeError(name)
+        return getattr(self._get_user(), name)
+
+    def __repr__(self):
+        return "<LazyUser %r>" % (self.id,)
@@ -1,60 +1,396 @@
-from flask import current_app, g
+from flask import current_app, g, request
 from flask import views, jsonify, make_response
+from werkzeug.exceptions import HTTPException
+import hashlib
+import time
+import warnings
 from . import exceptions
+from .authentication import get_authorization_header, index_authenticators
+from .parsers import get_parsers, read_body, select_parser
+from .renderers import get_renderer, negotiate_renderer, render_response
+from .response_cache import invalidate_responses
+from .timing import Timings
+
+# default of the view attributes falling back to the app config, None being a value of its own
+UNSET = object()
+
+class ViewPlan:
+    """
+    Security pipeline and content negotiation of a view class, compiled once per app.
+
+    Authenticators, permissions, renderers and parsers are instantiated once
+    and shared by all requests, so they must not keep per request state on themselves.
+    Throttles are instantiated once with their rate parsed and cache bound,
+    every request works on a shallow clone of them.
+    """
+    def __init__(self, view_class):
+        global_auth_config = getattr(current_app, "AUTHENTICATION_CLASSES", [])
+        global_perm_config = getattr(current_app, "PERMISSION_CLASSES", [])
+        global_thro_config = getattr(current_app, "THROTTLE_HANDLERS", [])
+        self.authenticators = [auth() for auth in view_class.authentication_classes or global_auth_config]
+        self.schemes, self.fallback_authenticators = index_authenticators(self.authenticators)
+        self.permissions = [permission() for permission in view_class.permission_classes or global_perm_config]
+        self.throttles = [
+            throttle.get("class")(throttle.get("rate"))
+            for throttle in view_class.throttle_handlers or global_thro_config
+        ]
+        self.renderers = [renderer() for renderer in view_class.renderer_classes] or \
+            getattr(current_app, "RENDERERS", None) or [get_renderer()]
+        self.parsers = [parser() for parser in view_class.parser_classes] or get_parsers()
+        self.max_body_size = view_class.max_body_size if view_class.max_body_size is not UNSET else \
+            current_app.config.get("FLASK_RESTFRAMEWORK_MAX_BODY_SIZE")
+        self.max_body_depth = view_class.max_body_depth if view_class.max_body_depth is not UNSET else \
+            current_app.config.get("FLASK_RESTFRAMEWORK_MAX_BODY_DEPTH")
+        self.metrics = getattr(current_app, "METRICS", None)
+        self.timing = getattr(current_app, "TIMING", False)
+        self.timing_header = getattr(current_app, "TIMING_HEADER", False)
+        self.timing_sink = getattr(current_app, "TIMING_SINK", None)
+        self.use_etag = view_class.use_etag if view_class.use_etag is not None else \
+            current_app.config.get("FLASK_RESTFRAMEWORK_ETAG", False)
 
 class APIView(views.MethodView):
 
     authentication_classes = []
     permission_classes = []
     throttle_handlers = []
+    renderer_classes = []
+    parser_classes = []
+    # a response_cache.ResponseCache to cache the responses of GET requests
+    response_cache = None
+    # plan of the current request, see get_plan
+    plan = None
+    # timings of the request phases, set by dispatch_request when FLASK_RESTFRAMEWORK_TIMING is on
+    timings = None
+    # ETags and conditional GET, FLASK_RESTFRAMEWORK_ETAG by default
+    use_etag = None
+    # limits of the request body, FLASK_RESTFRAMEWORK_MAX_BODY_SIZE and _DEPTH by default, None for no limit
+    max_body_size = UNSET
+    max_body_depth = UNSET
 
     def dispatch_request(self, *args, **kwargs):
+        # looked up once per request, every phase needs it
+        self.plan = None
+        plan = self.plan = self.get_plan()
+        if not plan.timing and plan.metrics is None:
+            return self.dispatch(*args, **kwargs)
+        return self.dispatch_instrumented(plan, *args, **kwargs)
+
+    def dispatch_instrumented(self, plan, *args, **kwargs):
+        """
+        Dispatches the request recording its timings and metrics.
+        """
+        start = time.perf_counter()
+        try:
+            if plan.timing:
+                timings = self.timings = Timings()
+                response = self.finalize_timings(plan, timings.measure("total", self.dispatch, *args, **kwargs))
+            else:
+                response = make_response(self.dispatch(*args, **kwargs))
+        except Exception as e:
+            if plan.metrics is not None:
+                # HTTP errors raised by the handler, like abort(404), become their response
+                self.record_request(plan.metrics, (e.code or 500) if isinstance(e, HTTPException) else 500, start)
+            raise
+        if plan.metrics is not None:
+            self.record_request(plan.metrics, response.status_code, start)
+        return response
+
+    def record_request(self, metrics, status, start):
+        view = self.__class__.__name__
+        metrics.requests.inc((view, request.method, status))
+        metrics.request_duration.observe((view,), time.perf_counter() - start)
+
+    def dispatch(self, *args, **kwargs):
+        self.version_etag = None
+        try:
+            request.accepted_renderer = self.perform_content_negotiation()
+        except exceptions.NotAcceptable as exc:
+            # only answered when the handler returns data to render, it may return text or its own response
+            request.accepted_renderer = self.get_plan().renderers[0]
+            request.not_acceptable = exc
+        except Exception as exc:
+            return self.handle_exception(exc)
+        response_cache = self.get_response_cache()
+        if response_cache is not None and response_cache.public:
+            rv = response_cache.fetch(self.__class__, lambda: self.respond(*args, **kwargs))
+            return self.finalize_conditional(rv)
+        try:
+            self.initial()
+            not_modified = self.check_version(*args, **kwargs)
+        except Exception as exc:
+            return self.handle_exception(exc)
+        if not_modified is not None:
+            return not_modified
+        if response_cache is not None:
+            rv = response_cache.fetch(self.__class__, lambda: self.handle(*args, **kwargs))
+        else:
+            rv = self.handle(*args, **kwargs)
+        return self.finalize_conditional(rv)
+
+    def respond(self, *args, **kwargs):
+        """
+        Runs the security pipeline then the handler of the request.
+        """
         try:
             self.initial()
         except Exception as exc:
             return self.handle_exception(exc)
-        return super().dispatch_request(*args, **kwargs)
+        return self.handle(*args, **kwargs)
+
+    def handle(self, *args, **kwargs):
+        timings = self.timings
+        start = timings and timings.clock()
+        try:
+            rv = super().dispatch_request(*args, **kwargs)
+        except exceptions.APIException as exc:
+            # such as a ParseError of the body, other errors are left to Flask
+            return self.handle_exception(exc)
+        finally:
+            if timings:
+                timings.record("handler", start)
+        if timings:
+            return timings.measure("render", self.finalize_response, rv)
+        return self.finalize_response(rv)
+
+    def finalize_timings(self, plan, rv):
+        """
+        Adds the timings of the request to its response as a `Server-Timing`
+        header, and hands them to the sink.
+        """
+        response = make_response(rv)
+        if plan.timing_header:
+            response.headers.add("Server-Timing", self.timings.server_timing())
+        if plan.timing_sink is not None:
+            try:
+                plan.timing_sink(self.__class__, self.timings)
+            except Exception as e:
+                warnings.warn(f"timing sink failed: {e}")
+        return response
+
+    def get_response_cache(self):
+        """
+        Returns the response cache of the request, `None` if it is not cached.
+        """
+        if self.response_cache is None or request.method not in ("GET", "HEAD"):
+            return None
+        if getattr(request, "not_acceptable", None) is not None:
+            # its entries are of a media type the client does not accept
+            return None
+        return self.response_cache
+
+    def get_version_key(self, *args, **kwargs):
+        """
+        Returns a value which changes whenever the response to the request
+        would, such as the last update time of the rows it shows, or `None`.
+        When it is cheaper than the response, override it: the ETag is then
+        computed from it and the handler is not even called when the client
+        already has the response.
+        """
+        return None
+
+    def check_version(self, *args, **kwargs):
+        """
+        Returns a 304 response if the client's `If-None-Match` matches the
+        ETag of the version key of the view, `None` otherwise.
+        """
+        if not self.get_plan().use_etag or request.method not in ("GET", "HEAD"):
+            return None
+        version = self.get_version_key(*args, **kwargs)
+        if version is None:
+            return None
+        # the same version is rendered differently in every format
+        tag = "%s\n%s" % (version, get_renderer().media_type)
+        self.version_etag = hashlib.sha1(tag.encode("utf-8")).hexdigest()
+        if not request.if_none_match.contains_weak(self.version_etag):
+            return None
+        response = current_app.response_class(status=304)
+        response.set_etag(self.version_etag, weak=True)
+        if len(self.get_plan().renderers) > 1:
+            response.vary.add("Accept")
+        return response
+
+    def finalize_conditional(self, rv):
+        """
+        Sets the ETag of a successful GET response, the version key's or a
+        hash of its body, and turns it into a 304 if the client has it already.
+        """
+        if not self.get_plan().use_etag or request.method not in ("GET", "HEAD"):
+            return rv
+        response = make_response(rv)
+        if response.status_code != 200:
+            return response
+        if self.version_etag is not None:
+            response.set_etag(self.version_etag, weak=True)
+        elif not response.is_streamed and "ETag" not in response.headers:
+            response.add_etag()
+        if response.is_streamed:
+            return response
+        return response.make_conditional(request)
+
+    @classmethod
+    def invalidate_response_cache(cls):
+        """
+        Invalidates all the cached responses of this view (of its group).
+        """
+        invalidate_responses(cls.response_cache.get_group(cls))
+
+    def finalize_response(self, rv):
+        """
+        Renders dict and list return values with the negotiated renderer, any
+        other return value is left to Flask. Data the client accepts no
+        renderer of is answered with a `406`.
+        """
+        data = rv[0] if isinstance(rv, tuple) and rv else rv
+        if not isinstance(data, (dict, list)):
+            return rv
+        not_acceptable = getattr(request, "not_acceptable", None)
+        if not_acceptable is not None:
+            return self.handle_exception(not_acceptable)
+        headers = {"Vary": "Accept"} if len(self.get_plan().renderers) > 1 else None
+        if rv is data:
+            return render_response(rv, headers=headers)
+        return (render_response(data, headers=headers),) + rv[1:]
+
+    def perform_content_negotiation(self):
+        """
+        Returns the renderer of the response, chosen by the `Accept` header.
+        """
+        return negotiate_renderer(self.get_plan().renderers)
+
+    @property
+    def data(self):
+        """
+        Returns the request body parsed by the parser of its `Content-Type`,
+        `None` if it is empty. It is parsed on first access, once per request.
+        """
+        if not hasattr(request, "parsed_data"):
+            try:
+                request.parsed_data = self.parse_body()
+            except exceptions.APIException as exc:
+                request.parsed_data = exc
+        if isinstance(request.parsed_data, exceptions.APIException):
+            raise request.parsed_data
+        return request.parsed_data
+
+    def get_parser(self):
+        """
+        Returns the parser of the request body, `None` if there is no body.
+        """
+        if request.content_length == 0 or (request.content_length is None and not request.content_type):
+            return None
+        return select_parser(self.get_plan().parsers, request.mimetype)
+
+    def parse_body(self):
+        parser = self.get_parser()
+        if parser is None:
+            return None
+        plan = self.get_plan()
+        # refused before reading when its length is announced, else as soon as it is over
+        if plan.max_body_size is not None and (request.content_length or 0) > plan.max_body_size:
+            raise exceptions.PayloadTooLarge()
+        body = read_body(request.stream, plan.max_body_size)
+        if not body:
+            return None
+        return parser.parse(body, max_depth=plan.max_body_depth)
+
+    def iter_data(self):
+        """
+        Yields the items of a JSON array body one by one as they are read, for
+        bodies too large to be held in memory: `max_body_size` limits the
+        size of each item rather than of the whole body.
+        """
+        if hasattr(request, "parsed_data"):
+            raise Exception("the request body was already read")
+        request.parsed_data = exceptions.ParseError("The request body was read by iter_data().")
+        parser = self.get_parser()
+        if parser is None:
+            return iter(())
+        if not hasattr(parser, "iter_items"):
+            raise exceptions.UnsupportedMediaType(request.mimetype)
+        plan = self.get_plan()
+        return parser.iter_items(request.stream, max_item_size=plan.max_body_size, max_depth=plan.max_body_depth)
 
     def initial(self):
+        timings = self.timings
+        if timings:
+            timings.measure("authentication", self.perform_authentication)
+            timings.measure("permissions", self.check_permissions)
+            timings.measure("throttles", self.check_throttles)
+            return
         self.perform_authentication()
         self.check_permissions()
         self.check_throttles()
 
+    def get_plan(self):
+        """
+        Returns the compiled security pipeline of this view class for the current app.
+        """
+        if self.plan is not None:
+            return self.plan
+        plans = getattr(current_app, "VIEW_PLANS", None)
+        if plans is None:
+            return ViewPlan(self.__class__)
+        plan = plans.get(self.__class__)
+        if plan is None:
+            plan = plans[self.__class__] = ViewPlan(self.__class__)
+        return plan
+
     def get_authenticators(self):
         """
-        Instantiates and returns the list of authenticators that this view can use.
+        Returns the list of authenticators that this view can use.
         """
-        global_auth_config = getattr(current_app,"AUTHENTICATION_CLASSES",[])
-        self.authenticators = [auth() for auth in self.authentication_classes or global_auth_config]
+        self.authenticators = self.get_plan().authenticators
         return self.authenticators
 
     def get_permissions(self):
         """
-        Instantiates and returns the list of permissions that this view requires.
+        Returns the list of permissions that this view requires.
         """
-        global_perm_config = getattr(current_app,"PERMISSION_CLASSES",[])
-        return [permission() for permission in self.permission_classes or global_perm_config]
+        return self.get_plan().permissions
     
     def get_throttles(self):
         """
-        Instantiates and returns the list of throttles that this view uses.
+        Returns the list of throttles that this view uses.
         """
-        global_thro_config = getattr(current_app, "THROTTLE_HANDLERS", [])
-        throttling_handlers = []
-        for throttle in self.throttle_handlers or global_thro_config:
-            throttle_class = throttle.get("class")
-            throttle_rate = throttle.get("rate")
-            throttling_handlers.append(throttle_class(throttle_rate))
-        return throttling_handlers
+        return [throttle.clone() for throttle in self.get_plan().throttles]
+
+    def select_authenticators(self):
+        """
+        Returns (authenticator, parsed header) pairs to try for this request.
+        The header is parsed once and only handed to the authenticators of its
+        scheme, those without a scheme get `None` and are tried afterwards.
+        """
+        authenticators = self.get_authenticators()
+        plan = self.get_plan()
+        if authenticators is not plan.authenticators:
+            schemes, fallback = index_authenticators(authenticators)
+        else:
+            schemes, fallback = plan.schemes, plan.fallback_authenticators
+        auth = get_authorization_header(request).split() if schemes else None
+        selected = []
+        if auth:
+            selected = [(authenticator, auth) for authenticator in schemes.get(auth[0].lower(), ())]
+        return selected + [(authenticator, None) for authenticator in fallback]
 
     def perform_authentication(self):
         self.successful_authenticated = False
-        for authenticator in self.get_authenticators():
+        timings = self.timings
+        for authenticator, auth in self.select_authenticators():
+            start = timings and timings.clock()
             try:
-                user_auth_tuple = authenticator.authenticate()
+                if auth is None:
+                    user_auth_tuple = authenticator.authenticate()
+                else:
+                    user_auth_tuple = authenticator.authenticate_credentials(auth)
             except exceptions.APIException as exc:
                 exc.auth_header = authenticator.authenticate_header()
+                metrics = self.get_plan().metrics
+                if metrics is not None:
+                    metrics.authentication_failures.inc((authenticator.__class__.__name__,))
                 raise exc
+            finally:
+                if timings:
+                    timings.record("auth." + authenticator.__class__.__name__, start)
         
             if user_auth_tuple is not None:
                 self.successful_authenticated = True
@@ -68,8 +404,13 @@ class APIView(views.MethodView):
         Check if the request should be permitted.
         Raises an appropriate exception if the request is not permitted.
         """
+        timings = self.timings
         for permission in self.get_permissions():
-            if not permission.has_permission():
+            if timings:
+                allowed = timings.measure("perm." + permission.__class__.__name__, permission.has_permission)
+            else:
+                allowed = permission.has_permission()
+            if not allowed:
                 self.permission_denied(
                     message=getattr(permission, 'message', None),
                     code=getattr(permission, 'code', None)
@@ -91,8 +432,17 @@ class APIView(views.MethodView):
         Raises an appropriate exception if the request is throttled.
         """
         throttle_durations = []
+        timings = self.timings
+        metrics = self.get_plan().metrics
         for throttle in self.get_throttles():
-            if not throttle.allow_request():
+            if timings:
+                allowed = timings.measure("throttle." + throttle.__class__.__name__, throttle.allow_request)
+            else:
+                allowed = throttle.allow_request()
+            if metrics is not None:
+                scope = getattr(throttle, "scope", None) or throttle.__class__.__name__
+                metrics.throttle_decisions.inc((scope, "allow" if allowed else "deny"))
+            if not allowed:
                 throttle_durations.append(throttle.wait())
         if throttle_durations:
             duration = max(throttle_durations, default=None)
@@ -112,4 +462,9 @@ class APIView(views.MethodView):
         or re-raising the error.
         """
         exception_handler = getattr(current_app, "EXCEPTION_HANDLER", exceptions.exception_handler)
-        return exception_handler(exc)
\ No newline at end of file
+        response = exception_handler(exc)
+        if len(self.get_plan().renderers) > 1:
+            # rendered in the negotiated format too
+            response = make_response(response)
+            response.vary.add("Accept")
+        return response
\ No newline at end of file